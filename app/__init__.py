@@ -1,7 +1,23 @@
-from app.event_handlers import event_handlers
-from app.http_handlers import blueprints
+import typing as t
+
+if t.TYPE_CHECKING:
+    from app.event_handlers import event_handlers  # pragma: nocover
+    from app.http_handlers import blueprints  # pragma: nocover
 
 __all__ = (
     "event_handlers",
     "blueprints",
 )
+
+
+def __getattr__(name: str) -> t.Any:
+    """Import handlers on first use, so the receiver doesn't load the worker's dependencies and vice versa."""
+    if name == "event_handlers":
+        from app.event_handlers import event_handlers
+
+        return event_handlers
+    if name == "blueprints":
+        from app.http_handlers import blueprints
+
+        return blueprints
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -6,7 +6,20 @@ if t.TYPE_CHECKING:
     from google.cloud.functions_v1.context import Context  # pragma: nocover
 
 
-class BaseHandler(ABC):
+class HandlerAttributes:
+    """Place of a handler in the pipeline, see app/pipeline.py."""
+
+    # Name other handlers list in `depends_on`, the class name if None. Sync and async variants of a handler share it.
+    handler_name: str | None = None
+    # Names of handlers that must succeed before this one runs.
+    depends_on: tuple[str, ...] = ()
+    # Run concurrently with other handlers, errors and timeouts don't fail the event.
+    independent: bool = False
+    # Seconds an independent handler may run, `AM2N_HANDLER_TIMEOUT` if None.
+    timeout: float | None = None
+
+
+class BaseHandler(HandlerAttributes, ABC):
     """Base handler."""
 
     @abstractmethod
@@ -18,3 +31,17 @@ class BaseHandler(ABC):
     def __call__(self) -> None:
         """Execute handler."""
         raise NotImplementedError()  # pragma: nocover
+
+
+class AsyncBaseHandler(HandlerAttributes, ABC):
+    """Base handler with async execution, `main.handle_event` runs it in the instance's event loop."""
+
+    @abstractmethod
+    def __init__(self, event: dict[str, t.Any], context: "Context") -> None:
+        """Init handler."""
+        raise NotImplementedError()  # pragma: nocover
+
+    @abstractmethod
+    async def __call__(self) -> None:
+        """Execute handler."""
+        raise NotImplementedError()  # pragma: nocover
@@ -0,0 +1,32 @@
+"""HTTP receiver function, loads Flask and Pub/Sub publisher only."""
+
+import logging
+
+from flask import Flask, Request, Response
+
+from app import lifecycle
+from app.http_handlers import blueprints
+from app.logs import logging_client
+
+logger = logging.getLogger("main")
+
+
+def create_http_app() -> Flask:
+    """Create Flask app with all blueprints registered."""
+    flask_app = Flask("main")
+    for blueprint in blueprints:
+        flask_app.register_blueprint(blueprint)
+
+    return flask_app
+
+
+http_app = lifecycle.Lazy(create_http_app)
+
+
+def handle_http_request(request: Request) -> Response:
+    """Handle HTTP-requests."""
+    logging_client.get()
+    flask_app = http_app.get()
+    with flask_app.request_context(request.environ):
+        logger.debug("Before request, req.environ=%s", request.environ)
+        return flask_app.full_dispatch_request()
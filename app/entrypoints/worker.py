@@ -0,0 +1,28 @@
+"""Pub/Sub worker function, loads Notion handlers only."""
+
+import typing as t
+
+import logging
+
+from python_settings import settings
+
+from app import metrics, profiling
+from app.event_handlers import event_handlers
+from app.logs import logging_client
+from app.pipeline import Pipeline
+
+if t.TYPE_CHECKING:
+    from google.cloud.functions_v1.context import Context  # pragma: nocover
+
+logger = logging.getLogger("main")
+
+
+def handle_event(event: dict[str, t.Any], context: "Context") -> None:
+    """Handle event from pubsub."""
+    logging_client.get()
+    logger.info("Handle event started")
+
+    with metrics.trace() as trace, profiling.profiled("handle_event"):
+        outcomes = Pipeline(event_handlers, settings.AM2N_HANDLER_TIMEOUT).run(event, context)
+
+    logger.info("Handle event finished", extra={"json_fields": {"handlers": outcomes, **trace.fields()}})
@@ -1,5 +1,27 @@
-from .notion import NotionHandler
+import typing as t
 
-__all__ = ("NotionHandler",)
+import importlib
 
-event_handlers = (NotionHandler,)
+from python_settings import settings
+
+from .notion import AsyncNotionHandler, NotionHandler
+
+__all__ = ("AsyncNotionHandler", "NotionHandler", "load_handler")
+
+# Handlers by name of `AM2N_EVENT_HANDLERS`.
+HANDLERS: dict[str, t.Any] = {
+    "notion": AsyncNotionHandler if settings.AM2N_NOTION_ASYNC else NotionHandler,
+}
+
+
+def load_handler(name: str) -> t.Any:
+    """Return handler class by name of `HANDLERS` or by import path, e.g. `package.module:Class`."""
+    if name in HANDLERS:
+        return HANDLERS[name]
+    module, _, attr = name.partition(":")
+    if not attr:
+        raise ValueError(f"Unknown event handler {name!r}, use one of {sorted(HANDLERS)} or `package.module:Class`")
+    return getattr(importlib.import_module(module), attr)
+
+
+event_handlers = tuple(load_handler(name) for name in settings.AM2N_EVENT_HANDLERS)
@@ -1,20 +1,275 @@
 import typing as t
 
 import base64
-import json
+import functools
+import importlib.util
+import io
+import logging
+import threading
 
+import httpx
+from notion_client import Client
 from python_settings import settings
 
-from app.base import BaseHandler
-from app.services.notion import NotionService
+from app import exceptions, lifecycle, metrics, wire
+from app.base import AsyncBaseHandler, BaseHandler
+from app.services.fingerprint_index import FingerprintIndex
+from app.services.journal import Journal
+from app.services.leases import FingerprintLeases
+from app.services.notion import (
+    EventReport,
+    NotionService,
+    get_page_fingerprint,
+    query_pages,
+)
+from app.services.notion_async import AsyncNotionService
+from app.services.open_incidents import OpenIncidents
+from app.services.rate_limit import (
+    AsyncRateLimitedTransport,
+    RateLimitedTransport,
+    TokenBucket,
+)
+from app.services.shift_cache import ShiftCache
+from app.stores import MemoryStore, create_store
+from app.streaming import StreamingEventParser
 
 if t.TYPE_CHECKING:
     from google.cloud.functions_v1.context import Context  # pragma: nocover
 
+logger = logging.getLogger("notion-handler")
+
+
+def create_fingerprint_index(enabled: bool, kind: str, metrics_prefix: str) -> FingerprintIndex | None:
+    """Create fingerprint index shared by all events handled by the instance."""
+    if not enabled:
+        return None
+    return FingerprintIndex(
+        namespace=settings.AM2N_INCIDENTS_DB_ID,
+        ttl=settings.AM2N_FINGERPRINT_INDEX_TTL,
+        max_size=settings.AM2N_FINGERPRINT_INDEX_MAX_SIZE,
+        shared=shared_store.get(),
+        kind=kind,
+        metrics_prefix=metrics_prefix,
+    )
+
+
+shared_store = lifecycle.Lazy(
+    lambda: create_store(settings.AM2N_FINGERPRINT_INDEX_BACKEND, settings.AM2N_FINGERPRINT_INDEX_URL),
+)
+fingerprint_index = lifecycle.Lazy(
+    lambda: create_fingerprint_index(settings.AM2N_FINGERPRINT_INDEX_ENABLED, "page", "fingerprint_index"),
+)
+status_tracker = lifecycle.Lazy(
+    lambda: create_fingerprint_index(settings.AM2N_SKIP_NOOP_UPDATES_ENABLED, "status", "status_tracker"),
+)
+
+
+def notion_transport_options() -> dict[str, t.Any]:
+    """Connection pool options for Notion API with keep-alive, HTTP/2 is used if `h2` package is installed."""
+    return {
+        "http2": settings.AM2N_NOTION_HTTP2 and importlib.util.find_spec("h2") is not None,
+        "limits": httpx.Limits(
+            max_connections=settings.AM2N_NOTION_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.AM2N_NOTION_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.AM2N_NOTION_POOL_KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
+# Notion limits requests per integration, so all clients of a token share one bucket.
+rate_limiters: lifecycle.Lazy[dict[str, TokenBucket]] = lifecycle.Lazy(dict)
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(token: str) -> TokenBucket:
+    """Return rate limiter of the Notion token, shared by sync and async clients of the instance."""
+    limiters = rate_limiters.get()
+    with _rate_limiters_lock:
+        if (limiter := limiters.get(token)) is None:
+            limiter = limiters[token] = TokenBucket(
+                rate=settings.AM2N_NOTION_RATE_LIMIT,
+                capacity=settings.AM2N_NOTION_RATE_LIMIT_BURST,
+            )
+    return limiter
+
+
+def rate_limit_options(limiter: TokenBucket) -> dict[str, t.Any]:
+    """Rate limiting and retry options for Notion API."""
+    return {
+        "limiter": limiter,
+        "max_retries": settings.AM2N_NOTION_MAX_RETRIES,
+        "deadline": settings.AM2N_NOTION_CALL_DEADLINE,
+    }
+
+
+def create_notion_transport(**kwargs: t.Any) -> httpx.HTTPTransport:
+    """Create connection pool for Notion API."""
+    return httpx.HTTPTransport(**notion_transport_options(), **kwargs)
+
+
+def create_notion_http_client(token: str) -> httpx.Client:
+    """Create HTTP client for Notion API with rate limiting of the token and retries."""
+    transport = create_notion_transport()
+    options = rate_limit_options(get_rate_limiter(token))
+    return httpx.Client(transport=RateLimitedTransport(transport=transport, **options))
+
+
+def create_async_notion_http_client(token: str) -> httpx.AsyncClient:
+    """Create async HTTP client for Notion API with rate limiting of the token and retries."""
+    transport = httpx.AsyncHTTPTransport(**notion_transport_options())
+    options = rate_limit_options(get_rate_limiter(token))
+    return httpx.AsyncClient(transport=AsyncRateLimitedTransport(transport=transport, **options))
+
+
+def close_notion_services(services: dict[tuple[t.Any, ...], NotionService | AsyncNotionService]) -> None:
+    """Close connection pools of all services, called on instance shutdown."""
+    for service in services.values():
+        if isinstance(service, AsyncNotionService):
+            lifecycle.run_async(service.client.aclose())
+        else:
+            service.client.close()
+
+
+shift_cache = lifecycle.Lazy(lambda: ShiftCache(ttl=settings.AM2N_SHIFT_CACHE_TTL))
+
+
+def create_journal() -> Journal | None:
+    """Create journal of Notion operations shared by all events handled by the instance."""
+    if not settings.AM2N_JOURNAL_ENABLED:
+        return None
+    if not settings.AM2N_JOURNAL_PATH:
+        raise ValueError("Set AM2N_JOURNAL_PATH to a durable directory shared by instances to enable the journal")
+    return Journal(
+        settings.AM2N_JOURNAL_PATH,
+        retention=settings.AM2N_JOURNAL_RETENTION,
+        skip_ttl=settings.AM2N_JOURNAL_SKIP_TTL,
+        max_segment_bytes=settings.AM2N_JOURNAL_SEGMENT_BYTES,
+    )
+
+
+def close_journal(value: Journal | None) -> None:
+    """Close segment file of the journal, called on instance shutdown."""
+    if value is not None:
+        value.close()
+
+
+journal = lifecycle.Lazy(create_journal, close=close_journal)
+
+
+def create_leases() -> FingerprintLeases | None:
+    """Create fingerprint leases, the in-process store only guards threads of the instance."""
+    if not settings.AM2N_LEASES_ENABLED:
+        return None
+    return FingerprintLeases(
+        create_store(settings.AM2N_LEASE_BACKEND, settings.AM2N_LEASE_URL) or MemoryStore(),
+        namespace=settings.AM2N_INCIDENTS_DB_ID,
+        ttl=settings.AM2N_LEASE_TTL,
+        wait=settings.AM2N_LEASE_WAIT,
+        page_ttl=settings.AM2N_FINGERPRINT_INDEX_TTL,
+    )
+
+
+leases = lifecycle.Lazy(create_leases)
+
+
+def create_open_incidents_http_client() -> httpx.Client:
+    """Create HTTP client of the refresh thread, its own rate limit keeps scans from delaying events of the token."""
+    limiter = TokenBucket(rate=settings.AM2N_OPEN_INCIDENTS_RATE_LIMIT, capacity=1)
+    options = rate_limit_options(limiter)
+    return httpx.Client(transport=RateLimitedTransport(transport=create_notion_transport(), **options))
+
+
+def create_open_incidents(token: str, incidents_db_id: str) -> OpenIncidents | None:
+    """Start preloading open incidents of the database, the refresh thread has its own rate limited client."""
+    if not settings.AM2N_OPEN_INCIDENTS_PRELOAD_ENABLED:
+        return None
+    client = Client(auth=token, client=create_open_incidents_http_client())
+    return OpenIncidents(
+        functools.partial(query_pages, client, incidents_db_id),
+        get_page_fingerprint,
+        max_size=settings.AM2N_OPEN_INCIDENTS_MAX_SIZE,
+        refresh_interval=settings.AM2N_OPEN_INCIDENTS_REFRESH_INTERVAL,
+        close=client.close,
+    ).start()
+
+
+def close_open_incidents(maps: dict[tuple[str, str], OpenIncidents | None]) -> None:
+    """Stop refreshing open incidents, called on instance shutdown."""
+    for value in maps.values():
+        if value is not None:
+            value.stop()
+
+
+# Open incidents per token and incidents database, shared by sync and async services.
+open_incidents: lifecycle.Lazy[dict[tuple[str, str], OpenIncidents | None]] = lifecycle.Lazy(
+    dict,
+    close=close_open_incidents,
+)
+# Notion services per class, token, databases and concurrency, so warm invocations reuse their open connections.
+notion_services: lifecycle.Lazy[dict[tuple[t.Any, ...], NotionService | AsyncNotionService]] = lifecycle.Lazy(
+    dict,
+    close=close_notion_services,
+)
+_notion_services_lock = threading.Lock()
+S = t.TypeVar("S", NotionService, AsyncNotionService)
+
+
+def get_service(service_class: type[S], create_http_client: t.Callable[[str], t.Any], **params: t.Any) -> S:
+    """Return service kept for the life of the instance, creating it on first use."""
+    key = (service_class, *sorted(params.items()))
+    services = notion_services.get()
+    with _notion_services_lock:
+        if (service := services.get(key)) is None:
+            database = (params["token"], params["incidents_db_id"])
+            if database not in (maps := open_incidents.get()):
+                maps[database] = create_open_incidents(*database)
+            service = services[key] = service_class(
+                **params,
+                index=fingerprint_index.get(),
+                shift_cache=shift_cache.get(),
+                status_tracker=status_tracker.get(),
+                journal=journal.get(),
+                leases=leases.get(),
+                open_incidents=maps[database],
+                http_client=create_http_client(params["token"]),
+            )
+    return t.cast(S, service)
+
+
+def get_notion_service(**params: t.Any) -> NotionService:
+    """Return NotionService for token, databases and concurrency, kept for the life of the instance."""
+    return get_service(NotionService, create_notion_http_client, **params)
+
+
+def get_async_notion_service(**params: t.Any) -> AsyncNotionService:
+    """Return AsyncNotionService for token, databases and concurrency, kept for the life of the instance."""
+    return get_service(AsyncNotionService, create_async_notion_http_client, **params)
+
+
+def raise_for_failed(report: EventReport | None) -> None:
+    """
+    Raise `AlertsFailed` if alerts failed with retryable errors, so Pub/Sub redelivers the event to retry them.
+
+    Failures a retry can't fix (an invalid event or alert, Notion `4xx` errors) are logged and the event is acked,
+    `report` is None for an invalid event.
+    """
+    if report is None:
+        metrics.incr("notion_events_dropped")
+        logger.warning("Dropped invalid Alertmanager event")
+        return
+    if retryable := report.retryable:
+        raise exceptions.AlertsFailed(f"{len(retryable)} of {len(report.results)} alerts failed and will be retried")
+    if report.failed:
+        metrics.incr("notion_alerts_dropped", len(report.failed))
+        logger.warning("Dropped %s alerts that can't succeed on retry", len(report.failed))
+
 
 class NotionHandler(BaseHandler):
     """Handler for processing Alertmanager webhooks and syncing with Notion."""
 
+    # Shared with `AsyncNotionHandler`, so dependents don't change with `AM2N_NOTION_ASYNC`.
+    handler_name = "notion"
+
     def __init__(self, event: dict[str, t.Any], context: "Context") -> None:
         """Init handler, set params."""
         self.event = event
@@ -23,18 +278,50 @@ class NotionHandler(BaseHandler):
         self.shifts_db_id = settings.AM2N_SHIFTS_DB_ID
         self.shifts_enabled = settings.AM2N_SHIFTS_SUPPORT_ENABLED
         self.notion_version = "2022-06-28"
+        self.max_concurrency = settings.AM2N_NOTION_MAX_CONCURRENCY
 
-    def __call__(self) -> None:
-        """Execute handler."""
-        # Decode base64 and parse JSON
+    def decode_event(self) -> dict[str, t.Any]:
+        """Decode base64 and parse the event in wire format of the message."""
         raw_data = self.event["data"]
-        decoded_data = base64.b64decode(raw_data).decode("utf-8")
-        data_dict = json.loads(decoded_data)
-        notion = NotionService(
-            token=self.notion_token,
-            incidents_db_id=self.incidents_db_id,
-            shifts_db_id=self.shifts_db_id,
-            shifts_enabled=self.shifts_enabled,
-            notion_version=self.notion_version,
-        )
-        notion.handle_alert(data_dict)
+        with metrics.stage("decode"):
+            return wire.decode(base64.b64decode(raw_data), self.event.get("attributes"))
+
+    def stream_alerts(self) -> t.Iterator[t.Any] | None:
+        """Alerts of a large event parsed one at a time, None if the event is small or streaming is disabled."""
+        if not settings.AM2N_STREAMING_ENABLED:
+            return None
+        data = base64.b64decode(self.event["data"])
+        if len(data) < settings.AM2N_STREAMING_MIN_BYTES:
+            return None
+        return StreamingEventParser(io.BytesIO(data)).alerts()
+
+    def service_params(self) -> dict[str, t.Any]:
+        """Parameters of Notion service."""
+        return {
+            "token": self.notion_token,
+            "incidents_db_id": self.incidents_db_id,
+            "shifts_db_id": self.shifts_db_id,
+            "shifts_enabled": self.shifts_enabled,
+            "notion_version": self.notion_version,
+            "max_concurrency": self.max_concurrency,
+        }
+
+    def __call__(self) -> None:
+        """Execute handler, raises `AlertsFailed` if alerts failed."""
+        notion = get_notion_service(**self.service_params())
+        if (alerts := self.stream_alerts()) is not None:
+            raise_for_failed(notion.handle_alert_stream(alerts))
+            return
+        raise_for_failed(notion.handle_alert(self.decode_event()))
+
+
+class AsyncNotionHandler(NotionHandler, AsyncBaseHandler):
+    """Handler for processing Alertmanager webhooks with `AsyncNotionService`."""
+
+    async def __call__(self) -> None:  # type: ignore[override]
+        """Execute handler, raises `AlertsFailed` if alerts failed."""
+        notion = get_async_notion_service(**self.service_params())
+        if (alerts := self.stream_alerts()) is not None:
+            raise_for_failed(await notion.handle_alert_stream(alerts))
+            return
+        raise_for_failed(await notion.handle_alert(self.decode_event()))
@@ -2,3 +2,9 @@ class StopHandlingEvent(Exception):
     """Stop handling event."""
 
     pass
+
+
+class AlertsFailed(Exception):
+    """Alerts of the event failed to process, the event is redelivered to retry them."""
+
+    pass
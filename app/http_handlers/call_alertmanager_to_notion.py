@@ -1,14 +1,148 @@
-import json
+import typing as t
+
+import functools
 import logging
+from concurrent import futures
 
 import flask
 from google.cloud import pubsub_v1  # type: ignore
 from python_settings import settings
 
+from app import lifecycle, metrics, streaming, wire
+from app.http_handlers import edge
+from app.services.dedup import NotificationDeduplicator
+from app.services.fingerprint_index import FingerprintIndex
+from app.stores import create_store
+
 logger = logging.getLogger("http_am2n")
 http_am2n_bp = flask.Blueprint("http_am2n", __name__)
 
 
+# Group-level fields copied to every per-alert event in fan-out mode, with values used when a field is missing.
+# `commonAnnotations` are never copied, they can be large and the worker doesn't use them.
+FANOUT_GROUP_FIELDS: dict[str, t.Any] = {
+    "receiver": "",
+    "groupLabels": {},
+    "commonLabels": {},
+    "externalURL": "",
+    "version": "4",
+    "groupKey": "",
+}
+
+
+class InvalidJSON(ValueError):
+    """Request body is not JSON."""
+
+
+def create_publisher() -> pubsub_v1.PublisherClient:
+    """Create Pub/Sub publisher client, it's shared by all requests served by the instance."""
+    return pubsub_v1.PublisherClient(
+        batch_settings=pubsub_v1.types.BatchSettings(
+            max_messages=settings.AM2N_PUBLISH_BATCH_MAX_MESSAGES,
+            max_bytes=settings.AM2N_PUBLISH_BATCH_MAX_BYTES,
+            max_latency=settings.AM2N_PUBLISH_BATCH_MAX_LATENCY,
+        ),
+        publisher_options=pubsub_v1.types.PublisherOptions(
+            enable_message_ordering=settings.AM2N_PUBLISH_FANOUT,
+        ),
+    )
+
+
+def stop_publisher(client: pubsub_v1.PublisherClient) -> None:
+    """Publish all batched messages and stop the publisher, called on instance shutdown."""
+    logger.info("Flushing Pub/Sub publisher")
+    client.stop()
+
+
+publisher = lifecycle.Lazy(create_publisher, close=stop_publisher)
+
+
+def create_deduplicator() -> NotificationDeduplicator | None:
+    """Create deduplicator of repeat notifications shared by all requests served by the instance."""
+    if not settings.AM2N_DEDUP_ENABLED:
+        return None
+    seen = FingerprintIndex(
+        namespace=settings.EVENTS_PUBSUB_TOPIC,
+        ttl=settings.AM2N_DEDUP_TTL,
+        max_size=settings.AM2N_DEDUP_MAX_SIZE,
+        shared=create_store(settings.AM2N_DEDUP_BACKEND, settings.AM2N_DEDUP_URL),
+        kind="notification",
+        metrics_prefix="receiver_dedup",
+    )
+    return NotificationDeduplicator(seen)
+
+
+deduplicator = lifecycle.Lazy(create_deduplicator)
+
+
+def on_publish_done(future: futures.Future[str]) -> None:
+    """Log result of a message published in async mode."""
+    if error := future.exception():
+        metrics.incr("pubsub_publish_failed")
+        logger.error("Failed to publish event: %s", error, exc_info=error)
+        return
+    metrics.incr("pubsub_publish_succeeded")
+    logger.info("Called event, message_id=%s", future.result())
+
+
+def resume_on_error(
+    client: pubsub_v1.PublisherClient,
+    topic_path: str,
+    ordering_key: str,
+    future: futures.Future[str],
+) -> None:
+    """Resume publishing for the ordering key, Pub/Sub pauses it after a failed publish."""
+    if future.exception():
+        try:
+            client.resume_publish(topic_path, ordering_key)
+        except Exception:
+            logger.exception("Failed to resume publish for ordering key %s", ordering_key)
+
+
+def publish_event(
+    client: pubsub_v1.PublisherClient,
+    topic_path: str,
+    data: bytes,
+    ordering_key: str = "",
+    attributes: dict[str, str] | None = None,
+) -> futures.Future[str]:
+    """Publish event data, messages with the same ordering key are delivered in publish order."""
+    attributes = attributes or {}
+    if not ordering_key:
+        return client.publish(topic_path, data=data, **attributes)
+    future = client.publish(topic_path, data=data, ordering_key=ordering_key, **attributes)
+    future.add_done_callback(functools.partial(resume_on_error, client, topic_path, ordering_key))
+    return future
+
+
+def split_event(payload: t.Any) -> list[tuple[t.Any, str]]:
+    """
+    Split Alertmanager group into per-alert events when fan-out is enabled.
+
+    Returns list of events with their ordering keys. Every per-alert event keeps a compact group context
+    and uses the alert fingerprint as the ordering key, so firing and resolved notifications of one alert
+    are handled in order while different alerts are spread across worker instances.
+    """
+    alerts = payload.get("alerts") if isinstance(payload, dict) else None
+    if not settings.AM2N_PUBLISH_FANOUT or not isinstance(alerts, list) or not alerts:
+        return [(payload, "")]
+
+    group = {field: payload.get(field, default) for field, default in FANOUT_GROUP_FIELDS.items()}
+    events = []
+    for alert in alerts:
+        alert_data = alert if isinstance(alert, dict) else {}
+        event = {
+            **group,
+            "status": alert_data.get("status", payload.get("status", "")),
+            "alerts": [alert],
+            "commonAnnotations": {},
+            "truncatedAlerts": 0,
+        }
+        events.append((event, str(alert_data.get("fingerprint", ""))))
+
+    return events
+
+
 @http_am2n_bp.before_request
 def check_secret_header() -> tuple[flask.Response, int] | None:
     """Check Auth header."""
@@ -22,22 +156,156 @@ def check_secret_header() -> tuple[flask.Response, int] | None:
     return None
 
 
-@http_am2n_bp.route("/alertmanager", methods=["POST"])
-def call_event() -> tuple[flask.Response, int]:
-    """Create pubsub event to process Alertmanager webhook."""
+def prepare_events(payload: t.Any) -> list[tuple[t.Any, str]]:
+    """Split payload into events with their ordering keys, oversized events are split under the byte budget."""
+    events = split_event(payload)
+    if not settings.AM2N_EDGE_VALIDATION_ENABLED:
+        return events
+    return [
+        (part, ordering_key)
+        for event, ordering_key in events
+        for part in edge.split_by_size(event, settings.AM2N_EDGE_MAX_MESSAGE_BYTES)
+    ]
+
+
+def encode_event(event: t.Any, payload: t.Any, raw: bytes | None) -> tuple[bytes, dict[str, str]]:
+    """Serialize event in `AM2N_WIRE_FORMAT`, the request body is passed through if the event is the whole payload."""
+    if raw is not None and event is payload and settings.AM2N_WIRE_FORMAT == "json":
+        return raw, {wire.WIRE_ATTRIBUTE: wire.JSON_V1}
+    return wire.encode(event, settings.AM2N_WIRE_FORMAT)
+
+
+def publish_events(payload: t.Any, raw: bytes | None = None) -> list[futures.Future[str]]:
+    """
+    Publish Alertmanager webhook payload as one or more Pub/Sub messages, `raw` is the request body of the payload.
+
+    Events already published with the same alert statuses are dropped, returns an empty list if all of them were.
+    """
+    client = publisher.get()
+    topic_path = client.topic_path(settings.GCP_PROJECT_ID, settings.EVENTS_PUBSUB_TOPIC)
+    dedup = deduplicator.get()
+    publish_futures = []
+    for event, ordering_key in prepare_events(payload):
+        if dedup and dedup.is_duplicate(event):
+            continue
+        data, attributes = encode_event(event, payload, raw)
+        future = publish_event(client, topic_path, data, ordering_key, attributes)
+        if dedup:
+            future.add_done_callback(functools.partial(dedup.remember_on_success, event))
+        publish_futures.append(future)
+    if settings.AM2N_PUBLISH_MODE == "async":
+        for future in publish_futures:
+            future.add_done_callback(on_publish_done)
+
+    return publish_futures
+
+
+def published_response(message_ids: list[str]) -> dict[str, t.Any]:
+    """Response body with IDs of messages published in strict mode, a list if the payload was split."""
+    if settings.AM2N_PUBLISH_FANOUT or len(message_ids) > 1:
+        return {"message_ids": message_ids}
+    return {"message_id": message_ids[0]}
+
+
+def publish_stream(stream: streaming.Readable) -> list[futures.Future[str]]:
+    """
+    Publish a large webhook payload parsed from the request stream, events are published as alerts are read.
+
+    Events are split under `AM2N_EDGE_MAX_MESSAGE_BYTES`. Group fields that follow the alerts in the payload
+    (e.g. `groupKey`) are not known yet and have default values. A malformed rest of the payload is dropped once
+    events were published, so the payload is accepted and Alertmanager doesn't send them again.
+    """
+    publish_futures: list[futures.Future[str]] = []
     try:
-        payload = flask.request.get_json(force=True)
-    except Exception:
-        return flask.jsonify({"error": "Invalid JSON"}), 400
+        for event in streaming.stream_events(
+            streaming.StreamingEventParser(stream),
+            settings.AM2N_EDGE_MAX_MESSAGE_BYTES,
+        ):
+            if settings.AM2N_EDGE_VALIDATION_ENABLED:
+                edge.validate(event)
+                event = edge.trim(event, settings.AM2N_EDGE_MAX_ANNOTATION_LENGTH)
+            publish_futures.extend(publish_events(event))
+    except (streaming.StreamingParseError, edge.InvalidPayload) as e:
+        if not publish_futures:
+            raise
+        metrics.incr("receiver_partial_payloads")
+        logger.warning("Dropped rest of payload after %s published events: %s", len(publish_futures), e)
+    return publish_futures
+
+
+def is_streamed(request: flask.Request) -> bool:
+    """Whether the payload is parsed from the request stream instead of being loaded at once."""
+    return settings.AM2N_STREAMING_ENABLED and (request.content_length or 0) >= settings.AM2N_STREAMING_MIN_BYTES
+
+
+def invalid_event_response(error: edge.InvalidPayload) -> tuple[flask.Response, int]:
+    """Response to a payload that is not a valid Alertmanager event."""
+    metrics.incr("receiver_invalid_payloads")
+    logger.warning("Invalid Alertmanager event: %s", error)
+    return flask.jsonify({"error": "Invalid Alertmanager event"}), 400
+
+
+def publish_request(request: flask.Request) -> list[futures.Future[str]]:
+    """
+    Parse, validate and publish webhook payload of the request.
 
-    publisher = pubsub_v1.PublisherClient()
-    topic_path = publisher.topic_path(settings.GCP_PROJECT_ID, settings.EVENTS_PUBSUB_TOPIC)
-    message_data = json.dumps(payload).encode("utf-8")
+    Raises `InvalidJSON`, `streaming.StreamingParseError` or `edge.InvalidPayload` for malformed payloads.
+    """
+    if is_streamed(request):
+        with metrics.stage("receiver.stream"):
+            return publish_stream(request.stream)
     try:
-        future = publisher.publish(topic_path, data=message_data)
-        message_id = future.result()
-        logger.info("Called event, message_id=%s", message_id)
-        return flask.jsonify({"message_id": message_id}), 202
+        with metrics.stage("receiver.parse"):
+            payload = request.get_json(force=True)
     except Exception as e:
+        raise InvalidJSON(str(e)) from e
+
+    raw: bytes | None = request.get_data()
+    if settings.AM2N_EDGE_VALIDATION_ENABLED:
+        with metrics.stage("receiver.validate"):
+            edge.validate(payload)
+            payload, raw = edge.trim(payload, settings.AM2N_EDGE_MAX_ANNOTATION_LENGTH), None
+    with metrics.stage("receiver.publish"):
+        return publish_events(payload, raw)
+
+
+def publish_response(publish_futures: list[futures.Future[str]]) -> tuple[flask.Response, int]:
+    """Response to a published payload, waits for message IDs in strict mode."""
+    if not publish_futures:
+        return flask.jsonify({"status": "duplicate"}), 200
+    if settings.AM2N_PUBLISH_MODE == "async":
+        return flask.jsonify({"status": "accepted"}), 202
+    with metrics.stage("receiver.wait"):
+        message_ids = [future.result() for future in publish_futures]
+    metrics.incr("pubsub_publish_succeeded", len(message_ids))
+    logger.info("Called event, message_ids=%s", message_ids)
+    return flask.jsonify(published_response(message_ids)), 202
+
+
+def webhook_response(request: flask.Request) -> tuple[flask.Response, int]:
+    """Publish webhook payload of the request and return the response, errors are answered with 4xx or 5xx."""
+    try:
+        return publish_response(publish_request(request))
+    except (InvalidJSON, streaming.StreamingParseError):
+        return flask.jsonify({"error": "Invalid JSON"}), 400
+    except edge.InvalidPayload as e:
+        return invalid_event_response(e)
+    except Exception as e:
+        metrics.incr("pubsub_publish_failed")
         logger.exception("Server Error: %s", e)
         return flask.jsonify({"error": "Server Error"}), 500
+
+
+@http_am2n_bp.route("/alertmanager", methods=["POST"])
+def call_event() -> tuple[flask.Response, int]:
+    """Create pubsub event to process Alertmanager webhook."""
+    with metrics.trace() as trace:
+        response = webhook_response(flask.request)
+    logger.info("Handle request finished", extra={"json_fields": {"status": response[1], **trace.fields()}})
+    return response
+
+
+@http_am2n_bp.route("/metrics", methods=["GET"])
+def get_metrics() -> flask.Response:
+    """Export metrics of the instance in OpenMetrics text format."""
+    return flask.Response(metrics.openmetrics(), content_type=metrics.OPENMETRICS_CONTENT_TYPE)
@@ -0,0 +1,66 @@
+import typing as t
+
+import json
+import logging
+
+from app import wire
+
+logger = logging.getLogger("http_am2n")
+
+
+class InvalidPayload(ValueError):
+    """Payload is not a valid Alertmanager event."""
+
+
+def validate(payload: t.Any) -> None:
+    """Validate payload against `AlertmanagerEvent` schema, raises `InvalidPayload`."""
+    # Imported here, the receiver loads pydantic only if edge validation is enabled.
+    from app.schemas import AlertmanagerEvent
+
+    try:
+        AlertmanagerEvent.model_validate(payload)
+    except ValueError as e:
+        raise InvalidPayload(str(e)) from e
+
+
+def trim(payload: dict[str, t.Any], max_annotation_length: int) -> dict[str, t.Any]:
+    """
+    Drop fields the worker never uses and truncate long annotations of a validated payload.
+
+    The result is still a valid Alertmanager event: group and common labels and annotations are left empty.
+    """
+    event = wire.compact_event(payload)
+    for field in wire.COMPACT_DROPPED_EVENT_FIELDS:
+        event[field] = {}
+    for alert in event["alerts"]:
+        for name, value in (alert.get("annotations") or {}).items():
+            if isinstance(value, str) and len(value) > max_annotation_length:
+                alert["annotations"][name] = value[: max(max_annotation_length - 1, 0)] + "…"
+    return event
+
+
+def split_by_size(event: t.Any, max_bytes: int) -> list[t.Any]:
+    """
+    Split event into events with fewer alerts, so every one of them is serialized into at most `max_bytes`.
+
+    Sizes are estimated with `json.dumps`, which is never smaller than the compact wire format.
+    An alert that doesn't fit the budget on its own is sent in a separate event.
+    """
+    alerts = event.get("alerts") if isinstance(event, dict) else None
+    if not isinstance(alerts, list) or len(alerts) < 2:
+        return [event]
+    base_size = len(json.dumps({**event, "alerts": []}).encode("utf-8"))
+    sizes = [len(json.dumps(alert).encode("utf-8")) + 2 for alert in alerts]
+    if base_size + sum(sizes) <= max_bytes:
+        return [event]
+
+    chunks: list[list[t.Any]] = [[]]
+    chunk_size = base_size
+    for alert, size in zip(alerts, sizes, strict=True):
+        if chunks[-1] and chunk_size + size > max_bytes:
+            chunks.append([])
+            chunk_size = base_size
+        chunks[-1].append(alert)
+        chunk_size += size
+    logger.info("Split event with %s alerts into %s messages under %s bytes", len(alerts), len(chunks), max_bytes)
+    return [{**event, "alerts": chunk} for chunk in chunks]
@@ -0,0 +1,145 @@
+import typing as t
+
+import asyncio
+import atexit
+import itertools
+import logging
+import os
+import signal
+import threading
+import weakref
+
+logger = logging.getLogger("lifecycle")
+
+T = t.TypeVar("T")
+
+# All lazy resources created in this process, used by `reset_all` and `close_all`.
+_resources: "weakref.WeakSet[Lazy[t.Any]]" = weakref.WeakSet()
+_counter = itertools.count()
+# Marks a resource whose value isn't created yet, factories may return None (e.g. a disabled feature).
+_UNSET: t.Any = object()
+
+
+class Lazy(t.Generic[T]):
+    """
+    Process-level lazily created resource (Flask app, API clients, caches).
+
+    The value is created on first `get()` and kept for the life of the instance, so warm invocations reuse it.
+    Creation is guarded by a lock, and the value is dropped in a forked child, because gRPC channels and
+    connection pools must not be shared across processes.
+    """
+
+    def __init__(self, factory: t.Callable[[], T], close: t.Callable[[T], None] | None = None) -> None:
+        """Init resource with a factory and an optional close callback."""
+        self._factory = factory
+        self._close = close
+        self._lock = threading.Lock()
+        self._value: T = _UNSET
+        self._order = next(_counter)
+        _resources.add(self)
+
+    @property
+    def created(self) -> bool:
+        """Whether the value was already created."""
+        return self._value is not _UNSET
+
+    def get(self) -> T:
+        """Return the value, creating it on first use."""
+        if (value := self._value) is not _UNSET:
+            return value
+        with self._lock:
+            if self._value is _UNSET:
+                self._value = self._factory()
+            return self._value
+
+    def reset(self) -> None:
+        """Drop the value without closing it, next `get()` creates a new one."""
+        with self._lock:
+            self._value = _UNSET
+
+    def close(self) -> None:
+        """Close the value (if created and closable) and drop it."""
+        with self._lock:
+            value, self._value = self._value, _UNSET
+        if value is not _UNSET and self._close is not None:
+            try:
+                self._close(value)
+            except Exception:
+                logger.exception("Failed to close resource created by %s", self._factory)
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._value = _UNSET
+
+
+def reset_all() -> None:
+    """Drop all created resources, e.g. between tests."""
+    for resource in list(_resources):
+        resource.reset()
+
+
+def close_all() -> None:
+    """
+    Close all created resources, called on instance shutdown.
+
+    Resources are closed in reverse order of their definition, so the ones defined later (e.g. API clients)
+    are closed before the ones they may use (e.g. the event loop).
+    """
+    for resource in sorted(_resources, key=lambda resource: resource._order, reverse=True):
+        resource.close()
+
+
+class EventLoopThread:
+    """
+    Event loop running in a daemon thread for the life of the instance.
+
+    Async clients keep connections bound to the loop they were opened in, so warm invocations submit coroutines
+    to this loop instead of running a new one with `asyncio.run`.
+    """
+
+    def __init__(self) -> None:
+        """Start event loop thread."""
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="am2n-event-loop", daemon=True)
+        self.thread.start()
+
+    def run(self, coro: t.Coroutine[t.Any, t.Any, T], timeout: float | None = None) -> T:
+        """Run coroutine in the loop and wait for its result, the coroutine is cancelled after `timeout` seconds."""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def stop(self) -> None:
+        """Stop the loop and wait for the thread."""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+        if not self.loop.is_running():
+            self.loop.close()
+
+
+event_loop = Lazy(EventLoopThread, close=EventLoopThread.stop)
+
+
+def run_async(coro: t.Coroutine[t.Any, t.Any, T], timeout: float | None = None) -> T:
+    """Run coroutine in the instance's event loop from sync code, see `EventLoopThread.run`."""
+    return event_loop.get().run(coro, timeout)
+
+
+def _after_fork_in_child() -> None:
+    for resource in list(_resources):
+        resource._after_fork()
+
+
+def _exit_on_sigterm(signum: int, frame: t.Any) -> None:
+    raise SystemExit(128 + signum)
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+atexit.register(close_all)
+# Cloud Run stops instances with SIGTERM, by default it kills the process without running `atexit` callbacks.
+# Servers with own handler (gunicorn) exit gracefully, so only the default handler is replaced.
+if threading.current_thread() is threading.main_thread() and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
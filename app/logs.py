@@ -0,0 +1,23 @@
+import typing as t
+
+import logging
+
+from python_settings import settings
+
+from app import lifecycle
+
+
+def setup_logging() -> t.Any:
+    """Send logs to Cloud Logging or to stderr, returns Cloud Logging client if it's used."""
+    if not settings.GCP_LOGGING:
+        logging.basicConfig(level=settings.LOG_LEVEL)
+        return None
+    # Imported here, `google.cloud.logging` and its client are the largest part of a cold start.
+    import google.cloud.logging
+
+    client = google.cloud.logging.Client()  # type: ignore[no-untyped-call]
+    client.setup_logging(log_level=settings.LOG_LEVEL)  # type: ignore[no-untyped-call]
+    return client
+
+
+logging_client = lifecycle.Lazy(setup_logging)
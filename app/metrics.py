@@ -0,0 +1,233 @@
+"""
+Process-level metrics: counters (e.g. cache hits), gauges (e.g. cache size) and histograms (e.g. stage timings).
+
+Values live as long as the instance and are exported in OpenMetrics text format by `openmetrics()`. Metrics
+recorded while a `trace()` is active are also added to the trace, which is logged as structured fields of the event.
+"""
+
+import typing as t
+
+import bisect
+import contextlib
+import contextvars
+import functools
+import math
+import threading
+import time
+from collections import defaultdict
+
+PREFIX = "am2n_"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+# Upper bounds of histogram buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf)
+
+Labels = tuple[tuple[str, str], ...]
+F = t.TypeVar("F", bound=t.Callable[..., t.Any])
+
+
+class Histogram:
+    """Count, sum and per-bucket counts of observed values."""
+
+    def __init__(self) -> None:
+        """Init empty histogram."""
+        self.count = 0
+        self.sum = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, value: float) -> None:
+        """Add value."""
+        self.count += 1
+        self.sum += value
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+
+
+class Trace:
+    """Stage timings and counters of one event, see `trace()`."""
+
+    def __init__(self) -> None:
+        """Start trace."""
+        self.started = time.perf_counter()
+        self.stages: defaultdict[str, float] = defaultdict(float)
+        self.counters: defaultdict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage: str, seconds: float) -> None:
+        """Add time spent in the stage."""
+        with self._lock:
+            self.stages[stage] += seconds
+
+    def incr(self, name: str, value: float) -> None:
+        """Increase counter of the trace, counters with different labels are summed up."""
+        with self._lock:
+            self.counters[name] += value
+
+    def fields(self) -> dict[str, t.Any]:
+        """Structured log fields, `google.cloud.logging` handlers take them from `extra={"json_fields": ...}`."""
+        with self._lock:
+            return {
+                "duration_seconds": round(time.perf_counter() - self.started, 6),
+                "stage_seconds": {stage: round(seconds, 6) for stage, seconds in self.stages.items()},
+                **self.counters,
+            }
+
+
+_lock = threading.Lock()
+_counters: defaultdict[tuple[str, Labels], float] = defaultdict(float)
+_histograms: defaultdict[tuple[str, Labels], Histogram] = defaultdict(Histogram)
+_gauges: dict[tuple[str, Labels], float] = {}
+_trace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar("am2n_trace", default=None)
+
+
+def _labels(labels: dict[str, t.Any]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _series(name: str, labels: Labels, extra: str = "") -> str:
+    """Series name with labels, e.g. `notion_requests{endpoint="pages.create",status="200"}`."""
+    pairs = [f'{label}="{_escape(value)}"' for label, value in labels]
+    if extra:
+        pairs.append(extra)
+    return f"{name}{{{','.join(pairs)}}}" if pairs else name
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def incr(name: str, value: float = 1, **labels: t.Any) -> None:
+    """Increase counter by value."""
+    with _lock:
+        _counters[(name, _labels(labels))] += value
+    if (current := _trace.get()) is not None:
+        current.incr(name, value)
+
+
+def get(name: str, **labels: t.Any) -> float:
+    """Return current counter value."""
+    with _lock:
+        return _counters.get((name, _labels(labels)), 0)
+
+
+def gauge(name: str, value: float, **labels: t.Any) -> None:
+    """Set gauge to value."""
+    with _lock:
+        _gauges[(name, _labels(labels))] = value
+
+
+def get_gauge(name: str, **labels: t.Any) -> float | None:
+    """Return current gauge value, None if it's not set."""
+    with _lock:
+        return _gauges.get((name, _labels(labels)))
+
+
+def observe(name: str, value: float, **labels: t.Any) -> None:
+    """Add value to histogram."""
+    with _lock:
+        _histograms[(name, _labels(labels))].observe(value)
+
+
+def histogram(name: str, **labels: t.Any) -> tuple[int, float]:
+    """Return count and sum of histogram values."""
+    with _lock:
+        if (value := _histograms.get((name, _labels(labels)))) is None:
+            return 0, 0
+        return value.count, value.sum
+
+
+@contextlib.contextmanager
+def stage(name: str) -> t.Iterator[None]:
+    """Time the block as a stage of the event, recorded in `stage_seconds` histogram and the current trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        observe("stage_seconds", elapsed, stage=name)
+        if (current := _trace.get()) is not None:
+            current.add_stage(name, elapsed)
+
+
+@contextlib.contextmanager
+def trace() -> t.Iterator[Trace]:
+    """Collect stage timings and counters of the block, e.g. of an event, into a new `Trace`."""
+    current = Trace()
+    token = _trace.set(current)
+    try:
+        yield current
+    finally:
+        _trace.reset(token)
+
+
+def traced(func: F) -> F:
+    """Bind function to the current trace, so it's recorded in the trace when called from another thread."""
+    current = _trace.get()
+
+    @functools.wraps(func)
+    def wrapper(*args: t.Any, **kwargs: t.Any) -> t.Any:
+        token = _trace.set(current)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _trace.reset(token)
+
+    return t.cast(F, wrapper)
+
+
+def snapshot() -> dict[str, float]:
+    """Return copy of all counters."""
+    with _lock:
+        return {_series(name, labels): value for (name, labels), value in _counters.items()}
+
+
+def reset() -> None:
+    """Reset all counters, gauges and histograms."""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == math.inf else repr(bound)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _histogram_lines(name: str, labels: Labels, count: int, total: float, buckets: list[int]) -> t.Iterator[str]:
+    cumulative = 0
+    for bound, bucket in zip(BUCKETS, buckets, strict=True):
+        cumulative += bucket
+        le = f'le="{_format_bound(bound)}"'
+        yield f"{_series(PREFIX + name + '_bucket', labels, le)} {cumulative}"
+    yield f"{_series(PREFIX + name + '_count', labels)} {count}"
+    yield f"{_series(PREFIX + name + '_sum', labels)} {_format_value(total)}"
+
+
+def _family_lines(kind: str, suffix: str, values: list[tuple[tuple[str, Labels], float]]) -> t.Iterator[str]:
+    family = ""
+    for (name, labels), value in values:
+        if name != family:
+            family = name
+            yield f"# TYPE {PREFIX}{name} {kind}"
+        yield f"{_series(PREFIX + name + suffix, labels)} {_format_value(value)}"
+
+
+def openmetrics() -> str:
+    """Export counters, gauges and histograms in OpenMetrics text format, metric names get `am2n_` prefix."""
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+        histograms = sorted((key, (value.count, value.sum, list(value.buckets))) for key, value in _histograms.items())
+    lines = [*_family_lines("counter", "_total", counters), *_family_lines("gauge", "", gauges)]
+    family = ""
+    for (name, labels), (count, total, buckets) in histograms:
+        if name != family:
+            family = name
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+        lines.extend(_histogram_lines(name, labels, count, total, buckets))
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
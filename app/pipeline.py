@@ -0,0 +1,202 @@
+"""
+Pipeline of event handlers run by `main.handle_event`.
+
+Handlers run in the order of `AM2N_EVENT_HANDLERS`, after the handlers they name in `depends_on`. A handler is named
+by its `handler_name`, or its class name if it doesn't declare one. A handler runs
+only if all its dependencies succeeded. A handler raising `StopHandlingEvent` stops the handlers after it and
+an error fails the event, as before. Handlers marked `independent` (e.g. audit log or metrics sinks) run
+concurrently in threads from the start of the event, or once their dependencies are done. Their errors and
+timeouts are logged and counted but don't fail the event.
+"""
+
+import typing as t
+
+import inspect
+import logging
+import threading
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+
+from app import exceptions, lifecycle, metrics
+
+if t.TYPE_CHECKING:
+    from google.cloud.functions_v1.context import Context  # pragma: nocover
+
+logger = logging.getLogger("main")
+
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+STOPPED = "stopped"
+SKIPPED = "skipped"
+TIMED_OUT = "timed_out"
+
+
+class HandlerSpec(t.NamedTuple):
+    """Handler class with its name and place in the pipeline, see `HandlerAttributes` of app/base.py."""
+
+    handler: t.Callable[[dict[str, t.Any], "Context"], t.Callable[[], t.Any]]
+    name: str
+    depends_on: tuple[str, ...] = ()
+    independent: bool = False
+    timeout: float | None = None
+
+    @classmethod
+    def of(cls, handler: t.Any) -> "HandlerSpec":
+        """Spec of a handler class, attributes it doesn't declare get the defaults."""
+        return cls(
+            handler=handler,
+            name=getattr(handler, "handler_name", None) or handler.__name__,
+            depends_on=tuple(getattr(handler, "depends_on", ())),
+            independent=getattr(handler, "independent", False),
+            timeout=getattr(handler, "timeout", None),
+        )
+
+
+def check_dependencies(specs: list[HandlerSpec]) -> None:
+    """Raise `ValueError` if a handler depends on a handler that is not in the pipeline."""
+    names = {spec.name for spec in specs}
+    for spec in specs:
+        if missing := [dependency for dependency in spec.depends_on if dependency not in names]:
+            raise ValueError(f"Event handler {spec.name} depends on unknown handler {', '.join(missing)}")
+
+
+def sort_handlers(specs: list[HandlerSpec]) -> list[HandlerSpec]:
+    """Order handlers so that every one follows its dependencies, otherwise keeping the given order."""
+    check_dependencies(specs)
+    by_name = {spec.name: spec for spec in specs}
+    ordered: dict[str, HandlerSpec] = {}
+    visiting: set[str] = set()
+
+    def visit(spec: HandlerSpec) -> None:
+        if spec.name in ordered:
+            return
+        if spec.name in visiting:
+            raise ValueError(f"Event handlers have circular dependencies: {sorted(visiting)}")
+        visiting.add(spec.name)
+        for dependency in spec.depends_on:
+            visit(by_name[dependency])
+        ordered[spec.name] = spec
+
+    for spec in specs:
+        visit(spec)
+    return list(ordered.values())
+
+
+def complete(outcome: futures.Future[str], value: str) -> None:
+    """Set outcome of a handler unless it's already known, e.g. a timed out handler that finished later."""
+    try:
+        outcome.set_result(value)
+    except futures.InvalidStateError:
+        pass
+
+
+def call_handler(spec: HandlerSpec, event: dict[str, t.Any], context: "Context", timeout: float | None) -> None:
+    """Run handler, async handlers run in the instance's event loop and are cancelled after `timeout`."""
+    with metrics.stage(f"handler.{spec.name}"):
+        result = spec.handler(event, context)()
+        if inspect.iscoroutine(result):
+            lifecycle.run_async(result, timeout)
+
+
+class Pipeline:
+    """Event handlers ordered by their dependencies, see the module docstring."""
+
+    def __init__(self, handlers: t.Iterable[t.Any], default_timeout: float | None = None) -> None:
+        """Init pipeline, `default_timeout` is seconds an independent handler without own `timeout` may run."""
+        self.specs = sort_handlers([HandlerSpec.of(handler) for handler in handlers])
+        self.default_timeout = default_timeout
+
+    def timeout(self, spec: HandlerSpec) -> float | None:
+        """Seconds the independent handler may run."""
+        return spec.timeout if spec.timeout is not None else self.default_timeout
+
+    def dependencies_succeeded(self, spec: HandlerSpec, outcomes: dict[str, futures.Future[str]]) -> bool:
+        """Wait for dependencies of the handler, returns whether all of them succeeded."""
+        return all(outcomes[dependency].result() == SUCCEEDED for dependency in spec.depends_on)
+
+    def run_independent(
+        self,
+        spec: HandlerSpec,
+        event: dict[str, t.Any],
+        context: "Context",
+        outcomes: dict[str, futures.Future[str]],
+    ) -> None:
+        """Run independent handler once its dependencies are done, its outcome is set to `timed_out` on timeout."""
+        outcome = outcomes[spec.name]
+        if not self.dependencies_succeeded(spec, outcomes):
+            complete(outcome, SKIPPED)
+            return
+        timeout = self.timeout(spec)
+        timer = threading.Timer(timeout, complete, (outcome, TIMED_OUT)) if timeout is not None else None
+        if timer:
+            timer.daemon = True
+            timer.start()
+        try:
+            call_handler(spec, event, context, timeout)
+            complete(outcome, SUCCEEDED)
+        except exceptions.StopHandlingEvent:
+            complete(outcome, STOPPED)
+        except Exception:
+            logger.exception("Independent event handler %s failed", spec.name)
+            complete(outcome, FAILED)
+        finally:
+            if timer:
+                timer.cancel()
+
+    def run_ordered(
+        self,
+        specs: list[HandlerSpec],
+        event: dict[str, t.Any],
+        context: "Context",
+        outcomes: dict[str, futures.Future[str]],
+    ) -> None:
+        """Run handlers one by one in the calling thread, stopping at `StopHandlingEvent` or an error."""
+        for spec in specs:
+            if not self.dependencies_succeeded(spec, outcomes):
+                logger.info("Skip event handler %s, its dependencies didn't succeed", spec.name)
+                complete(outcomes[spec.name], SKIPPED)
+                continue
+            logger.info("Handle event by %s", spec.name)
+            try:
+                call_handler(spec, event, context, None)
+            except exceptions.StopHandlingEvent:
+                logger.info("Got stop handling event from handler %s", spec.name)
+                complete(outcomes[spec.name], STOPPED)
+                return
+            except Exception:
+                complete(outcomes[spec.name], FAILED)
+                raise
+            logger.info("Finished handle event by %s", spec.name)
+            complete(outcomes[spec.name], SUCCEEDED)
+
+    def run(self, event: dict[str, t.Any], context: "Context") -> dict[str, str]:
+        """
+        Handle event by all handlers, returns outcome of each one.
+
+        Independent handlers are waited for before returning, an error of an ordered handler is raised after that.
+        """
+        outcomes: dict[str, futures.Future[str]] = {spec.name: futures.Future() for spec in self.specs}
+        independent = [spec for spec in self.specs if spec.independent]
+        ordered = [spec for spec in self.specs if not spec.independent]
+        executor = ThreadPoolExecutor(max_workers=max(len(independent), 1), thread_name_prefix="am2n-handler")
+        try:
+            for spec in independent:
+                executor.submit(metrics.traced(self.run_independent), spec, event, context, outcomes)
+            self.run_ordered(ordered, event, context, outcomes)
+        finally:
+            # Handlers after `StopHandlingEvent` or an error are skipped, so are their independent dependents.
+            for spec in ordered:
+                complete(outcomes[spec.name], SKIPPED)
+            results = self.results(outcomes)
+            # Timed out handlers keep running in the background, the event doesn't wait for them.
+            executor.shutdown(wait=False)
+        return results
+
+    def results(self, outcomes: dict[str, futures.Future[str]]) -> dict[str, str]:
+        """Wait for outcomes of all handlers and count them in `event_handlers` metric."""
+        results = {name: outcome.result() for name, outcome in outcomes.items()}
+        for name, result in results.items():
+            metrics.incr("event_handlers", handler=name, outcome=result)
+            if result in (FAILED, TIMED_OUT):
+                logger.warning("Event handler %s %s", name, result)
+        return results
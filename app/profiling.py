@@ -0,0 +1,98 @@
+"""
+Sampling profiler hook, turned on by `AM2N_PROFILER_ENABLED` for a `AM2N_PROFILER_SAMPLE_RATE` share of events.
+
+While a profiled block runs, a background thread samples stacks of all other threads every `AM2N_PROFILER_INTERVAL`
+seconds. The most frequent stacks are logged as structured fields in collapsed format (`outer;inner` with the number
+of samples), which flame graph tools read.
+"""
+
+import typing as t
+from types import FrameType
+
+import contextlib
+import logging
+import random
+import sys
+import threading
+from collections import Counter
+
+from python_settings import settings
+
+logger = logging.getLogger("profiler")
+
+MAX_STACK_DEPTH = 64
+
+
+def collapse(frame: FrameType | None) -> str:
+    """Collapsed stack of the frame, outermost call first."""
+    names: list[str] = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """Samples stacks of all threads of the process in a background thread."""
+
+    def __init__(self, interval: float) -> None:
+        """Init profiler, `interval` is seconds between samples."""
+        self.interval = interval
+        self.samples = 0
+        self.stacks: Counter[str] = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="am2n-profiler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> None:
+        """Record stacks of all threads except the profiler's one."""
+        self.samples += 1
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id != self._thread.ident:
+                self.stacks[collapse(frame)] += 1
+
+    def start(self) -> None:
+        """Start sampling."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the thread."""
+        self._stopped.set()
+        self._thread.join()
+
+
+def is_sampled() -> bool:
+    """Whether the profiler is enabled and the current event is picked for profiling."""
+    return settings.AM2N_PROFILER_ENABLED and random.random() < settings.AM2N_PROFILER_SAMPLE_RATE  # nosec
+
+
+@contextlib.contextmanager
+def profiled(name: str) -> t.Iterator[None]:
+    """Profile the block if the event is sampled, the most frequent stacks are logged when it's done."""
+    if not is_sampled():
+        yield
+        return
+    profiler = SamplingProfiler(settings.AM2N_PROFILER_INTERVAL)
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        logger.info(
+            "Profile of %s: %s samples",
+            name,
+            profiler.samples,
+            extra={
+                "json_fields": {
+                    "profile": {
+                        "name": name,
+                        "samples": profiler.samples,
+                        "interval_seconds": profiler.interval,
+                        "stacks": dict(profiler.stacks.most_common(settings.AM2N_PROFILER_TOP_STACKS)),
+                    },
+                },
+            },
+        )
@@ -0,0 +1,206 @@
+"""
+Micro-batching worker pulling Alertmanager events from a Pub/Sub subscription.
+
+An alternative to the push-triggered `handle_event` function for alert storms: a fixed small pool of workers
+buffers messages for a short window, keeps only the latest alert of each status run per fingerprint and processes
+the batch with one bulk lookup and the minimum number of writes before acking.
+
+Run: SETTINGS_MODULE=app.settings python -m app.pull_worker
+"""
+
+import typing as t
+
+import logging
+import threading
+import time
+
+from google.cloud import pubsub_v1  # type: ignore
+from python_settings import settings
+
+from app import metrics, wire
+from app.event_handlers.notion import get_notion_service
+from app.logs import logging_client
+from app.schemas import Alert, EventAlerts
+from app.services.notion import NotionService
+
+logger = logging.getLogger("pull-worker")
+
+
+class Message(t.Protocol):
+    """Subset of `pubsub_v1.subscriber.message.Message` API used by the worker."""
+
+    data: bytes
+    attributes: t.Mapping[str, str]
+    publish_time: t.Any
+
+    def ack(self) -> None:  # noqa: D102
+        ...  # pragma: nocover
+
+    def nack(self) -> None:  # noqa: D102
+        ...  # pragma: nocover
+
+
+def keep_latest(alerts: list[Alert], alert: Alert) -> None:
+    """Replace the last alert if it has the same status, status changes are kept so a page is never created resolved."""
+    if alerts and alerts[-1].status == alert.status:
+        alerts[-1] = alert
+    else:
+        alerts.append(alert)
+
+
+def coalesce(messages: list[Message]) -> tuple[list[Alert], dict[str, list[Message]]]:
+    """
+    Keep only the latest alert of each status run per fingerprint from messages in publish order.
+
+    Returns alerts to process, in publish order per fingerprint, and messages carrying each fingerprint.
+    Messages that are not valid Alertmanager events are acked and dropped, like `NotionService.handle_alert` does.
+    """
+    latest: dict[str, list[Alert]] = {}
+    owners: dict[str, list[Message]] = {}
+    for message in sorted(messages, key=lambda message: message.publish_time):
+        try:
+            event = EventAlerts.model_validate(wire.decode(message.data, message.attributes))
+        except ValueError:
+            logger.exception("Failed to parse Alertmanager event: %s", message.data)
+            message.ack()
+            continue
+        if not event.alerts:
+            message.ack()
+        for alert in event.alerts:
+            keep_latest(latest.setdefault(alert.fingerprint, []), alert)
+            owners.setdefault(alert.fingerprint, []).append(message)
+    return [alert for alerts in latest.values() for alert in alerts], owners
+
+
+def process_batch(service: NotionService, messages: list[Message]) -> None:
+    """Process coalesced alerts of the batch, messages of failed alerts are nacked to be redelivered."""
+    with metrics.trace() as trace:
+        with metrics.stage("decode"):
+            alerts, owners = coalesce(messages)
+        metrics.incr("pull_worker_messages", len(messages))
+        metrics.incr("pull_worker_alerts_coalesced", sum(map(len, owners.values())) - len(alerts))
+        if not alerts:
+            return
+        report = service.handle_alerts(alerts)
+    failed = {result.fingerprint for result in report.failed}
+    nacked = {id(message) for fingerprint in failed for message in owners[fingerprint]}
+    for message in {id(message): message for group in owners.values() for message in group}.values():
+        if id(message) in nacked:
+            message.nack()
+        else:
+            message.ack()
+    logger.info(
+        "Processed batch of %s messages, %s alerts, %s failed",
+        len(messages),
+        len(alerts),
+        len(failed),
+        extra={"json_fields": trace.fields()},
+    )
+
+
+class MicroBatcher:
+    """Buffers messages and flushes them when `max_messages` are collected or the oldest waits `max_wait` seconds."""
+
+    def __init__(
+        self,
+        process: t.Callable[[list[Message]], None],
+        max_messages: int = 500,
+        max_wait: float = 1.0,
+    ) -> None:
+        """Init batcher and start the flush timer."""
+        self.process = process
+        self.max_messages = max(max_messages, 1)
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        # Batches are processed one at a time, so alerts of one fingerprint are never written concurrently.
+        self._process_lock = threading.Lock()
+        self._messages: list[Message] = []
+        self._first_at = 0.0
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._flush_on_timer, name="am2n-batcher", daemon=True)
+        self._timer.start()
+
+    def _take(self, force: bool = False) -> list[Message]:
+        with self._lock:
+            full = len(self._messages) >= self.max_messages
+            expired = self._messages and time.monotonic() - self._first_at >= self.max_wait
+            if not (force or full or expired):
+                return []
+            batch, self._messages = self._messages, []
+            return batch
+
+    def _process(self, batch: list[Message]) -> None:
+        if not batch:
+            return
+        with self._process_lock:
+            try:
+                self.process(batch)
+            except Exception:
+                logger.exception("Failed to process batch of %s messages", len(batch))
+                for message in batch:
+                    message.nack()
+
+    def add(self, message: Message) -> None:
+        """Add message to the batch, processes the batch if it's full. Messages added after `close` are nacked."""
+        with self._lock:
+            if self._closed.is_set():
+                message.nack()
+                return
+            if not self._messages:
+                self._first_at = time.monotonic()
+            self._messages.append(message)
+        self._process(self._take())
+
+    def flush(self) -> None:
+        """Process buffered messages now."""
+        self._process(self._take(force=True))
+
+    def _flush_on_timer(self) -> None:
+        while not self._closed.wait(self.max_wait / 4):
+            self._process(self._take())
+
+    def close(self) -> None:
+        """Stop the timer and process buffered messages, call it before the streaming pull is cancelled."""
+        self._closed.set()
+        self._timer.join()
+        self.flush()
+
+
+def run() -> None:
+    """Pull messages from `AM2N_PULL_SUBSCRIPTION` until interrupted."""
+    service = get_notion_service(
+        token=settings.AM2N_NOTION_TOKEN,
+        incidents_db_id=settings.AM2N_INCIDENTS_DB_ID,
+        shifts_db_id=settings.AM2N_SHIFTS_DB_ID,
+        shifts_enabled=settings.AM2N_SHIFTS_SUPPORT_ENABLED,
+        notion_version="2022-06-28",
+        max_concurrency=settings.AM2N_NOTION_MAX_CONCURRENCY,
+    )
+    batcher = MicroBatcher(
+        lambda messages: process_batch(service, messages),
+        max_messages=settings.AM2N_PULL_BATCH_MAX_MESSAGES,
+        max_wait=settings.AM2N_PULL_BATCH_MAX_WAIT,
+    )
+    subscriber = pubsub_v1.SubscriberClient()
+    subscription_path = subscriber.subscription_path(settings.GCP_PROJECT_ID, settings.AM2N_PULL_SUBSCRIPTION)
+    flow_control = pubsub_v1.types.FlowControl(
+        max_messages=settings.AM2N_PULL_FLOW_MAX_MESSAGES,
+        max_bytes=settings.AM2N_PULL_FLOW_MAX_BYTES,
+    )
+    logger.info("Pulling messages from %s", subscription_path)
+    streaming_pull = subscriber.subscribe(subscription_path, callback=batcher.add, flow_control=flow_control)
+    with subscriber:
+        try:
+            streaming_pull.result()
+        except (KeyboardInterrupt, SystemExit):
+            logger.info("Stopping pull worker")
+        finally:
+            # Acks of buffered messages are sent only while the streaming pull is open.
+            batcher.close()
+            streaming_pull.cancel()
+            streaming_pull.result()
+
+
+if __name__ == "__main__":  # pragma: nocover
+    logging_client.get()
+    run()
@@ -0,0 +1,251 @@
+"""
+Reconcile incidents in Notion with alerts active in Alertmanager, e.g. after a lost `resolved` notification.
+
+Firing incidents are read once, page by page with `start_cursor`, and compared with a snapshot of active alerts from
+the Alertmanager API (`AM2N_ALERTMANAGER_URL` or `--alertmanager-url`) or a JSON file of alerts (`--alerts`). Only
+fingerprints of active alerts seen in Notion and references of stale incidents are kept, never whole pages, and at
+most `AM2N_RECONCILE_MAX_PAGES` stale incidents are fixed per run. Stale incidents are resolved and active alerts
+without a Firing incident are written as firing, in batches of `AM2N_RECONCILE_BATCH_SIZE` through the worker's rate
+limited Notion service. Silenced and inhibited alerts only keep their incidents open, like alerts not routed to the
+webhook receiver (`AM2N_ALERTMANAGER_RECEIVER`) they are never written as firing. Incidents created or edited
+after the snapshot was taken (less `SNAPSHOT_MARGIN`) are left alone, their alerts may have fired after it.
+Run: SETTINGS_MODULE=app.settings python -m app.reconciler [--alerts FILE | --alertmanager-url URL] [--dry-run]
+"""
+
+import typing as t
+
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import httpx
+import pytz
+from python_settings import settings
+
+from app import metrics
+from app.event_handlers.notion import get_notion_service
+from app.logs import logging_client
+from app.schemas import Alert
+from app.services.notion import (
+    AlertResult,
+    EventReport,
+    NotionService,
+    get_page_fingerprint,
+    log_report,
+)
+
+logger = logging.getLogger("reconciler")
+
+FIRING_FILTER = {"property": "AMStatus", "select": {"equals": "Firing"}}
+# Notion rounds page times down to the minute, pages edited up to a minute before the snapshot may be newer than it.
+SNAPSHOT_MARGIN = timedelta(minutes=1)
+
+
+class StaleIncident(t.NamedTuple):
+    """Firing incident page whose alert is no longer active."""
+
+    page_id: str
+    fingerprint: str
+    start: str | None
+
+
+class ActiveAlerts(t.NamedTuple):
+    """Firing alerts of a snapshot by fingerprint, fingerprints of the ones to write as firing and snapshot time."""
+
+    alerts: dict[str, Alert]
+    notified: set[str]
+    taken_at: datetime
+
+
+def is_notified(item: dict[str, t.Any], receiver: str) -> bool:
+    """Whether Alertmanager notifies the receiver of the API alert: it's not suppressed and routed to the receiver."""
+    if (item.get("status") or {}).get("state") != "active":
+        return False
+    return any(route.get("name") == receiver for route in item.get("receivers") or [])
+
+
+def active_alerts(
+    snapshot: list[dict[str, t.Any]] | dict[str, t.Any],
+    receiver: str = "",
+    taken_at: datetime | None = None,
+) -> ActiveAlerts:
+    """
+    Firing alerts of the snapshot taken at `taken_at` (now by default), all of them keep their incidents open.
+
+    The snapshot is a response of Alertmanager `GET /api/v2/alerts` or a webhook payload, whose resolved alerts are
+    left out. Only alerts Alertmanager notifies `receiver` of are written as firing: alerts of the API that aren't
+    silenced, inhibited or routed elsewhere, and all alerts of a payload sent to the receiver.
+    """
+    if isinstance(snapshot, dict):
+        items, payload = snapshot.get("alerts", []), snapshot.get("receiver") == receiver
+    else:
+        items, payload = snapshot, None
+    active = ActiveAlerts({}, set(), taken_at or datetime.now(tz=pytz.utc))
+    for item in items:
+        if isinstance(item.get("status"), str) and item["status"] != "firing":
+            continue
+        alert = Alert.model_validate({**item, "status": "firing"})
+        active.alerts[alert.fingerprint] = alert
+        if payload if payload is not None else is_notified(item, receiver):
+            active.notified.add(alert.fingerprint)
+    return active
+
+
+def fetch_alerts(url: str) -> list[dict[str, t.Any]]:
+    """Active alerts from Alertmanager API, including silenced and inhibited ones."""
+    resp = httpx.get(
+        f"{url.rstrip('/')}/api/v2/alerts",
+        params={"active": "true", "silenced": "true", "inhibited": "true"},
+        timeout=30,
+    )
+    resp.raise_for_status()
+    return resp.json()  # type: ignore[no-any-return]
+
+
+def page_start(page: dict[str, t.Any]) -> str | None:
+    """Start of `Incident Timeframe` of a Notion page."""
+    date = page.get("properties", {}).get("Incident Timeframe", {}).get("date") or {}
+    return date.get("start")
+
+
+def page_changed_since(page: dict[str, t.Any], since: datetime) -> bool:
+    """Whether the Notion page was created or edited at or after `since`."""
+    times = (page.get("created_time"), page.get("last_edited_time"))
+    return any(datetime.fromisoformat(time) >= since for time in times if time)
+
+
+class Reconciler:
+    """Compares Firing incidents with active alerts and fixes the ones that diverge, see the module docstring."""
+
+    def __init__(self, service: NotionService, batch_size: int = 100, max_pages: int = 50000) -> None:
+        """Init reconciler, `max_pages` bounds stale incidents kept in memory and fixed in one run."""
+        self.service = service
+        self.batch_size = max(batch_size, 1)
+        self.max_pages = max_pages
+
+    def scan(self, active: dict[str, Alert], taken_at: datetime) -> tuple[list[StaleIncident], set[str]]:
+        """
+        Page through Firing incidents once, returns stale incidents and fingerprints of active ones.
+
+        Incidents changed after the snapshot was taken at `taken_at`, less `SNAPSHOT_MARGIN`, are neither stale nor
+        active: the worker may have written a notification the snapshot doesn't know about yet.
+        """
+        stale: list[StaleIncident] = []
+        seen: set[str] = set()
+        scanned = 0
+        since = taken_at - SNAPSHOT_MARGIN
+        with metrics.stage("reconcile.scan"):
+            for page in self.service.query_incident_pages(FIRING_FILTER):
+                scanned += 1
+                # Incidents created by hand have no fingerprint and are left alone.
+                if not (fingerprint := get_page_fingerprint(page)):
+                    continue
+                if page_changed_since(page, since):
+                    metrics.incr("reconcile_skipped_recent")
+                    seen.add(fingerprint)
+                    continue
+                if fingerprint in active:
+                    seen.add(fingerprint)
+                    self.service.remember_page(fingerprint, page["id"])
+                    continue
+                stale.append(StaleIncident(page["id"], fingerprint, page_start(page)))
+                if len(stale) >= self.max_pages:
+                    logger.warning("Found %s stale incidents, the rest is left for the next run", len(stale))
+                    break
+        metrics.incr("reconcile_scanned", scanned)
+        logger.info("Scanned %s Firing incidents, %s stale, %s active", scanned, len(stale), len(seen))
+        return stale, seen
+
+    def resolve(self, incident: StaleIncident, now: str) -> AlertResult:
+        """Resolve incident, its timeframe ends at the time of reconciliation as the real end is unknown."""
+        alert = Alert(status="resolved", fingerprint=incident.fingerprint, startsAt=incident.start or now, endsAt=now)
+        result = AlertResult(fingerprint=incident.fingerprint, status=alert.status, action="resolved")
+        try:
+            self.service.update_incident_status(incident.page_id, alert)
+        except Exception as e:
+            logger.exception("Failed to resolve incident %s of fingerprint %s", incident.page_id, incident.fingerprint)
+            result.error = repr(e)
+        return result
+
+    def resolve_stale(self, stale: list[StaleIncident]) -> list[AlertResult]:
+        """Resolve stale incidents in batches, up to `max_concurrency` updates of a batch run at the same time."""
+        now = datetime.now(tz=pytz.utc).isoformat()
+        results: list[AlertResult] = []
+        with ThreadPoolExecutor(max_workers=self.service.max_concurrency, thread_name_prefix="reconcile") as executor:
+            for start in range(0, len(stale), self.batch_size):
+                batch = stale[start : start + self.batch_size]
+                results.extend(executor.map(metrics.traced(lambda incident: self.resolve(incident, now)), batch))
+                logger.info("Resolved %s of %s stale incidents", len(results), len(stale))
+        return results
+
+    def fire_missing(self, alerts: list[Alert]) -> list[AlertResult]:
+        """Write active alerts without a Firing incident as firing, creating incidents that don't exist."""
+        results: list[AlertResult] = []
+        for start in range(0, len(alerts), self.batch_size):
+            results.extend(self.service.handle_alerts(alerts[start : start + self.batch_size]).results)
+        return results
+
+    def run(self, active: ActiveAlerts, dry_run: bool = False) -> EventReport | None:
+        """Reconcile incidents with the active alerts, returns None on a dry run."""
+        stale, seen = self.scan(active.alerts, active.taken_at)
+        missing = [alert for fp, alert in active.alerts.items() if fp in active.notified and fp not in seen]
+        logger.info("Incidents to resolve: %s, alerts to write as firing: %s", len(stale), len(missing))
+        if dry_run:
+            return None
+        report = EventReport(results=self.resolve_stale(stale) + self.fire_missing(missing))
+        for result in report.results:
+            metrics.incr("reconcile_fixed" if result.error is None else "reconcile_failed", action=result.action)
+        return report
+
+
+def run(
+    snapshot: list[dict[str, t.Any]] | dict[str, t.Any],
+    dry_run: bool = False,
+    taken_at: datetime | None = None,
+) -> EventReport | None:
+    """Reconcile incidents in `AM2N_INCIDENTS_DB_ID` with the snapshot of active alerts taken at `taken_at`."""
+    service = get_notion_service(
+        token=settings.AM2N_NOTION_TOKEN,
+        incidents_db_id=settings.AM2N_INCIDENTS_DB_ID,
+        shifts_db_id=settings.AM2N_SHIFTS_DB_ID,
+        shifts_enabled=settings.AM2N_SHIFTS_SUPPORT_ENABLED,
+        notion_version="2022-06-28",
+        max_concurrency=settings.AM2N_NOTION_MAX_CONCURRENCY,
+    )
+    reconciler = Reconciler(service, settings.AM2N_RECONCILE_BATCH_SIZE, settings.AM2N_RECONCILE_MAX_PAGES)
+    with metrics.trace() as trace:
+        report = reconciler.run(active_alerts(snapshot, settings.AM2N_ALERTMANAGER_RECEIVER, taken_at), dry_run)
+    if report is not None:
+        log_report(report)
+    logger.info("Reconciliation finished", extra={"json_fields": trace.fields()})
+    return report
+
+
+def load_snapshot(path: str | None, url: str | None) -> tuple[list[dict[str, t.Any]] | dict[str, t.Any], datetime]:
+    """
+    Snapshot of active alerts and the time it was taken.
+
+    The snapshot is read from a JSON file, taken when the file was last modified, or from Alertmanager API if no file
+    is given.
+    """
+    if path:
+        with open(path) as file:
+            return json.load(file), datetime.fromtimestamp(os.path.getmtime(path), tz=pytz.utc)
+    if not url:
+        raise ValueError("Set AM2N_ALERTMANAGER_URL or pass --alerts or --alertmanager-url")
+    taken_at = datetime.now(tz=pytz.utc)
+    return fetch_alerts(url), taken_at
+
+
+if __name__ == "__main__":  # pragma: nocover
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alerts", help="JSON file of active alerts, e.g. saved `GET /api/v2/alerts` response")
+    parser.add_argument("--alertmanager-url", default=settings.AM2N_ALERTMANAGER_URL, help="Alertmanager base URL")
+    parser.add_argument("--dry-run", action="store_true", help="only log incidents to fix")
+    args = parser.parse_args()
+    logging_client.get()
+    snapshot, taken_at = load_snapshot(args.alerts, args.alertmanager_url)
+    run(snapshot, args.dry_run, taken_at)
@@ -0,0 +1,46 @@
+"""
+Replay Notion operations left pending or failed in the journal, e.g. after Notion was down or the worker timed out.
+
+Operations are replayed with the worker's Notion service, so they are rate limited and journaled like events.
+Run: SETTINGS_MODULE=app.settings python -m app.replay [--dry-run]
+"""
+
+import argparse
+import logging
+
+from python_settings import settings
+
+from app.event_handlers.notion import get_notion_service, journal
+from app.logs import logging_client
+from app.services.notion import EventReport, log_report
+
+logger = logging.getLogger("replay")
+
+
+def run(dry_run: bool = False) -> EventReport | None:
+    """Replay unfinished operations of `AM2N_JOURNAL_PATH`, returns None if there is nothing to replay."""
+    if (notion_journal := journal.get()) is None:
+        logger.error("Journal is disabled, set AM2N_JOURNAL_ENABLED to replay it")
+        return None
+    alerts = notion_journal.unfinished()
+    logger.info("Journal operations by state: %s, %s to replay", notion_journal.counts(), len(alerts))
+    if dry_run or not alerts:
+        return None
+    service = get_notion_service(
+        token=settings.AM2N_NOTION_TOKEN,
+        incidents_db_id=settings.AM2N_INCIDENTS_DB_ID,
+        shifts_db_id=settings.AM2N_SHIFTS_DB_ID,
+        shifts_enabled=settings.AM2N_SHIFTS_SUPPORT_ENABLED,
+        notion_version="2022-06-28",
+        max_concurrency=settings.AM2N_NOTION_MAX_CONCURRENCY,
+    )
+    report = service.handle_alerts(alerts)
+    log_report(report)
+    return report
+
+
+if __name__ == "__main__":  # pragma: nocover
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only log operations to replay")
+    logging_client.get()
+    run(parser.parse_args().dry_run)
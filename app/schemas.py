@@ -0,0 +1,71 @@
+import typing as t
+
+from functools import cached_property
+
+from pydantic import BaseModel, computed_field
+
+# --- Pydantic Schemas for Prometheus Alertmanager Webhook ---
+# https://prometheus.io/docs/alerting/latest/notifications/#data-structures
+
+
+class AlertLabels(BaseModel):
+    """Labels for an alert, used to identify and categorize the alert."""
+
+    alertname: str | None = None
+    instance: str | None = None
+    severity: str | None = None
+
+
+class AlertAnnotations(BaseModel):
+    """Annotations for an alert, providing additional information."""
+
+    description: str | None = None
+    summary: str | None = None
+
+
+class Alert(BaseModel):
+    """Represents an alert from Alertmanager."""
+
+    status: str
+    labels: AlertLabels | None = None
+    annotations: AlertAnnotations | None = None
+    startsAt: str
+    endsAt: str
+    generatorURL: str | None = None
+    fingerprint: str
+
+    @computed_field  # type: ignore
+    @property
+    def notion_status(self) -> str:
+        """Convert Alert status to Notion status."""
+        return self.status.capitalize()
+
+    @cached_property
+    def event_details(self) -> str:
+        """Alert serialized to JSON for `AMEventDetails` property, computed once per alert."""
+        return self.model_dump_json()
+
+
+class AlertmanagerEvent(BaseModel):
+    """Represents an Alertmanager event containing multiple alerts."""
+
+    receiver: str
+    status: str
+    alerts: list[Alert]
+    groupLabels: dict[str, t.Any]
+    commonLabels: dict[str, t.Any]
+    commonAnnotations: dict[str, t.Any]
+    externalURL: str
+    version: str
+    groupKey: str
+    truncatedAlerts: int
+
+
+class EventAlerts(BaseModel):
+    """
+    Alerts of an Alertmanager event, the fast path of `AlertmanagerEvent` used by the worker.
+
+    Only `alerts` are validated, other fields of the event are ignored as the worker never uses them.
+    """
+
+    alerts: list[Alert]
@@ -0,0 +1,65 @@
+import typing as t
+
+import hashlib
+import json
+import logging
+from concurrent import futures
+
+from app import metrics
+from app.services.fingerprint_index import FingerprintIndex
+
+logger = logging.getLogger("notification-dedup")
+
+# Alert fields identifying a notification, repeats and webhook retries of an unchanged alert have the same values.
+NOTIFICATION_KEY_FIELDS = ("fingerprint", "status", "startsAt", "endsAt")
+
+
+def notification_keys(payload: t.Any) -> list[str]:
+    """
+    Dedup keys of every alert of an Alertmanager payload, keyed on (groupKey, fingerprint, status, startsAt, endsAt).
+
+    Returns an empty list if the payload has no alerts or an alert without fingerprint, such payloads are never
+    deduplicated.
+    """
+    alerts = payload.get("alerts") if isinstance(payload, dict) else None
+    if not isinstance(alerts, list):
+        return []
+    keys = []
+    for alert in alerts:
+        if not isinstance(alert, dict) or not alert.get("fingerprint"):
+            return []
+        values = [payload.get("groupKey", ""), *(alert.get(field, "") for field in NOTIFICATION_KEY_FIELDS)]
+        keys.append(hashlib.sha256(json.dumps(values).encode()).hexdigest())
+    return keys
+
+
+class NotificationDeduplicator:
+    """
+    Set of already published notifications with TTL, backed by a `FingerprintIndex`.
+
+    A payload is a duplicate if all of its alerts were published with the same status and timeframe before.
+    Payloads are remembered only after Pub/Sub confirmed the message, so a failed publish is never dropped on retry.
+    """
+
+    def __init__(self, seen: FingerprintIndex) -> None:
+        """Init deduplicator."""
+        self.seen = seen
+
+    def is_duplicate(self, payload: t.Any) -> bool:
+        """Check if the payload was already published."""
+        keys = notification_keys(payload)
+        if not keys or not all(self.seen.get(key) for key in keys):
+            return False
+        metrics.incr("receiver_duplicates_dropped")
+        logger.info("Dropped duplicate notification of %s alerts", len(keys))
+        return True
+
+    def remember(self, payload: t.Any) -> None:
+        """Remember published payload."""
+        for key in notification_keys(payload):
+            self.seen.set(key, "1")
+
+    def remember_on_success(self, payload: t.Any, future: futures.Future[str]) -> None:
+        """Remember payload once its publish future succeeded, used as a done-callback."""
+        if not future.cancelled() and future.exception() is None:
+            self.remember(payload)
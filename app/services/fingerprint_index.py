@@ -0,0 +1,69 @@
+import logging
+
+from app import metrics
+from app.stores import MemoryStore, Store
+
+logger = logging.getLogger("fingerprint-index")
+
+
+class FingerprintIndex:
+    """
+    Cache of fingerprint -> value, e.g. Notion page ID in front of incidents database queries.
+
+    Lookups go to the in-process LRU first, then to the optional shared store. Hits and misses are counted in
+    `<metrics_prefix>_hits` and `<metrics_prefix>_misses` metrics. Indexes of different `kind` share a store safely.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: float = 3600,
+        max_size: int = 10000,
+        shared: Store | None = None,
+        kind: str = "page",
+        metrics_prefix: str = "fingerprint_index",
+    ) -> None:
+        """Init index, `namespace` (incidents DB ID) separates keys of different databases in the shared store."""
+        self.namespace = namespace
+        self.kind = kind
+        self.metrics_prefix = metrics_prefix
+        self.ttl = ttl
+        self.local = MemoryStore(max_size=max_size, ttl=ttl)
+        self.shared = shared
+
+    def _key(self, fingerprint: str) -> str:
+        return f"{self.kind}:{self.namespace}:{fingerprint}"
+
+    def get(self, fingerprint: str) -> str | None:
+        """Return cached value for the fingerprint."""
+        key = self._key(fingerprint)
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            try:
+                if (value := self.shared.get(key)) is not None:
+                    self.local.set(key, value)
+            except Exception:
+                logger.exception("Failed to read fingerprint %s from shared store", fingerprint)
+        metrics.incr(f"{self.metrics_prefix}_hits" if value is not None else f"{self.metrics_prefix}_misses")
+        return value
+
+    def set(self, fingerprint: str, value: str) -> None:  # noqa: A003
+        """Remember value for the fingerprint."""
+        key = self._key(fingerprint)
+        self.local.set(key, value)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value, ttl=self.ttl)
+            except Exception:
+                logger.exception("Failed to write fingerprint %s to shared store", fingerprint)
+
+    def invalidate(self, fingerprint: str) -> None:
+        """Forget value for the fingerprint, e.g. when the page was deleted or archived."""
+        key = self._key(fingerprint)
+        self.local.delete(key)
+        metrics.incr(f"{self.metrics_prefix}_invalidations")
+        if self.shared is not None:
+            try:
+                self.shared.delete(key)
+            except Exception:
+                logger.exception("Failed to delete fingerprint %s from shared store", fingerprint)
@@ -0,0 +1,234 @@
+"""
+Write-ahead journal of Notion operations, so work done before a timeout or an outage isn't repeated on redelivery.
+
+The worker appends a `pending` record for every alert before it writes to Notion and a `done` or `failed` record
+after each alert. The latest record of an idempotency key is the state of the operation, alerts whose operation was
+`done` less than `skip_ttl` seconds ago are skipped when the event is delivered again. A repeat notification of the
+alert after that is written again, e.g. to recreate a page deleted meanwhile. Operations left `pending` or `failed`
+are retried by `python -m app.replay`.
+
+Records are JSON lines in segment files of a directory, one segment per process at a time, so instances sharing the
+directory (e.g. a Cloud Storage bucket mounted with Cloud Storage FUSE) never append to the same file. A process starts
+a new segment once its segment reaches `max_segment_bytes` or is `retention` seconds old. Segments are read from the
+offset of the previous read and only when they grew past it. Records older than `retention` seconds are forgotten
+every `PRUNE_INTERVAL` seconds and segments not written for that long are deleted.
+"""
+
+import typing as t
+
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from app import metrics
+from app.schemas import Alert
+
+logger = logging.getLogger("notion-journal")
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+SEGMENT_SUFFIX = ".jsonl"
+PRUNE_INTERVAL = 60
+
+
+def idempotency_key(alert: Alert) -> str:
+    """Key of the Notion operation of the alert, the same for a redelivered event and a repeat notification."""
+    raw = "\0".join((alert.fingerprint, alert.notion_status, alert.startsAt, alert.endsAt))
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+class Journal:
+    """Append-only journal of Notion operations in JSON lines segment files, see the module docstring."""
+
+    def __init__(
+        self,
+        path: str,
+        retention: float = 86400,
+        skip_ttl: float = 3600,
+        max_segment_bytes: int = 16 * 2**20,
+    ) -> None:
+        """Init journal in the directory, it's created if it doesn't exist."""
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.retention = retention
+        self.skip_ttl = skip_ttl
+        self.max_segment_bytes = max_segment_bytes
+        self.segment = self._new_segment()
+        self._lock = threading.Lock()
+        self._fd: int | None = None
+        self._opened = 0.0
+        self._written = 0
+        # Latest record of every key and read offsets of segments.
+        self._records: dict[str, dict[str, t.Any]] = {}
+        self._offsets: dict[Path, int] = {}
+        self._pruned_at = float("-inf")
+
+    def _new_segment(self) -> Path:
+        return self.path / f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}{SEGMENT_SUFFIX}"
+
+    def _rotate(self) -> None:
+        """Start a new segment, the full one is read already and is deleted once it expires."""
+        if self._fd is None:
+            return
+        os.close(self._fd)
+        self._fd = None
+        self._offsets[self.segment] = self._written
+        self.segment = self._new_segment()
+        metrics.incr("journal_rotations")
+
+    def _append(self, records: list[dict[str, t.Any]], sync: bool = False) -> None:
+        data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records).encode()
+        with self._lock:
+            if self._written >= self.max_segment_bytes or time.monotonic() - self._opened >= self.retention:
+                self._rotate()
+            if self._fd is None:
+                self._fd = os.open(self.segment, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+                self._opened, self._written = time.monotonic(), 0
+            os.write(self._fd, data)
+            self._written += len(data)
+            if sync:
+                os.fsync(self._fd)
+            for record in records:
+                self._records[record["key"]] = record
+        metrics.incr("journal_records", len(records))
+
+    def _read_segment(self, segment: Path) -> None:
+        offset = self._offsets.get(segment, 0)
+        with segment.open("rb") as file:
+            file.seek(offset)
+            data = file.read()
+        # A record being appended by another instance is read next time.
+        complete = data[: data.rfind(b"\n") + 1]
+        self._offsets[segment] = offset + len(complete)
+        for line in complete.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning("Skip malformed journal record in %s: %r", segment, line)
+                continue
+            self._records[record["key"]] = record
+
+    def _refresh_segment(self, segment: Path, expires_before: float) -> None:
+        """Delete the segment if it expired, otherwise read it if it grew since the previous read."""
+        try:
+            stat = segment.stat()
+        except FileNotFoundError:
+            # Deleted by another instance.
+            self._offsets.pop(segment, None)
+            return
+        if stat.st_mtime < expires_before:
+            segment.unlink(missing_ok=True)
+            self._offsets.pop(segment, None)
+        elif stat.st_size > self._offsets.get(segment, 0):
+            self._read_segment(segment)
+
+    def _prune(self, expires_before: float) -> None:
+        self._records = {key: record for key, record in self._records.items() if record["at"] >= expires_before}
+        self._pruned_at = time.monotonic()
+
+    def refresh(self) -> None:
+        """Read records appended by other instances, forget expired records and delete expired segments."""
+        expires_before = time.time() - self.retention
+        with self._lock:
+            segments = sorted(self.path.glob(f"*{SEGMENT_SUFFIX}"))
+            # Segments deleted by other instances.
+            for segment in self._offsets.keys() - set(segments):
+                del self._offsets[segment]
+            for segment in segments:
+                if segment != self.segment:
+                    self._refresh_segment(segment, expires_before)
+            if time.monotonic() - self._pruned_at >= PRUNE_INTERVAL:
+                self._prune(expires_before)
+
+    def state(self, alert: Alert) -> str | None:
+        """State of the alert's operation, None if it's not journaled."""
+        record = self._records.get(idempotency_key(alert))
+        return record["state"] if record else None
+
+    def recently_done(self, alert: Alert, now: float) -> bool:
+        """Whether the alert's operation was done less than `skip_ttl` seconds ago."""
+        record = self._records.get(idempotency_key(alert))
+        return record is not None and record["state"] == DONE and record["at"] >= now - self.skip_ttl
+
+    def begin(self, alerts: list[Alert]) -> tuple[list[Alert], list[Alert]]:
+        """
+        Journal alerts as pending before they are written to Notion, returns alerts to process and recently done ones.
+
+        Pending records are synced to disk, so they survive the instance.
+        """
+        self.refresh()
+        now = time.time()
+        todo: list[Alert] = []
+        done: list[Alert] = []
+        for alert in alerts:
+            (done if self.recently_done(alert, now) else todo).append(alert)
+        pending = [
+            {
+                "key": idempotency_key(alert),
+                "fingerprint": alert.fingerprint,
+                "state": PENDING,
+                "at": now,
+                "alert": alert.model_dump(mode="json", exclude=set(Alert.model_computed_fields)),
+            }
+            for alert in todo
+        ]
+        if pending:
+            self._append(pending, sync=True)
+        return todo, done
+
+    def finish(self, alert: Alert, page_id: str | None = None, error: str | None = None) -> None:
+        """Journal result of the alert's operation, it's written at once so progress survives a timeout."""
+        record: dict[str, t.Any] = {
+            "key": idempotency_key(alert),
+            "fingerprint": alert.fingerprint,
+            "state": FAILED if error else DONE,
+            "at": time.time(),
+        }
+        if error:
+            record |= {"error": error, "alert": alert.model_dump(mode="json", exclude=set(Alert.model_computed_fields))}
+        else:
+            record["page_id"] = page_id
+        self._append([record])
+
+    def unfinished(self) -> list[Alert]:
+        """
+        Alerts of operations that are still pending or failed, in journal order.
+
+        Operations of a fingerprint done later (e.g. the alert was resolved since) are left out, so a replay never
+        writes an older status over a newer one.
+        """
+        self.refresh()
+        with self._lock:
+            records = list(self._records.values())
+        done_at: dict[str, float] = {}
+        for record in records:
+            if record["state"] == DONE:
+                done_at[record["fingerprint"]] = max(record["at"], done_at.get(record["fingerprint"], 0))
+        return [
+            Alert.model_validate(record["alert"])
+            for record in records
+            if record["state"] != DONE and record["at"] > done_at.get(record["fingerprint"], 0)
+        ]
+
+    def counts(self) -> dict[str, int]:
+        """Number of operations by state."""
+        self.refresh()
+        counts: dict[str, int] = {}
+        with self._lock:
+            for record in self._records.values():
+                counts[record["state"]] = counts.get(record["state"], 0) + 1
+        return counts
+
+    def close(self) -> None:
+        """Close own segment file."""
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
@@ -0,0 +1,118 @@
+"""
+Leases on fingerprints, so only one of concurrent workers creates the incident page of an alert.
+
+A worker that finds no page for a fingerprint claims its lease before creating the page. Other workers wait until
+the winner publishes the ID of the created page and update it instead. Page IDs are published in the store rather
+than looked up again, because a new page may not be found by `databases.query` right after it's created.
+If the winner fails, the lease is released and the next worker claims it. A lease expires after `ttl` seconds,
+so a crashed worker doesn't block the fingerprint. `ttl` must be longer than the slowest create (the shift lookup and
+the create call, each up to `AM2N_NOTION_CALL_DEADLINE`), otherwise another worker claims the expired lease and
+creates a second page. A lease is released only by the worker holding it, so a worker whose lease expired never
+releases the lease of another one. A worker that times out waiting for the lease and doesn't find the page in Notion
+fails the alert with `LeaseBusy` instead of creating a second page, the alert is retried on redelivery.
+"""
+
+import typing as t
+
+import asyncio
+import logging
+import time
+import uuid
+
+from app import metrics
+from app.stores import Store
+
+logger = logging.getLogger("fingerprint-leases")
+
+
+class LeaseBusy(Exception):
+    """Another worker still holds the lease and its page isn't found yet, the alert is retried later."""
+
+    pass
+
+
+class Claim(t.NamedTuple):
+    """Result of claiming a lease: `token` if the lease is won, `page_id` if another worker created the page."""
+
+    token: str | None = None
+    page_id: str | None = None
+
+    @property
+    def busy(self) -> bool:
+        """Whether another worker holds the lease and hasn't created the page yet."""
+        return self.token is None and self.page_id is None
+
+
+class FingerprintLeases:
+    """Leases on fingerprints in a store shared by workers, see the module docstring."""
+
+    def __init__(
+        self,
+        store: Store,
+        namespace: str,
+        ttl: float = 120,
+        wait: float = 10,
+        poll_interval: float = 0.1,
+        page_ttl: float = 3600,
+    ) -> None:
+        """Init leases, losers wait up to `wait` seconds for the page, published pages are kept for `page_ttl`."""
+        self.store = store
+        self.namespace = namespace
+        self.ttl = ttl
+        self.wait = wait
+        self.poll_interval = poll_interval
+        self.page_ttl = page_ttl
+
+    def _lease_key(self, fingerprint: str) -> str:
+        return f"lease:{self.namespace}:{fingerprint}"
+
+    def _page_key(self, fingerprint: str) -> str:
+        return f"lease-page:{self.namespace}:{fingerprint}"
+
+    def try_claim(self, fingerprint: str) -> Claim:
+        """Claim the lease once without waiting."""
+        if page_id := self.store.get(self._page_key(fingerprint)):
+            return Claim(page_id=page_id)
+        token = uuid.uuid4().hex
+        if self.store.add(self._lease_key(fingerprint), token, ttl=self.ttl):
+            return Claim(token=token)
+        return Claim()
+
+    def _result(self, fingerprint: str, claim: Claim) -> Claim:
+        if claim.token:
+            metrics.incr("fingerprint_leases_won")
+        elif claim.page_id:
+            metrics.incr("fingerprint_leases_lost")
+            logger.info("Page of fingerprint %s was created by another worker: %s", fingerprint, claim.page_id)
+        else:
+            metrics.incr("fingerprint_leases_timeouts")
+            logger.warning("Lease of fingerprint %s is still held after %ss", fingerprint, self.wait)
+        return claim
+
+    def claim(self, fingerprint: str) -> Claim:
+        """Claim the lease, waiting up to `wait` seconds while another worker holds it; busy claim on timeout."""
+        deadline = time.monotonic() + self.wait
+        while (claim := self.try_claim(fingerprint)).busy and time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+        return self._result(fingerprint, claim)
+
+    async def claim_async(self, fingerprint: str) -> Claim:
+        """Claim the lease like `claim`, the store is called in a thread so the event loop isn't blocked."""
+        deadline = time.monotonic() + self.wait
+        while (claim := await asyncio.to_thread(self.try_claim, fingerprint)).busy and time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+        return self._result(fingerprint, claim)
+
+    def release(self, fingerprint: str, claim: Claim, page_id: str | None) -> None:
+        """Publish ID of the page created under the won lease and release it, None if creation failed."""
+        if not claim.token:
+            return
+        if page_id:
+            self.store.set(self._page_key(fingerprint), page_id, ttl=self.page_ttl)
+        if not self.store.delete_if_equal(self._lease_key(fingerprint), claim.token):
+            metrics.incr("fingerprint_leases_expired")
+            logger.warning("Lease of fingerprint %s expired before it was released, raise AM2N_LEASE_TTL", fingerprint)
+
+    def forget(self, fingerprint: str) -> None:
+        """Forget published page of the fingerprint, e.g. after it was deleted."""
+        self.store.delete(self._page_key(fingerprint))
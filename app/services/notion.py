@@ -1,66 +1,54 @@
 import typing as t
 
+import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import httpx
 import pytz
-from notion_client import Client
+from notion_client import APIErrorCode, APIResponseError, Client
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
 from pydantic import BaseModel, computed_field
 from python_settings import settings
 
-logger = logging.getLogger("notion-service")
-
-# --- Pydantic Schemas for Prometheus Alertmanager Webhook ---
-# https://prometheus.io/docs/alerting/latest/notifications/#data-structures
-
-
-class AlertLabels(BaseModel):
-    """Labels for an alert, used to identify and categorize the alert."""
+from app import metrics
+from app.schemas import Alert, EventAlerts
+from app.services.fingerprint_index import FingerprintIndex
+from app.services.journal import Journal
+from app.services.leases import Claim, FingerprintLeases, LeaseBusy
+from app.services.open_incidents import OpenIncidents
+from app.services.shift_cache import SHIFT_LOOKUP_ERRORS, ShiftCache
 
-    alertname: str | None = None
-    instance: str | None = None
-    severity: str | None = None
+logger = logging.getLogger("notion-service")
 
 
-class AlertAnnotations(BaseModel):
-    """Annotations for an alert, providing additional information."""
+class AlertResult(BaseModel):
+    """Result of processing a single alert."""
 
-    description: str | None = None
-    summary: str | None = None
+    fingerprint: str
+    status: str
+    action: str | None = None
+    error: str | None = None
+    # Whether the alert may succeed when the event is delivered again.
+    retryable: bool = False
 
 
-class Alert(BaseModel):
-    """Represents an alert from Alertmanager."""
+class EventReport(BaseModel):
+    """Per-alert report of processing an Alertmanager event."""
 
-    status: str
-    labels: AlertLabels | None = None
-    annotations: AlertAnnotations | None = None
-    startsAt: str
-    endsAt: str
-    generatorURL: str | None = None
-    fingerprint: str
+    results: list[AlertResult] = []
 
     @computed_field  # type: ignore
     @property
-    def notion_status(self) -> str:
-        """Convert Alert status to Notion status."""
-        return self.status.capitalize()
-
+    def failed(self) -> list[AlertResult]:
+        """Results of alerts that failed to process."""
+        return [result for result in self.results if result.error is not None]
 
-class AlertmanagerEvent(BaseModel):
-    """Represents an Alertmanager event containing multiple alerts."""
-
-    receiver: str
-    status: str
-    alerts: list[Alert]
-    groupLabels: dict[str, t.Any]
-    commonLabels: dict[str, t.Any]
-    commonAnnotations: dict[str, t.Any]
-    externalURL: str
-    version: str
-    groupKey: str
-    truncatedAlerts: int
+    @property
+    def retryable(self) -> list[AlertResult]:
+        """Results of alerts that failed and may succeed when the event is delivered again."""
+        return [result for result in self.failed if result.retryable]
 
 
 # --- NotionService ---
@@ -73,14 +61,202 @@ INCIDENT_SHIFT_ATTRIBUTE_NAME = "Shift"
 FIND_FOR_CURRENT_SHIFT_TYPE_ENABLED = (
     FIND_FOR_CURRENT_SHIFT_TYPE_ATTRIBUTE_NAME and FIND_FOR_CURRENT_SHIFT_TYPE_ATTRIBUTE_VALUE
 )
+# Notion allows up to 100 conditions in a compound filter and returns up to 100 results per page.
+FINGERPRINT_LOOKUP_CHUNK_SIZE = 100
+QUERY_PAGE_SIZE = 100
+
+
+def fingerprint_filter(fingerprints: list[str]) -> dict[str, t.Any]:
+    """Build `databases.query` filter matching pages with any of the fingerprints."""
+    conditions = [{"property": "AMFingerprint", "rich_text": {"equals": fingerprint}} for fingerprint in fingerprints]
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"or": conditions}
+
+
+def query_pages(
+    client: Client,
+    database_id: str,
+    filter_condition: dict[str, t.Any],
+    sorts: list[dict[str, t.Any]] | None = None,
+) -> t.Iterator[dict[str, t.Any]]:
+    """Iterate over all pages of the database matching the filter, following `start_cursor` pagination."""
+    query: dict[str, t.Any] = {"filter": filter_condition, "page_size": QUERY_PAGE_SIZE}
+    if sorts:
+        query["sorts"] = sorts
+    while True:
+        resp: dict[str, t.Any] = client.databases.query(database_id=database_id, **query)  # type: ignore
+        yield from resp.get("results", [])
+        if not resp.get("has_more") or not resp.get("next_cursor"):
+            return
+        query["start_cursor"] = resp["next_cursor"]
 
 
-class NotionService:
-    """
-    Service for interacting with Notion API to manage pages in an Incident Database based on Alertmanager events.
+def is_stale_page_error(error: Exception) -> bool:
+    """Whether the error means that the incident page was deleted or archived."""
+    if not isinstance(error, APIResponseError):
+        return False
+    return error.code == APIErrorCode.ObjectNotFound or (
+        error.code == APIErrorCode.ValidationError and "archived" in str(error)
+    )
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Whether an alert that failed with the error may succeed later: Notion rate limit, server and transport errors."""
+    if isinstance(error, HTTPResponseError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, httpx.TransportError | RequestTimeoutError | LeaseBusy)
+
+
+def get_page_fingerprint(page: dict[str, t.Any]) -> str:
+    """Return `AMFingerprint` value of a Notion page."""
+    rich_text = page.get("properties", {}).get("AMFingerprint", {}).get("rich_text", [])
+    return "".join(part.get("plain_text") or part.get("text", {}).get("content", "") for part in rich_text)
+
+
+def status_properties(alert: Alert) -> dict[str, t.Any]:
+    """Build incident page properties updated with alert's status."""
+    properties: dict[str, t.Any] = {
+        "AMStatus": {"select": {"name": alert.notion_status}},
+    }
+    if alert.notion_status == "Resolved":
+        properties["Incident Timeframe"] = {
+            "date": {
+                "start": alert.startsAt,
+                "end": alert.endsAt,
+            },
+        }
+    return properties
+
+
+def incident_properties(
+    alert: Alert,
+    shift_page_id: t.Any,
+    shift_responsible: list[dict[str, t.Any]],
+) -> dict[str, t.Any]:
+    """Build properties of a new incident page."""
+    properties: dict[str, t.Any] = {
+        "Name": {
+            "title": [
+                {"text": {"content": "Incident (Created Automatically)"}},
+            ],
+        },
+        "Incident Timeframe": {
+            "date": {
+                "start": alert.startsAt,
+                "end": None,
+            },
+        },
+        "AMFingerprint": {"rich_text": [{"text": {"content": alert.fingerprint}}]},
+        "AMStatus": {"select": {"name": alert.notion_status}},
+        "AMEventDetails": {"rich_text": [{"text": {"content": alert.event_details}}]},
+    }
+    # Assign responsible from Shifts if enabled
+    if shift_page_id:
+        properties[INCIDENT_SHIFT_ATTRIBUTE_NAME] = {"relation": [{"id": shift_page_id}]}
+        properties[INCIDENT_RESPONSIBLE_ATTRIBUTE_NAME] = {"people": shift_responsible}
+    return properties
+
+
+def shift_filter(today: str) -> dict[str, t.Any]:
+    """Build Shifts DB filter for the shift of the date."""
+    # Prepare filter condition based on whether shift type filtering is enabled
+    if FIND_FOR_CURRENT_SHIFT_TYPE_ENABLED:
+        return {
+            "and": [
+                {"property": "Date", "date": {"equals": today}},
+                {
+                    "property": FIND_FOR_CURRENT_SHIFT_TYPE_ATTRIBUTE_NAME,
+                    "select": {"equals": FIND_FOR_CURRENT_SHIFT_TYPE_ATTRIBUTE_VALUE},
+                },
+            ],
+        }
+    return {"property": "Date", "date": {"equals": today}}
+
+
+def current_shift_type() -> str:
+    """Shift type the shift is looked up for, empty if shift types are not used."""
+    return FIND_FOR_CURRENT_SHIFT_TYPE_ATTRIBUTE_VALUE if FIND_FOR_CURRENT_SHIFT_TYPE_ENABLED else ""
 
-    Supports Shifts table for auto-assigning incidents.
-    """
+
+def parse_shift(resp: dict[str, t.Any]) -> tuple[t.Any, list[dict[str, t.Any]]]:
+    """Return shift ID and responsible persons from Shifts DB query response."""
+    if shift_page := next(iter(resp.get("results", [])), None):
+        responsible = shift_page["properties"].get(SHIFT_RESPONSIBLE_ATTRIBUTE_NAME, {}).get("people", [])
+        logger.info("Found shift for today: %s, responsible: %s", shift_page["id"], responsible)
+
+        return shift_page["id"], responsible
+
+    logger.info("No shift_page found for today's shift")
+    return None, []
+
+
+def group_by_fingerprint(alerts: list[Alert]) -> dict[str, list[Alert]]:
+    """Group alerts by fingerprint keeping their order."""
+    by_fingerprint: dict[str, list[Alert]] = {}
+    for alert in alerts:
+        by_fingerprint.setdefault(alert.fingerprint, []).append(alert)
+    return by_fingerprint
+
+
+def failed_report(alerts: list[Alert], error: Exception) -> EventReport:
+    """Report all alerts as failed with the error."""
+    return EventReport(
+        results=[
+            AlertResult(
+                fingerprint=alert.fingerprint,
+                status=alert.status,
+                error=repr(error),
+                retryable=is_retryable_error(error),
+            )
+            for alert in alerts
+        ],
+    )
+
+
+def validated_batches(
+    alerts: t.Iterable[t.Any],
+    failed: list[AlertResult],
+    size: int = FINGERPRINT_LOOKUP_CHUNK_SIZE,
+) -> t.Iterator[list[Alert]]:
+    """Validate alerts parsed one at a time and yield them in batches, invalid alerts are added to `failed`."""
+    batch: list[Alert] = []
+    for data in alerts:
+        try:
+            with metrics.stage("validate"):
+                batch.append(Alert.model_validate(data))
+        except ValueError as e:
+            logger.exception("Failed to parse alert: %s", data)
+            item = data if isinstance(data, dict) else {}
+            failed.append(
+                AlertResult(
+                    fingerprint=str(item.get("fingerprint", "")),
+                    status=str(item.get("status", "")),
+                    error=repr(e),
+                ),
+            )
+            continue
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def log_report(report: EventReport) -> None:
+    """Log failed alerts of the event."""
+    if report.failed:
+        logger.error(
+            "Failed to process %s of %s alerts: %s",
+            len(report.failed),
+            len(report.results),
+            [result.fingerprint for result in report.failed],
+        )
+    logger.info("Finished processing Alertmanager event")
+
+
+class BaseNotionService:
+    """Configuration and caches shared by sync and async Notion services."""
 
     def __init__(
         self,
@@ -89,50 +265,219 @@ class NotionService:
         shifts_db_id: str,
         shifts_enabled: bool,
         notion_version: str = "2022-06-28",
+        max_concurrency: int = 1,
+        index: FingerprintIndex | None = None,
+        shift_cache: ShiftCache | None = None,
+        status_tracker: FingerprintIndex | None = None,
+        journal: Journal | None = None,
+        leases: FingerprintLeases | None = None,
+        open_incidents: OpenIncidents | None = None,
     ):
-        """Initialize NotionService with required parameters."""
+        """
+        Initialize service with required parameters.
+
+        `max_concurrency` limits how many alerts with distinct fingerprints are processed at the same time.
+        Keep it low, Notion allows about 3 requests per second per integration.
+        `index` caches fingerprint -> page ID, so repeat notifications don't query the incidents database.
+        `shift_cache` caches today's shift, so only the first incident of the day queries the shifts database.
+        `status_tracker` keeps the last status written for each fingerprint, so repeat notifications don't
+        update pages that already have it.
+        `journal` records every alert's operation before and after it's written to Notion, so alerts done by
+        an earlier delivery of the event are skipped.
+        `leases` let only one of concurrent workers create the page of a fingerprint, the others update it.
+        `open_incidents` is a preloaded map of open incidents, so lookups and no-op updates of open incidents
+        don't call Notion.
+        `http_client` of services is used for Notion API calls, e.g. with `RateLimitedTransport` to respect
+        Notion's rate limits.
+        """
         self.token = token
         self.incidents_db_id = incidents_db_id
         self.shifts_db_id = shifts_db_id
         self.shifts_enabled = shifts_enabled
         self.notion_version = notion_version
-        self.client = Client(auth=token)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.index = index
+        self.shift_cache = shift_cache
+        self.status_tracker = status_tracker
+        self.journal = journal
+        self.leases = leases
+        self.open_incidents = open_incidents
+
+    def remember_page(self, fingerprint: str, page_id: str) -> None:
+        """Remember incident page of the fingerprint."""
+        if self.index:
+            self.index.set(fingerprint, page_id)
+
+    def remember_status(self, page_id: str, fingerprint: str, status: str, start: str, end: str | None) -> None:
+        """Remember status and timeframe written to the incident page."""
+        if self.status_tracker:
+            state = {"page_id": page_id, "status": status, "start": start, "end": end}
+            self.status_tracker.set(fingerprint, json.dumps(state))
+        if self.open_incidents:
+            self.open_incidents.record(fingerprint, page_id, status)
+
+    def is_status_written(self, page_id: str, alert: Alert) -> bool:
+        """Whether the page already has alert's status (and timeframe for resolved alerts)."""
+        if not self.status_tracker or not (state := self.status_tracker.get(alert.fingerprint)):
+            return False
+        written = json.loads(state)
+        if written["page_id"] != page_id or written["status"] != alert.notion_status:
+            return False
+        return alert.notion_status != "Resolved" or (written["start"], written["end"]) == (alert.startsAt, alert.endsAt)
+
+    def is_open_with_status(self, page_id: str, alert: Alert) -> bool:
+        """Whether the preloaded open incident of the alert is the page and already has alert's status."""
+        if not self.open_incidents or alert.notion_status == "Resolved":
+            return False
+        incident = self.open_incidents.get(alert.fingerprint)
+        return incident is not None and (incident.page_id, incident.status) == (page_id, alert.notion_status)
+
+    def skip_update(self, page_id: str, alert: Alert) -> bool:
+        """Whether the update is a no-op and can be skipped."""
+        if self.is_status_written(page_id, alert) or self.is_open_with_status(page_id, alert):
+            metrics.incr("notion_writes_suppressed")
+            logger.info("Notion page %s already has status %s, update skipped", page_id, alert.notion_status)
+            return True
+        return False
+
+    def journal_begin(self, alerts: list[Alert]) -> tuple[list[Alert], list[AlertResult]]:
+        """Journal alerts as pending, returns alerts to process and results of alerts done by an earlier delivery."""
+        if not self.journal:
+            return alerts, []
+        todo, done = self.journal.begin(alerts)
+        if done:
+            metrics.incr("journal_skipped", len(done))
+            logger.info("Skip %s alerts already written to Notion according to the journal", len(done))
+        return todo, [
+            AlertResult(fingerprint=alert.fingerprint, status=alert.status, action="skipped") for alert in done
+        ]
+
+    def journal_finish(self, alert: Alert, result: AlertResult, page_id: str | None) -> None:
+        """Journal result of the alert's operation."""
+        if self.journal:
+            self.journal.finish(alert, page_id, result.error)
+
+    def forget_page(self, fingerprint: str) -> None:
+        """Forget stale page of the fingerprint."""
+        if self.index:
+            self.index.invalidate(fingerprint)
+        if self.leases:
+            self.leases.forget(fingerprint)
+        if self.open_incidents:
+            self.open_incidents.forget(fingerprint)
+
+    def found_after_timeout(self, fingerprint: str, page_id: str | None) -> Claim:
+        """
+        Claim of the page found in Notion after the lease wait timed out.
+
+        Raises `LeaseBusy` if it's not found: the lease holder may still be creating it, so a new page is not created.
+        """
+        if not page_id:
+            raise LeaseBusy(f"Lease of fingerprint {fingerprint} is held by another worker and its page isn't found")
+        return Claim(page_id=page_id)
+
+    def created_elsewhere(self, fingerprint: str, claim: Claim) -> str | None:
+        """Page of the fingerprint created by another worker holding its lease."""
+        if claim.page_id:
+            self.remember_page(fingerprint, claim.page_id)
+        return claim.page_id
+
+    def known_page(self, fingerprint: str) -> str | None:
+        """Page of the fingerprint found in open incidents or the index, without calling Notion."""
+        if self.open_incidents and (incident := self.open_incidents.get(fingerprint)):
+            return incident.page_id
+        return self.index.get(fingerprint) if self.index else None
+
+    def cached_pages(self, fingerprints: list[str]) -> dict[str, str]:
+        """Return pages of fingerprints found in open incidents or the index."""
+        return {fingerprint: page_id for fingerprint in fingerprints if (page_id := self.known_page(fingerprint))}
+
+    def can_forget_page(self, error: Exception) -> bool:
+        """Whether the error means a remembered page is stale and the fingerprint should be looked up again."""
+        return bool(self.index or self.open_incidents) and is_stale_page_error(error)
+
+    def log_shifts_disabled(self) -> None:
+        """Log that shifts are not looked up."""
+        logger.info(
+            "Shifts support is not enabled or Shifts DB ID is not set: %s, %s",
+            settings.AM2N_SHIFTS_SUPPORT_ENABLED,
+            settings.AM2N_SHIFTS_DB_ID,
+        )
+
+
+class NotionService(BaseNotionService):
+    """
+    Service for interacting with Notion API to manage pages in an Incident Database based on Alertmanager events.
+
+    Supports Shifts table for auto-assigning incidents.
+    """
+
+    def __init__(self, *args: t.Any, http_client: httpx.Client | None = None, **kwargs: t.Any) -> None:
+        """Initialize NotionService, see `BaseNotionService` for parameters."""
+        super().__init__(*args, **kwargs)
+        self.client = Client(auth=self.token, client=http_client)
 
     def find_incident_page_by_fingerprint(self, fingerprint: str) -> str | None:
         """Find a Notion page by its `AMFingerprint` value."""
-        resp = self.client.databases.query(
-            database_id=self.incidents_db_id,
-            filter={
-                "property": "AMFingerprint",
-                "rich_text": {"equals": fingerprint},
-            },
-        )
+        if page_id := self.known_page(fingerprint):
+            logger.info("Fingerprint %s found in memory, page ID: %s", fingerprint, page_id)
+            return page_id
+        with metrics.stage("lookup"):
+            resp = self.client.databases.query(
+                database_id=self.incidents_db_id,
+                filter={
+                    "property": "AMFingerprint",
+                    "rich_text": {"equals": fingerprint},
+                },
+            )
         if incident_page := next(iter(resp.get("results", [])), None):  # type: ignore
             logger.info("Fingerprint %s found in Notion, page ID: %s", fingerprint, incident_page["id"])
+            self.remember_page(fingerprint, incident_page["id"])
             return incident_page["id"]
 
         logger.debug("Fingerprint %s not found in Notion, response=%s", fingerprint, resp)
 
         return None
 
+    def query_incident_pages(self, filter_condition: dict[str, t.Any]) -> t.Iterator[dict[str, t.Any]]:
+        """Iterate over all incident pages matching the filter, following `start_cursor` pagination."""
+        yield from query_pages(self.client, self.incidents_db_id, filter_condition)
+
+    def find_incident_pages_by_fingerprints(self, fingerprints: t.Iterable[str]) -> dict[str, str]:
+        """
+        Find Notion pages for many fingerprints at once.
+
+        Fingerprints are resolved with compound `or` filters in chunks of `FINGERPRINT_LOOKUP_CHUNK_SIZE`,
+        so N fingerprints cost about ceil(N / chunk size) queries. Fingerprints found in the index are not queried.
+        Returns fingerprint -> page ID map, fingerprints without a page are missing in it.
+        """
+        unique_fingerprints = list(dict.fromkeys(fingerprints))
+        with metrics.stage("lookup"):
+            pages = self.cached_pages(unique_fingerprints)
+            missing = [fingerprint for fingerprint in unique_fingerprints if fingerprint not in pages]
+            for start in range(0, len(missing), FINGERPRINT_LOOKUP_CHUNK_SIZE):
+                chunk = missing[start : start + FINGERPRINT_LOOKUP_CHUNK_SIZE]
+                for page in self.query_incident_pages(fingerprint_filter(chunk)):
+                    fingerprint = get_page_fingerprint(page)
+                    if fingerprint not in pages:
+                        pages[fingerprint] = page["id"]
+                        self.remember_page(fingerprint, page["id"])
+        logger.info("Found %s of %s fingerprints in Notion", len(pages), len(unique_fingerprints))
+
+        return pages
+
     def update_incident_status(self, page_id: str, alert: Alert) -> None:
-        """Update the status of an incident."""
+        """Update the status of an incident, the update is skipped if the page already has the status."""
         status = alert.notion_status
-        properties = {
-            "AMStatus": {"select": {"name": status}},
-        }
-        if status == "Resolved":
-            properties["Incident Timeframe"] = {
-                "date": {
-                    "start": alert.startsAt,
-                    "end": alert.endsAt,
-                },
-            }
-        self.client.pages.update(
-            page_id=page_id,
-            properties=properties,
-        )
+        if self.skip_update(page_id, alert):
+            return
+        with metrics.stage("update"):
+            self.client.pages.update(
+                page_id=page_id,
+                properties=status_properties(alert),
+            )
         logger.info(f"Updated Notion page {page_id} with status {status}")
+        self.remember_status(page_id, alert.fingerprint, status, alert.startsAt, alert.endsAt)
 
     def _get_shift(self) -> tuple[int | None, list[dict[str, t.Any]]]:
         """
@@ -141,91 +486,163 @@ class NotionService:
         Returns a tuple of shift ID and list of responsible persons.
         """
         if not self.shifts_enabled:
-            logger.info(
-                "Shifts support is not enabled or Shifts DB ID is not set: %s, %s",
-                settings.AM2N_SHIFTS_SUPPORT_ENABLED,
-                settings.AM2N_SHIFTS_DB_ID,
-            )
+            self.log_shifts_disabled()
             return None, []
 
         today = datetime.now(tz=pytz.utc).date().isoformat()
-        # Prepare filter condition based on whether shift type filtering is enabled
-        filter_condition: dict[str, t.Any]
-        if FIND_FOR_CURRENT_SHIFT_TYPE_ENABLED:
-            filter_condition = {
-                "and": [
-                    {"property": "Date", "date": {"equals": today}},
-                    {
-                        "property": FIND_FOR_CURRENT_SHIFT_TYPE_ATTRIBUTE_NAME,
-                        "select": {"equals": FIND_FOR_CURRENT_SHIFT_TYPE_ATTRIBUTE_VALUE},
-                    },
-                ],
-            }
-        else:
-            filter_condition = {"property": "Date", "date": {"equals": today}}
-        logger.debug("filter condition for shifts: %s", filter_condition)
-        # This query assumes that only one shift exist, according filter condition. At least it takes the first one.
         try:
-            resp = self.client.databases.query(
-                database_id=self.shifts_db_id,
-                filter=filter_condition,
-                page_size=1,
-            )
-            logger.debug("Query response for shifts: %s", resp)
-        except httpx.HTTPError:
+            with metrics.stage("shift"):
+                if self.shift_cache is None:
+                    return self._query_shift(today)
+                return self.shift_cache.get_or_load(today, current_shift_type(), lambda: self._query_shift(today))
+        except SHIFT_LOOKUP_ERRORS:
             logger.exception("Failed to query Notion shifts database: %s", self.shifts_db_id)
             return None, []
 
-        if shift_page := next(iter(resp.get("results", [])), None):  # type: ignore
-            responsible = shift_page["properties"].get(SHIFT_RESPONSIBLE_ATTRIBUTE_NAME, {}).get("people", [])
-            logger.info("Found shift for today: %s, responsible: %s", shift_page["id"], responsible)
-
-            return shift_page["id"], responsible
+    def _query_shift(self, today: str) -> tuple[int | None, list[dict[str, t.Any]]]:
+        """Query Shifts DB for the shift of the date."""
+        filter_condition = shift_filter(today)
+        logger.debug("filter condition for shifts: %s", filter_condition)
+        # This query assumes that only one shift exist, according filter condition. At least it takes the first one.
+        resp = self.client.databases.query(
+            database_id=self.shifts_db_id,
+            filter=filter_condition,
+            page_size=1,
+        )
+        logger.debug("Query response for shifts: %s", resp)
 
-        logger.info("No shift_page found for today's shift")
-        return None, []
+        return parse_shift(resp)  # type: ignore
 
-    def create_incident_page_from_alert(self, alert: Alert) -> None:
+    def create_incident_page_from_alert(self, alert: Alert) -> str:
         """Create a new Notion page in the incidents database from an Alertmanager alert."""
-        properties: dict[str, t.Any] = {
-            "Name": {
-                "title": [
-                    {"text": {"content": "Incident (Created Automatically)"}},
-                ],
-            },
-            "Incident Timeframe": {
-                "date": {
-                    "start": alert.startsAt,
-                    "end": None,
-                },
-            },
-            "AMFingerprint": {"rich_text": [{"text": {"content": alert.fingerprint}}]},
-            "AMStatus": {"select": {"name": alert.notion_status}},
-            "AMEventDetails": {"rich_text": [{"text": {"content": alert.model_dump_json()}}]},
-        }
-        # Assign responsible from Shifts if enabled
-        shift_page_id, shift_responsible = self._get_shift()
-        if shift_page_id:
-            properties[INCIDENT_SHIFT_ATTRIBUTE_NAME] = {"relation": [{"id": shift_page_id}]}
-            properties[INCIDENT_RESPONSIBLE_ATTRIBUTE_NAME] = {"people": shift_responsible}
-
-        self.client.pages.create(
-            parent={"database_id": self.incidents_db_id},
-            properties=properties,
-        )
-        logger.info("Created new Notion page for fingerprint: %s and properties: %s", alert.fingerprint, properties)
+        properties = incident_properties(alert, *self._get_shift())
+
+        with metrics.stage("create"):
+            page: dict[str, t.Any] = self.client.pages.create(  # type: ignore
+                parent={"database_id": self.incidents_db_id},
+                properties=properties,
+            )
+        logger.info("Created new Notion page %s for fingerprint %s", page["id"], alert.fingerprint)
+        logger.debug("Properties of new Notion page %s: %s", page["id"], properties)
+        self.remember_page(alert.fingerprint, page["id"])
+        self.remember_status(page["id"], alert.fingerprint, alert.notion_status, alert.startsAt, None)
 
-    def handle_alert(self, event: dict[str, t.Any]) -> None:
+        return page["id"]
+
+    def create_incident_once(self, alert: Alert) -> tuple[str, str]:
+        """
+        Create incident page of the alert, or update the page another worker created meanwhile.
+
+        With `leases` only the worker holding the fingerprint's lease creates the page. If the lease isn't released
+        in time, the page is looked up and `LeaseBusy` is raised if it's not found.
+        Returns page ID and the action taken.
+        """
+        if not self.leases:
+            return self.create_incident_page_from_alert(alert), "created"
+        claim = self.leases.claim(alert.fingerprint)
+        if claim.busy:
+            page_id = self.find_incident_page_by_fingerprint(alert.fingerprint)
+            claim = self.found_after_timeout(alert.fingerprint, page_id)
+        if page_id := self.created_elsewhere(alert.fingerprint, claim):
+            self.update_incident_status(page_id, alert)
+            return page_id, "updated"
+        try:
+            page_id = self.create_incident_page_from_alert(alert)
+        finally:
+            self.leases.release(alert.fingerprint, claim, page_id)
+        return page_id, "created"
+
+    def upsert_incident(self, page_id: str | None, alert: Alert) -> tuple[str, str]:
+        """
+        Update incident page or create a new one when `page_id` is None.
+
+        If the page turns out to be deleted or archived, the index entry is dropped and the page is looked up again.
+        Returns page ID and the action taken.
+        """
+        if not page_id:
+            return self.create_incident_once(alert)
+        try:
+            self.update_incident_status(page_id, alert)
+        except Exception as e:
+            if not self.can_forget_page(e):
+                raise
+            logger.warning("Page %s of fingerprint %s is stale, looking it up again", page_id, alert.fingerprint)
+            self.forget_page(alert.fingerprint)
+            if not (page_id := self.find_incident_page_by_fingerprint(alert.fingerprint)):
+                return self.create_incident_once(alert)
+            self.update_incident_status(page_id, alert)
+        return page_id, "updated"
+
+    def handle_fingerprint_alerts(self, alerts: list[Alert], page_id: str | None) -> list[AlertResult]:
+        """
+        Process alerts with the same fingerprint in order, a failed alert doesn't stop the next ones.
+
+        `page_id` is the incident page found for the fingerprint, a new page is created when it's None.
+        """
+        results = []
+        for alert in alerts:
+            logger.info("Processing alert %s with status %s", alert.fingerprint, alert.status)
+            result = AlertResult(fingerprint=alert.fingerprint, status=alert.status)
+            try:
+                page_id, result.action = self.upsert_incident(page_id, alert)
+            except Exception as e:
+                logger.exception("Failed to process alert with fingerprint %s", alert.fingerprint)
+                result.error, result.retryable = repr(e), is_retryable_error(e)
+            self.journal_finish(alert, result, page_id)
+            results.append(result)
+
+        return results
+
+    def handle_alerts(self, alerts: list[Alert]) -> EventReport:
+        """
+        Process alerts and update Notion accordingly.
+
+        Incident pages for all fingerprints are found with bulk queries first. Alerts with the same fingerprint
+        are processed in order, distinct fingerprints are processed concurrently by up to `max_concurrency` threads.
+        """
+        alerts, skipped = self.journal_begin(alerts)
+        by_fingerprint = group_by_fingerprint(alerts)
+        try:
+            pages = self.find_incident_pages_by_fingerprints(by_fingerprint)
+        except Exception as e:
+            logger.exception("Failed to find incident pages for %s fingerprints", len(by_fingerprint))
+            return EventReport(results=skipped + failed_report(alerts, e).results)
+
+        def handle(fingerprint: str) -> list[AlertResult]:
+            return self.handle_fingerprint_alerts(by_fingerprint[fingerprint], pages.get(fingerprint))
+
+        workers = min(self.max_concurrency, len(by_fingerprint))
+        if workers <= 1:
+            groups = list(map(handle, by_fingerprint))
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="notion-alert") as executor:
+                groups = list(executor.map(metrics.traced(handle), by_fingerprint))
+
+        return EventReport(results=skipped + [result for group in groups for result in group])
+
+    def handle_alert(self, event: dict[str, t.Any]) -> EventReport | None:
         """Handle an Alertmanager event and update Notion accordingly."""
         try:
-            event_obj = AlertmanagerEvent.model_validate(event)
+            with metrics.stage("validate"):
+                event_obj = EventAlerts.model_validate(event)
         except Exception as e:
             logger.exception("Failed to parse Alertmanager event: %s, error: %s", event, e)
-            return
-        for alert in event_obj.alerts:
-            logger.info("Processing alert: %s", alert)
-            if notion_page_id := self.find_incident_page_by_fingerprint(alert.fingerprint):
-                self.update_incident_status(notion_page_id, alert)
-            else:
-                self.create_incident_page_from_alert(alert)
-        logger.info("Finished processing Alertmanager event")
+            return None
+        report = self.handle_alerts(event_obj.alerts)
+        log_report(report)
+        return report
+
+    def handle_alert_stream(self, alerts: t.Iterable[t.Any]) -> EventReport:
+        """
+        Handle alerts parsed one at a time, e.g. by `StreamingEventParser`, so the event is never loaded at once.
+
+        Alerts are processed in batches with one bulk lookup each, invalid alerts are reported as failed.
+        """
+        report = EventReport()
+        try:
+            for batch in validated_batches(alerts, report.results, FINGERPRINT_LOOKUP_CHUNK_SIZE):
+                report.results.extend(self.handle_alerts(batch).results)
+        except ValueError as e:
+            logger.exception("Failed to parse Alertmanager event stream, error: %s", e)
+        log_report(report)
+        return report
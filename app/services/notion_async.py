@@ -0,0 +1,290 @@
+import typing as t
+
+import asyncio
+import logging
+from datetime import datetime
+
+import httpx
+import pytz
+from notion_client import AsyncClient
+
+from app import metrics
+from app.schemas import Alert, EventAlerts
+from app.services.notion import (
+    FINGERPRINT_LOOKUP_CHUNK_SIZE,
+    QUERY_PAGE_SIZE,
+    AlertResult,
+    BaseNotionService,
+    EventReport,
+    current_shift_type,
+    failed_report,
+    fingerprint_filter,
+    get_page_fingerprint,
+    group_by_fingerprint,
+    incident_properties,
+    is_retryable_error,
+    log_report,
+    parse_shift,
+    shift_filter,
+    status_properties,
+    validated_batches,
+)
+from app.services.shift_cache import SHIFT_LOOKUP_ERRORS, Shift
+
+logger = logging.getLogger("notion-service")
+
+
+class AsyncNotionService(BaseNotionService):
+    """
+    Async variant of `NotionService` built on `notion_client.AsyncClient`, with the same `handle_alert` semantics.
+
+    Alerts with distinct fingerprints, the shift lookup and the fingerprint lookup overlap in one event loop,
+    `max_concurrency` limits how many Notion calls are in flight at the same time.
+    """
+
+    def __init__(self, *args: t.Any, http_client: httpx.AsyncClient | None = None, **kwargs: t.Any) -> None:
+        """Initialize AsyncNotionService, see `BaseNotionService` for parameters."""
+        super().__init__(*args, **kwargs)
+        self.client = AsyncClient(auth=self.token, client=http_client)
+
+    async def find_incident_page_by_fingerprint(self, fingerprint: str) -> str | None:
+        """Find a Notion page by its `AMFingerprint` value."""
+        if page_id := self.known_page(fingerprint):
+            logger.info("Fingerprint %s found in memory, page ID: %s", fingerprint, page_id)
+            return page_id
+        with metrics.stage("lookup"):
+            resp = await self.client.databases.query(  # type: ignore
+                database_id=self.incidents_db_id,
+                filter=fingerprint_filter([fingerprint]),
+            )
+        if incident_page := next(iter(resp.get("results", [])), None):
+            logger.info("Fingerprint %s found in Notion, page ID: %s", fingerprint, incident_page["id"])
+            self.remember_page(fingerprint, incident_page["id"])
+            return incident_page["id"]
+
+        logger.debug("Fingerprint %s not found in Notion, response=%s", fingerprint, resp)
+
+        return None
+
+    async def query_incident_pages(self, filter_condition: dict[str, t.Any]) -> list[dict[str, t.Any]]:
+        """Return all incident pages matching the filter, following `start_cursor` pagination."""
+        query: dict[str, t.Any] = {"filter": filter_condition, "page_size": QUERY_PAGE_SIZE}
+        pages = []
+        while True:
+            resp: dict[str, t.Any] = await self.client.databases.query(  # type: ignore
+                database_id=self.incidents_db_id,
+                **query,
+            )
+            pages.extend(resp.get("results", []))
+            if not resp.get("has_more") or not resp.get("next_cursor"):
+                return pages
+            query["start_cursor"] = resp["next_cursor"]
+
+    async def find_incident_pages_by_fingerprints(
+        self,
+        fingerprints: t.Iterable[str],
+        semaphore: asyncio.Semaphore | None = None,
+        use_index: bool = True,
+    ) -> dict[str, str]:
+        """
+        Find Notion pages for many fingerprints at once, chunks are queried concurrently.
+
+        Found pages are written to the index, `use_index=False` skips reading it for already checked fingerprints.
+        """
+        unique_fingerprints = list(dict.fromkeys(fingerprints))
+        pages = self.cached_pages(unique_fingerprints) if use_index else {}
+        missing = [fingerprint for fingerprint in unique_fingerprints if fingerprint not in pages]
+        semaphore = semaphore or asyncio.Semaphore(self.max_concurrency)
+
+        async def query_chunk(chunk: list[str]) -> list[dict[str, t.Any]]:
+            async with semaphore:
+                return await self.query_incident_pages(fingerprint_filter(chunk))
+
+        size = FINGERPRINT_LOOKUP_CHUNK_SIZE
+        chunks = [missing[start : start + size] for start in range(0, len(missing), size)]
+        with metrics.stage("lookup"):
+            results = await asyncio.gather(*map(query_chunk, chunks))
+        for chunk_pages in results:
+            for page in chunk_pages:
+                fingerprint = get_page_fingerprint(page)
+                if fingerprint not in pages:
+                    pages[fingerprint] = page["id"]
+                    self.remember_page(fingerprint, page["id"])
+        logger.info("Found %s of %s fingerprints in Notion", len(pages), len(unique_fingerprints))
+
+        return pages
+
+    async def update_incident_status(self, page_id: str, alert: Alert) -> None:
+        """Update the status of an incident, the update is skipped if the page already has the status."""
+        if self.skip_update(page_id, alert):
+            return
+        with metrics.stage("update"):
+            await self.client.pages.update(page_id=page_id, properties=status_properties(alert))
+        logger.info("Updated Notion page %s with status %s", page_id, alert.notion_status)
+        self.remember_status(page_id, alert.fingerprint, alert.notion_status, alert.startsAt, alert.endsAt)
+
+    async def _get_shift(self) -> Shift:
+        """Find a responsible person for today's daily shift in Shifts DB."""
+        if not self.shifts_enabled:
+            self.log_shifts_disabled()
+            return None, []
+
+        today = datetime.now(tz=pytz.utc).date().isoformat()
+        try:
+            with metrics.stage("shift"):
+                if self.shift_cache is None:
+                    return await self._query_shift(today)
+                return await self.shift_cache.get_or_load_async(
+                    today,
+                    current_shift_type(),
+                    lambda: self._query_shift(today),
+                )
+        except SHIFT_LOOKUP_ERRORS:
+            logger.exception("Failed to query Notion shifts database: %s", self.shifts_db_id)
+            return None, []
+
+    async def _query_shift(self, today: str) -> Shift:
+        """Query Shifts DB for the shift of the date."""
+        resp = await self.client.databases.query(  # type: ignore
+            database_id=self.shifts_db_id,
+            filter=shift_filter(today),
+            page_size=1,
+        )
+        logger.debug("Query response for shifts: %s", resp)
+        return parse_shift(resp)
+
+    async def create_incident_page_from_alert(self, alert: Alert, shift: t.Awaitable[Shift] | None = None) -> str:
+        """Create a new Notion page from an alert, `shift` is a prefetched shift lookup."""
+        properties = incident_properties(alert, *(await (shift or self._get_shift())))
+        with metrics.stage("create"):
+            page: dict[str, t.Any] = await self.client.pages.create(  # type: ignore
+                parent={"database_id": self.incidents_db_id},
+                properties=properties,
+            )
+        logger.info("Created new Notion page %s for fingerprint %s", page["id"], alert.fingerprint)
+        logger.debug("Properties of new Notion page %s: %s", page["id"], properties)
+        self.remember_page(alert.fingerprint, page["id"])
+        self.remember_status(page["id"], alert.fingerprint, alert.notion_status, alert.startsAt, None)
+
+        return page["id"]
+
+    async def create_incident_once(self, alert: Alert, shift: t.Awaitable[Shift] | None = None) -> tuple[str, str]:
+        """Create incident page of the alert or update the one created meanwhile, see `NotionService`."""
+        if not self.leases:
+            return await self.create_incident_page_from_alert(alert, shift), "created"
+        claim = await self.leases.claim_async(alert.fingerprint)
+        if claim.busy:
+            page_id = await self.find_incident_page_by_fingerprint(alert.fingerprint)
+            claim = self.found_after_timeout(alert.fingerprint, page_id)
+        if page_id := self.created_elsewhere(alert.fingerprint, claim):
+            await self.update_incident_status(page_id, alert)
+            return page_id, "updated"
+        try:
+            page_id = await self.create_incident_page_from_alert(alert, shift)
+        finally:
+            await asyncio.to_thread(self.leases.release, alert.fingerprint, claim, page_id)
+        return page_id, "created"
+
+    async def upsert_incident(
+        self,
+        page_id: str | None,
+        alert: Alert,
+        shift: t.Awaitable[Shift] | None = None,
+    ) -> tuple[str, str]:
+        """Update incident page or create a new one, see `NotionService.upsert_incident`."""
+        if not page_id:
+            return await self.create_incident_once(alert, shift)
+        try:
+            await self.update_incident_status(page_id, alert)
+        except Exception as e:
+            if not self.can_forget_page(e):
+                raise
+            logger.warning("Page %s of fingerprint %s is stale, looking it up again", page_id, alert.fingerprint)
+            self.forget_page(alert.fingerprint)
+            if not (page_id := await self.find_incident_page_by_fingerprint(alert.fingerprint)):
+                return await self.create_incident_once(alert, shift)
+            await self.update_incident_status(page_id, alert)
+        return page_id, "updated"
+
+    async def handle_fingerprint_alerts(
+        self,
+        alerts: list[Alert],
+        page_id: str | None,
+        semaphore: asyncio.Semaphore,
+        shift: t.Awaitable[Shift] | None = None,
+    ) -> list[AlertResult]:
+        """Process alerts with the same fingerprint in order, a failed alert doesn't stop the next ones."""
+        results = []
+        async with semaphore:
+            for alert in alerts:
+                logger.info("Processing alert %s with status %s", alert.fingerprint, alert.status)
+                result = AlertResult(fingerprint=alert.fingerprint, status=alert.status)
+                try:
+                    page_id, result.action = await self.upsert_incident(page_id, alert, shift)
+                except Exception as e:
+                    logger.exception("Failed to process alert with fingerprint %s", alert.fingerprint)
+                    result.error, result.retryable = repr(e), is_retryable_error(e)
+                self.journal_finish(alert, result, page_id)
+                results.append(result)
+
+        return results
+
+    def start_shift_lookup(self, missing: list[str]) -> asyncio.Task[Shift] | None:
+        """Look up today's shift in the background if some fingerprints may need a new page."""
+        if not (self.shifts_enabled and missing):
+            return None
+        return asyncio.create_task(self._get_shift())
+
+    async def handle_alerts(self, alerts: list[Alert]) -> EventReport:
+        """
+        Process alerts and update Notion accordingly.
+
+        Today's shift is looked up at the same time as incident pages when some fingerprints may need a new page.
+        Alerts with the same fingerprint are processed in order, up to `max_concurrency` fingerprints at a time.
+        """
+        alerts, skipped = self.journal_begin(alerts)
+        by_fingerprint = group_by_fingerprint(alerts)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        pages = self.cached_pages(list(by_fingerprint))
+        missing = [fingerprint for fingerprint in by_fingerprint if fingerprint not in pages]
+        shift = self.start_shift_lookup(missing)
+        try:
+            try:
+                pages |= await self.find_incident_pages_by_fingerprints(missing, semaphore, use_index=False)
+            except Exception as e:
+                logger.exception("Failed to find incident pages for %s fingerprints", len(by_fingerprint))
+                return EventReport(results=skipped + failed_report(alerts, e).results)
+            groups = await asyncio.gather(
+                *(
+                    self.handle_fingerprint_alerts(group, pages.get(fingerprint), semaphore, shift)
+                    for fingerprint, group in by_fingerprint.items()
+                ),
+            )
+        finally:
+            if shift is not None:
+                shift.cancel()
+
+        return EventReport(results=skipped + [result for group in groups for result in group])
+
+    async def handle_alert(self, event: dict[str, t.Any]) -> EventReport | None:
+        """Handle an Alertmanager event and update Notion accordingly."""
+        try:
+            with metrics.stage("validate"):
+                event_obj = EventAlerts.model_validate(event)
+        except Exception as e:
+            logger.exception("Failed to parse Alertmanager event: %s, error: %s", event, e)
+            return None
+        report = await self.handle_alerts(event_obj.alerts)
+        log_report(report)
+        return report
+
+    async def handle_alert_stream(self, alerts: t.Iterable[t.Any]) -> EventReport:
+        """Handle alerts parsed one at a time, see `NotionService.handle_alert_stream`."""
+        report = EventReport()
+        try:
+            for batch in validated_batches(alerts, report.results, FINGERPRINT_LOOKUP_CHUNK_SIZE):
+                report.results.extend((await self.handle_alerts(batch)).results)
+        except ValueError as e:
+            logger.exception("Failed to parse Alertmanager event stream, error: %s", e)
+        log_report(report)
+        return report
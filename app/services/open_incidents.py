@@ -0,0 +1,262 @@
+"""
+In-memory map of open (not resolved) incidents, preloaded on a warm instance and kept fresh in the background.
+
+A background thread loads all open incidents of the database with one paginated scan, then pulls only pages edited
+since the previous pull every `refresh_interval` seconds (`last_edited_time` filter). Notion rounds
+`last_edited_time` to the minute, so every pull starts a minute before the previous one to not miss a page. Once
+loaded, lookups of open incidents and their status are answered from memory, a fingerprint that isn't in the map
+may still have a resolved page and is looked up in Notion. If the map isn't refreshed for `max_staleness` seconds,
+it's not used until the next successful refresh.
+
+Every entry keeps its last edit time, pages pulled by a scan that started before the worker wrote the incident (or
+resolved it) are older and ignored. Notion's rounding means an edit made in Notion in the same minute as the worker's
+write may be ignored too, it's picked up by its next edit.
+"""
+
+import typing as t
+
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import pytz
+
+from app import metrics
+
+logger = logging.getLogger("open-incidents")
+
+OPEN_FILTER = {"property": "AMStatus", "select": {"does_not_equal": "Resolved"}}
+NEWEST_FIRST = [{"timestamp": "last_edited_time", "direction": "descending"}]
+# Notion rounds `last_edited_time` down to the minute, edits are pulled from a minute before the previous pull.
+EDIT_TIME_MARGIN = timedelta(minutes=1)
+STOP_TIMEOUT = 5
+
+# Iterate over pages of the incidents database matching the filter, in the order of the sorts.
+QueryPages = t.Callable[[dict[str, t.Any], list[dict[str, t.Any]] | None], t.Iterable[dict[str, t.Any]]]
+
+
+class OpenIncident(t.NamedTuple):
+    """Incident page of a fingerprint with its status and last edit time."""
+
+    page_id: str
+    status: str
+    edited: str
+
+
+def page_status(page: dict[str, t.Any]) -> str:
+    """Return `AMStatus` of a Notion page."""
+    return (page.get("properties", {}).get("AMStatus", {}).get("select") or {}).get("name") or ""
+
+
+def edited_at(edited: str) -> datetime:
+    """Parse last edit time of an incident, the oldest time if it's unknown."""
+    return datetime.fromisoformat(edited) if edited else datetime.min.replace(tzinfo=pytz.utc)
+
+
+def latest(known: OpenIncident | None, pulled: OpenIncident) -> OpenIncident:
+    """The known incident if the pulled one is older, otherwise the pulled one."""
+    return known if known is not None and edited_at(pulled.edited) < edited_at(known.edited) else pulled
+
+
+def entry_size(fingerprint: str, incident: OpenIncident) -> int:
+    """Approximate bytes taken by the map entry."""
+    return sum(map(sys.getsizeof, (fingerprint, incident, *incident)))
+
+
+class OpenIncidents:
+    """Map of fingerprint -> open incident page, see the module docstring."""
+
+    def __init__(
+        self,
+        query: QueryPages,
+        get_fingerprint: t.Callable[[dict[str, t.Any]], str],
+        max_size: int = 50000,
+        refresh_interval: float = 60,
+        max_staleness: float | None = None,
+        close: t.Callable[[], None] | None = None,
+    ) -> None:
+        """
+        Init map, call `start()` to load it.
+
+        The least recently edited incidents are evicted to keep at most `max_size` entries, evicted fingerprints
+        are looked up in Notion. `max_staleness` defaults to three refresh intervals, `close` is called on stop.
+        """
+        self.query = query
+        self.get_fingerprint = get_fingerprint
+        self.max_size = max_size
+        self.refresh_interval = refresh_interval
+        self.max_staleness = max_staleness if max_staleness is not None else refresh_interval * 3
+        self._entries: OrderedDict[str, OpenIncident] = OrderedDict()
+        # Fingerprint -> time the worker resolved its incident, until a pull started after it.
+        self._resolved: OrderedDict[str, str] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._refreshed: float | None = None
+        self._pulled_since: datetime | None = None
+        self._close = close
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="am2n-open-incidents", daemon=True)
+
+    @property
+    def size(self) -> int:
+        """Number of open incidents in the map."""
+        return len(self._entries)
+
+    def _put(self, fingerprint: str, incident: OpenIncident) -> None:
+        self._discard(fingerprint)
+        self._entries[fingerprint] = incident
+        self._bytes += entry_size(fingerprint, incident)
+        while len(self._entries) > self.max_size:
+            evicted, old = self._entries.popitem(last=False)
+            self._bytes -= entry_size(evicted, old)
+            metrics.incr("open_incidents_evictions")
+
+    def _discard(self, fingerprint: str) -> None:
+        if (old := self._entries.pop(fingerprint, None)) is not None:
+            self._bytes -= entry_size(fingerprint, old)
+
+    def _resolved_after(self, fingerprint: str, edited: str) -> bool:
+        """Whether the worker resolved the incident after the page was edited at `edited`."""
+        resolved = self._resolved.get(fingerprint)
+        return resolved is not None and edited_at(edited) < edited_at(resolved)
+
+    def _forget_resolved(self, before: datetime) -> None:
+        """Drop resolve times before `before`, pulls started after them see the resolved pages."""
+        while self._resolved and edited_at(next(iter(self._resolved.values()))) < before:
+            self._resolved.popitem(last=False)
+
+    def _apply(self, page: dict[str, t.Any]) -> None:
+        """Add, update or remove the page's incident, pages without fingerprint or older than the entry are ignored."""
+        if not (fingerprint := self.get_fingerprint(page)):
+            return
+        pulled = OpenIncident(page["id"], page_status(page), page.get("last_edited_time", ""))
+        with self._lock:
+            known = self._entries.get(fingerprint)
+            if latest(known, pulled) is not pulled or self._resolved_after(fingerprint, pulled.edited):
+                metrics.incr("open_incidents_outdated_pages")
+            elif pulled.status == "Resolved" or page.get("archived") or page.get("in_trash"):
+                self._discard(fingerprint)
+            else:
+                self._put(fingerprint, pulled)
+
+    def _export(self) -> None:
+        metrics.gauge("open_incidents_entries", len(self._entries))
+        metrics.gauge("open_incidents_bytes", self._bytes)
+        metrics.gauge("open_incidents_staleness_seconds", self.staleness())
+
+    def _merge(self, newest: list[tuple[str, OpenIncident]], started: datetime) -> None:
+        """Replace entries with incidents loaded by a scan started at `started`, keeping ones written during it."""
+        current, self._entries, self._bytes = self._entries, OrderedDict(), 0
+        # Oldest first, so they are evicted first.
+        for fingerprint, incident in reversed(newest):
+            incident = latest(current.pop(fingerprint, None), incident)
+            if not self._resolved_after(fingerprint, incident.edited):
+                self._put(fingerprint, incident)
+        for fingerprint, incident in current.items():
+            if edited_at(incident.edited) >= started:
+                self._put(fingerprint, incident)
+        self._forget_resolved(started)
+
+    def load(self) -> None:
+        """
+        Load open incidents newest first, the least recently edited ones are left out when the map is full.
+
+        Incidents the worker wrote during the scan are kept, pages older than them are ignored.
+        """
+        started = datetime.now(tz=pytz.utc)
+        newest: list[tuple[str, OpenIncident]] = []
+        with metrics.stage("open_incidents.load"):
+            for page in self.query(OPEN_FILTER, NEWEST_FIRST):
+                if fingerprint := self.get_fingerprint(page):
+                    newest.append((fingerprint, OpenIncident(page["id"], page_status(page), page["last_edited_time"])))
+                if len(newest) >= self.max_size:
+                    break
+        with self._lock:
+            self._merge(newest, started)
+        self._refreshed = time.monotonic()
+        self._pulled_since = started - EDIT_TIME_MARGIN
+        logger.info("Loaded %s open incidents", len(self._entries))
+        self._export()
+
+    def refresh(self) -> None:
+        """Pull pages edited since the previous pull, incidents resolved meanwhile are removed."""
+        if self._pulled_since is None:
+            self.load()
+            return
+        started = datetime.now(tz=pytz.utc)
+        edited = {"on_or_after": self._pulled_since.isoformat()}
+        pulled = 0
+        with metrics.stage("open_incidents.refresh"):
+            for page in self.query({"timestamp": "last_edited_time", "last_edited_time": edited}, None):
+                self._apply(page)
+                pulled += 1
+        with self._lock:
+            self._forget_resolved(started)
+        self._refreshed = time.monotonic()
+        self._pulled_since = started - EDIT_TIME_MARGIN
+        metrics.incr("open_incidents_pulled", pulled)
+        self._export()
+
+    def staleness(self) -> float:
+        """Seconds since the last successful load or refresh, infinity before the map is loaded."""
+        return time.monotonic() - self._refreshed if self._refreshed is not None else float("inf")
+
+    def fresh(self) -> bool:
+        """Whether the map is loaded and refreshed recently enough to be used."""
+        return self.staleness() <= self.max_staleness
+
+    def get(self, fingerprint: str) -> OpenIncident | None:
+        """Open incident of the fingerprint, None if it's unknown or the map is stale."""
+        staleness = self.staleness()
+        metrics.gauge("open_incidents_staleness_seconds", staleness)
+        if staleness > self.max_staleness:
+            metrics.incr("open_incidents_stale_lookups")
+            return None
+        with self._lock:
+            incident = self._entries.get(fingerprint)
+        metrics.incr("open_incidents_hits" if incident is not None else "open_incidents_misses")
+        return incident
+
+    def record(self, fingerprint: str, page_id: str, status: str) -> None:
+        """Record status written to the incident page by the worker, resolved incidents are removed."""
+        edited = datetime.now(tz=pytz.utc).isoformat()
+        with self._lock:
+            self._resolved.pop(fingerprint, None)
+            if status == "Resolved":
+                self._discard(fingerprint)
+                self._resolved[fingerprint] = edited
+                if len(self._resolved) > self.max_size:
+                    self._resolved.popitem(last=False)
+            else:
+                self._put(fingerprint, OpenIncident(page_id, status, edited))
+
+    def forget(self, fingerprint: str) -> None:
+        """Forget incident of the fingerprint, e.g. when its page was deleted or archived."""
+        with self._lock:
+            self._discard(fingerprint)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                metrics.incr("open_incidents_refresh_errors")
+                logger.exception("Failed to refresh open incidents")
+                self._export()
+            self._stopped.wait(self.refresh_interval)
+
+    def start(self) -> "OpenIncidents":
+        """Load open incidents and keep them fresh in a background thread."""
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop refreshing, a refresh in progress is waited for up to `STOP_TIMEOUT` seconds."""
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join(STOP_TIMEOUT)
+        if self._close is not None:
+            self._close()
@@ -0,0 +1,242 @@
+import typing as t
+
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+import httpx
+import pytz
+
+from app import metrics
+
+logger = logging.getLogger("notion-rate-limit")
+
+# Notion answers 429 when the rate limit is exceeded and 5xx when it's overloaded, both are safe to retry.
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+# A create answered with 500, 502 or 504 may have succeeded, retrying it would create a duplicate page.
+# 429 and 503 mean the request wasn't processed.
+NON_IDEMPOTENT_RETRY_STATUS_CODES = frozenset({429, 503})
+NON_IDEMPOTENT_ENDPOINTS = frozenset({"pages.create"})
+# Endpoint label of request metrics by method and path, IDs in paths would make too many series.
+NOTION_ENDPOINTS = (
+    ("POST", re.compile(r"/v1/databases/[^/]+/query$"), "databases.query"),
+    ("POST", re.compile(r"/v1/pages$"), "pages.create"),
+    ("PATCH", re.compile(r"/v1/pages/[^/]+$"), "pages.update"),
+    ("GET", re.compile(r"/v1/pages/[^/]+$"), "pages.retrieve"),
+)
+
+
+class TokenBucket:
+    """Token bucket rate limiter shared by all threads of the process."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        """Init bucket, `rate` is tokens per second, `capacity` is max burst."""
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Take a token, returns seconds to wait before it can be used."""
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            return max(-self._tokens / self.rate, 0)
+
+    def cancel(self) -> None:
+        """Return a reserved token that won't be used."""
+        with self._lock:
+            self._tokens += 1
+
+    def pause(self, seconds: float) -> None:
+        """Don't give out tokens for the next `seconds`, e.g. after the server answered 429."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Parse `Retry-After` header given in seconds or as HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(tz=pytz.utc)).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def notion_endpoint(request: httpx.Request) -> str:
+    """Notion API endpoint of the request, e.g. `pages.create`, `other` for endpoints the app doesn't call."""
+    for method, path, endpoint in NOTION_ENDPOINTS:
+        if request.method == method and path.search(request.url.path):
+            return endpoint
+    return "other"
+
+
+def retry_status_codes(request: httpx.Request) -> frozenset[int]:
+    """Status codes the request is retried on, non-idempotent calls are retried only if they weren't processed."""
+    if notion_endpoint(request) in NON_IDEMPOTENT_ENDPOINTS:
+        return NON_IDEMPOTENT_RETRY_STATUS_CODES
+    return RETRY_STATUS_CODES
+
+
+def record_request(request: httpx.Request, status: int | None, started: float) -> None:
+    """Record count of Notion API requests by endpoint and status and their latency, `status` is None on error."""
+    endpoint = notion_endpoint(request)
+    metrics.incr("notion_requests", endpoint=endpoint, status=status or "error")
+    metrics.observe("notion_request_seconds", time.perf_counter() - started, endpoint=endpoint)
+
+
+class RateLimitPolicy:
+    """
+    Rate limiting and retries of Notion API calls.
+
+    Every request takes a token from the shared bucket. Responses with 429 and 5xx status are retried with
+    exponential backoff and jitter, honouring `Retry-After`. Page creates are retried on 429 and 503 only. Waiting
+    and retries of one call stop at `deadline` seconds, so a call never outlives the function timeout.
+    """
+
+    def __init__(
+        self,
+        limiter: TokenBucket,
+        max_retries: int = 5,
+        deadline: float = 30,
+        backoff_base: float = 0.5,
+        backoff_max: float = 10,
+    ) -> None:
+        """Init policy."""
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def retry_delay(self, response: httpx.Response, attempt: int) -> float:
+        """Seconds to wait before retrying the response."""
+        if (retry_after := parse_retry_after(response.headers.get("Retry-After"))) is not None:
+            return retry_after + random.uniform(0, self.backoff_base)  # nosec
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))  # nosec
+
+    def token_wait(self, request: httpx.Request, deadline_at: float) -> float:
+        """Take a token, returns seconds to wait for it, raises `httpx.PoolTimeout` if it's after the deadline."""
+        wait = self.limiter.reserve()
+        if wait and time.monotonic() + wait > deadline_at:
+            self.limiter.cancel()
+            raise httpx.PoolTimeout(f"Rate limit wait exceeds {self.deadline}s deadline", request=request)
+        if wait:
+            metrics.incr("notion_rate_limit_wait_seconds", wait)
+        return wait
+
+    def retry_wait(
+        self,
+        request: httpx.Request,
+        response: httpx.Response,
+        attempt: int,
+        deadline_at: float,
+    ) -> float | None:
+        """Seconds to wait before retrying the response, None if it must be returned as is."""
+        if response.status_code not in retry_status_codes(request) or attempt >= self.max_retries:
+            return None
+        delay = self.retry_delay(response, attempt)
+        if time.monotonic() + delay > deadline_at:
+            return None
+        metrics.incr("notion_retries")
+        logger.warning(
+            "Notion answered %s to %s %s, retry %s in %.2fs",
+            response.status_code,
+            request.method,
+            request.url.path,
+            attempt + 1,
+            delay,
+        )
+        if response.status_code == 429:
+            # All callers back off, the retry itself waits for a token in `token_wait`.
+            self.limiter.pause(delay)
+            return 0
+        return delay
+
+
+class RateLimitedTransport(RateLimitPolicy, httpx.BaseTransport):
+    """HTTP transport for Notion API calls with rate limiting and retries, see `RateLimitPolicy`."""
+
+    def __init__(self, limiter: TokenBucket, transport: httpx.BaseTransport | None = None, **kwargs: t.Any) -> None:
+        """Init transport, requests are sent with `transport` (default `httpx.HTTPTransport`)."""
+        super().__init__(limiter, **kwargs)
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        """Send request, waiting for rate limiter and retrying throttled and failed responses."""
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            if wait := self.token_wait(request, deadline_at):
+                time.sleep(wait)
+            started = time.perf_counter()
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError:
+                record_request(request, None, started)
+                raise
+            record_request(request, response.status_code, started)
+            if (delay := self.retry_wait(request, response, attempt, deadline_at)) is None:
+                return response
+            response.close()
+            attempt += 1
+            time.sleep(delay)
+
+    def close(self) -> None:
+        """Close underlying transport."""
+        self.transport.close()
+
+
+class AsyncRateLimitedTransport(RateLimitPolicy, httpx.AsyncBaseTransport):
+    """Async HTTP transport for Notion API calls with rate limiting and retries, see `RateLimitPolicy`."""
+
+    def __init__(
+        self,
+        limiter: TokenBucket,
+        transport: httpx.AsyncBaseTransport | None = None,
+        **kwargs: t.Any,
+    ) -> None:
+        """Init transport, requests are sent with `transport` (default `httpx.AsyncHTTPTransport`)."""
+        super().__init__(limiter, **kwargs)
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Send request, waiting for rate limiter and retrying throttled and failed responses."""
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            if wait := self.token_wait(request, deadline_at):
+                await asyncio.sleep(wait)
+            started = time.perf_counter()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError:
+                record_request(request, None, started)
+                raise
+            record_request(request, response.status_code, started)
+            if (delay := self.retry_wait(request, response, attempt, deadline_at)) is None:
+                return response
+            await response.aclose()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        """Close underlying transport."""
+        await self.transport.aclose()
@@ -0,0 +1,96 @@
+import typing as t
+
+import asyncio
+import logging
+import threading
+import time
+
+import httpx
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+
+from app import metrics
+
+logger = logging.getLogger("shift-cache")
+
+Shift = tuple[t.Any, list[dict[str, t.Any]]]
+# Errors of a failed shift lookup: transport errors and Notion error responses, e.g. `APIResponseError`.
+SHIFT_LOOKUP_ERRORS = (httpx.HTTPError, HTTPResponseError, RequestTimeoutError)
+
+
+class ShiftCache:
+    """
+    Cache of the on-duty shift keyed by UTC date and shift type.
+
+    A new date means a new key, so entries expire at the day boundary or after `ttl` seconds, whatever comes first.
+    Lookups run under a lock, so concurrent incidents wait for one query instead of running their own.
+    If a lookup fails with one of `SHIFT_LOOKUP_ERRORS`, the last known shift of the shift type is used.
+    Async lookups use `asyncio.Lock`, so the cache must be used from one event loop.
+    """
+
+    def __init__(self, ttl: float = 3600) -> None:
+        """Init cache."""
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: dict[tuple[str, str], tuple[Shift, float]] = {}
+        self._last_known: dict[str, Shift] = {}
+        self._async_lock: asyncio.Lock | None = None
+
+    def _cached(self, key: tuple[str, str]) -> Shift | None:
+        if (entry := self._entries.get(key)) and entry[1] > time.monotonic():
+            metrics.incr("shift_cache_hits")
+            return entry[0]
+        metrics.incr("shift_cache_misses")
+        return None
+
+    def _store(self, key: tuple[str, str], shift: Shift) -> Shift:
+        # Entries of previous days are never used again.
+        self._entries = {k: v for k, v in self._entries.items() if k[0] == key[0]}
+        self._entries[key] = (shift, time.monotonic() + self.ttl)
+        self._last_known[key[1]] = shift
+        return shift
+
+    def _fallback(self, key: tuple[str, str], error: Exception) -> Shift:
+        if key[1] not in self._last_known:
+            raise error
+        metrics.incr("shift_cache_fallbacks")
+        logger.exception("Failed to load shift for %s, using last known shift", key[0])
+        return self._last_known[key[1]]
+
+    def get_or_load(self, date: str, shift_type: str, load: t.Callable[[], Shift]) -> Shift:
+        """Return cached shift for the date and shift type, calling `load` on a miss."""
+        key = (date, shift_type)
+        with self._lock:
+            if (shift := self._cached(key)) is not None:
+                return shift
+            try:
+                return self._store(key, load())
+            except SHIFT_LOOKUP_ERRORS as e:
+                return self._fallback(key, e)
+
+    async def get_or_load_async(
+        self,
+        date: str,
+        shift_type: str,
+        load: t.Callable[[], t.Awaitable[Shift]],
+    ) -> Shift:
+        """Return cached shift for the date and shift type, awaiting `load` on a miss."""
+        key = (date, shift_type)
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            with self._lock:
+                if (shift := self._cached(key)) is not None:
+                    return shift
+            try:
+                shift = await load()
+            except SHIFT_LOOKUP_ERRORS as e:
+                with self._lock:
+                    return self._fallback(key, e)
+            with self._lock:
+                return self._store(key, shift)
+
+    def clear(self) -> None:
+        """Drop all cached shifts."""
+        with self._lock:
+            self._entries.clear()
+            self._last_known.clear()
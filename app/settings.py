@@ -3,7 +3,7 @@ import os
 import sys
 from pathlib import Path
 
-from decouple import AutoConfig
+from decouple import AutoConfig, Choices, Csv
 
 BASE_DIR = Path(__file__).parent.parent
 config = AutoConfig(search_path=BASE_DIR.joinpath("config"))
@@ -23,6 +23,16 @@ else:  # pragma: nocover
 
 EVENTS_PUBSUB_TOPIC = config("EVENTS_PUBSUB_TOPIC")
 
+# Webhook receiver publishing settings.
+# "strict" waits for Pub/Sub to confirm the message and returns message_id,
+# "async" returns as soon as the message is handed off to the publisher's batcher.
+AM2N_PUBLISH_MODE = config("AM2N_PUBLISH_MODE", cast=Choices(["strict", "async"]), default="strict")
+AM2N_PUBLISH_BATCH_MAX_MESSAGES = config("AM2N_PUBLISH_BATCH_MAX_MESSAGES", cast=int, default="100")
+AM2N_PUBLISH_BATCH_MAX_BYTES = config("AM2N_PUBLISH_BATCH_MAX_BYTES", cast=int, default="1000000")
+AM2N_PUBLISH_BATCH_MAX_LATENCY = config("AM2N_PUBLISH_BATCH_MAX_LATENCY", cast=float, default="0.01")
+# Publish every alert of a group as a separate message ordered by alert fingerprint.
+AM2N_PUBLISH_FANOUT = config("AM2N_PUBLISH_FANOUT", cast=bool, default="false")
+
 # AM2N (Alertmanager to Notion) settings
 AM2N_NOTION_TOKEN = config("AM2N_NOTION_TOKEN")
 AM2N_INCIDENTS_DB_ID = config("AM2N_INCIDENTS_DB_ID")
@@ -30,3 +40,96 @@ AM2N_SHIFTS_DB_ID = config("AM2N_SHIFTS_DB_ID", default=None)
 AM2N_SHIFTS_SUPPORT_ENABLED = config("AM2N_SHIFTS_SUPPORT_ENABLED", cast=bool, default="false")
 AM2N_HTTP_HEADER_NAME = config("AM2N_HTTP_HEADER_NAME", default="X-AM2N-SECRET")
 AM2N_HTTP_HEADER_VALUE = config("AM2N_HTTP_HEADER_VALUE")
+# Max alerts with distinct fingerprints processed at the same time, Notion allows ~3 requests per second.
+AM2N_NOTION_MAX_CONCURRENCY = config("AM2N_NOTION_MAX_CONCURRENCY", cast=int, default="1")
+# Fingerprint -> Notion page ID index, kept for the life of the worker instance.
+# Backend "memory" is in-process only, "sqlite" (URL is a file path) and "redis" (redis:// URL) are shared.
+AM2N_FINGERPRINT_INDEX_ENABLED = config("AM2N_FINGERPRINT_INDEX_ENABLED", cast=bool, default="true")
+AM2N_FINGERPRINT_INDEX_TTL = config("AM2N_FINGERPRINT_INDEX_TTL", cast=float, default="3600")
+AM2N_FINGERPRINT_INDEX_MAX_SIZE = config("AM2N_FINGERPRINT_INDEX_MAX_SIZE", cast=int, default="10000")
+AM2N_FINGERPRINT_INDEX_BACKEND = config(
+    "AM2N_FINGERPRINT_INDEX_BACKEND",
+    cast=Choices(["memory", "sqlite", "redis"]),
+    default="memory",
+)
+AM2N_FINGERPRINT_INDEX_URL = config("AM2N_FINGERPRINT_INDEX_URL", default="")
+# Seconds today's on-duty shift is cached, it's also dropped at the UTC day boundary.
+AM2N_SHIFT_CACHE_TTL = config("AM2N_SHIFT_CACHE_TTL", cast=float, default="3600")
+# Skip page updates that wouldn't change AMStatus or timeframe, written statuses are kept in the index backend.
+AM2N_SKIP_NOOP_UPDATES_ENABLED = config("AM2N_SKIP_NOOP_UPDATES_ENABLED", cast=bool, default="true")
+# Notion API rate limiting and retries of 429/5xx responses. The deadline covers waiting and retries of one call,
+# keep it below the worker function timeout (60s by default).
+AM2N_NOTION_RATE_LIMIT = config("AM2N_NOTION_RATE_LIMIT", cast=float, default="3")
+AM2N_NOTION_RATE_LIMIT_BURST = config("AM2N_NOTION_RATE_LIMIT_BURST", cast=float, default="3")
+AM2N_NOTION_MAX_RETRIES = config("AM2N_NOTION_MAX_RETRIES", cast=int, default="5")
+AM2N_NOTION_CALL_DEADLINE = config("AM2N_NOTION_CALL_DEADLINE", cast=float, default="30")
+# Notion API connection pool, kept open between invocations of a warm worker instance.
+AM2N_NOTION_HTTP2 = config("AM2N_NOTION_HTTP2", cast=bool, default="true")
+AM2N_NOTION_POOL_MAX_CONNECTIONS = config("AM2N_NOTION_POOL_MAX_CONNECTIONS", cast=int, default="10")
+AM2N_NOTION_POOL_MAX_KEEPALIVE = config("AM2N_NOTION_POOL_MAX_KEEPALIVE", cast=int, default="10")
+AM2N_NOTION_POOL_KEEPALIVE_EXPIRY = config("AM2N_NOTION_POOL_KEEPALIVE_EXPIRY", cast=float, default="60")
+# Process events with AsyncNotionService in the instance's event loop instead of a thread pool.
+AM2N_NOTION_ASYNC = config("AM2N_NOTION_ASYNC", cast=bool, default="false")
+# Micro-batching pull worker (python -m app.pull_worker), an alternative to push-triggered `handle_event`.
+# Messages are buffered until the batch is full or its oldest message waited for max wait seconds.
+AM2N_PULL_SUBSCRIPTION = config("AM2N_PULL_SUBSCRIPTION", default="")
+AM2N_PULL_BATCH_MAX_MESSAGES = config("AM2N_PULL_BATCH_MAX_MESSAGES", cast=int, default="500")
+AM2N_PULL_BATCH_MAX_WAIT = config("AM2N_PULL_BATCH_MAX_WAIT", cast=float, default="1")
+# Streaming pull flow control: max messages and bytes leased by the worker and not yet acked.
+AM2N_PULL_FLOW_MAX_MESSAGES = config("AM2N_PULL_FLOW_MAX_MESSAGES", cast=int, default="1000")
+AM2N_PULL_FLOW_MAX_BYTES = config("AM2N_PULL_FLOW_MAX_BYTES", cast=int, default="104857600")
+# Drop repeat notifications and webhook retries of unchanged alerts in the receiver instead of publishing them.
+# Backend "memory" is in-process only, "sqlite" (URL is a file path) and "redis" (redis:// URL) are shared.
+AM2N_DEDUP_ENABLED = config("AM2N_DEDUP_ENABLED", cast=bool, default="false")
+AM2N_DEDUP_TTL = config("AM2N_DEDUP_TTL", cast=float, default="3600")
+AM2N_DEDUP_MAX_SIZE = config("AM2N_DEDUP_MAX_SIZE", cast=int, default="10000")
+AM2N_DEDUP_BACKEND = config("AM2N_DEDUP_BACKEND", cast=Choices(["memory", "sqlite", "redis"]), default="memory")
+AM2N_DEDUP_URL = config("AM2N_DEDUP_URL", default="")
+# Format of events published by the receiver: "json" is the Alertmanager payload as is, "compact" keeps only fields
+# used by the worker. Deploy the worker first, it reads both formats from the message's `am2n_wire` attribute.
+AM2N_WIRE_FORMAT = config("AM2N_WIRE_FORMAT", cast=Choices(["json", "compact"]), default="json")
+# Validate payloads against the AlertmanagerEvent schema in the receiver (400 for malformed ones), drop fields
+# the worker never uses and split groups into messages under the byte budget.
+AM2N_EDGE_VALIDATION_ENABLED = config("AM2N_EDGE_VALIDATION_ENABLED", cast=bool, default="false")
+AM2N_EDGE_MAX_MESSAGE_BYTES = config("AM2N_EDGE_MAX_MESSAGE_BYTES", cast=int, default="1000000")
+AM2N_EDGE_MAX_ANNOTATION_LENGTH = config("AM2N_EDGE_MAX_ANNOTATION_LENGTH", cast=int, default="1000")
+# Parse payloads of at least min bytes from the stream, alerts are published (receiver) and processed (worker)
+# as they are read, so memory use doesn't grow with the size of the group.
+AM2N_STREAMING_ENABLED = config("AM2N_STREAMING_ENABLED", cast=bool, default="false")
+AM2N_STREAMING_MIN_BYTES = config("AM2N_STREAMING_MIN_BYTES", cast=int, default="1000000")
+# Sampling profiler of the worker, a sample rate share of events is profiled and its most frequent stacks are logged.
+AM2N_PROFILER_ENABLED = config("AM2N_PROFILER_ENABLED", cast=bool, default="false")
+AM2N_PROFILER_SAMPLE_RATE = config("AM2N_PROFILER_SAMPLE_RATE", cast=float, default="0.01")
+AM2N_PROFILER_INTERVAL = config("AM2N_PROFILER_INTERVAL", cast=float, default="0.005")
+AM2N_PROFILER_TOP_STACKS = config("AM2N_PROFILER_TOP_STACKS", cast=int, default="20")
+# Event handlers run by the worker, by name (`notion`) or import path (`package.module:Class`), see app/pipeline.py.
+AM2N_EVENT_HANDLERS = config("AM2N_EVENT_HANDLERS", cast=Csv(), default="notion")
+# Seconds an independent event handler may run, unless the handler declares its own `timeout`.
+AM2N_HANDLER_TIMEOUT = config("AM2N_HANDLER_TIMEOUT", cast=float, default="30")
+# Write-ahead journal of Notion operations, alerts already written by an earlier delivery of the event are skipped.
+# The path is required: a durable directory shared by instances (e.g. a Cloud Storage FUSE volume), so redeliveries
+# handled by another instance see it. Local /tmp of Cloud Functions is in memory and lost with the instance.
+AM2N_JOURNAL_ENABLED = config("AM2N_JOURNAL_ENABLED", cast=bool, default="false")
+AM2N_JOURNAL_PATH = config("AM2N_JOURNAL_PATH", default="")
+AM2N_JOURNAL_RETENTION = config("AM2N_JOURNAL_RETENTION", cast=float, default="86400")
+AM2N_JOURNAL_SKIP_TTL = config("AM2N_JOURNAL_SKIP_TTL", cast=float, default="3600")
+AM2N_JOURNAL_SEGMENT_BYTES = config("AM2N_JOURNAL_SEGMENT_BYTES", cast=int, default="16777216")
+# Fingerprint leases, so only one of concurrent workers creates the incident page of an alert and the others
+# update it. Use a backend shared by instances (`sqlite` on a shared volume or `redis`), `memory` guards one instance.
+AM2N_LEASES_ENABLED = config("AM2N_LEASES_ENABLED", cast=bool, default="false")
+AM2N_LEASE_BACKEND = config("AM2N_LEASE_BACKEND", cast=Choices(["memory", "sqlite", "redis"]), default="memory")
+AM2N_LEASE_URL = config("AM2N_LEASE_URL", default="")
+# Must be longer than the slowest create: shift lookup and create call, each up to AM2N_NOTION_CALL_DEADLINE.
+AM2N_LEASE_TTL = config("AM2N_LEASE_TTL", cast=float, default="120")
+AM2N_LEASE_WAIT = config("AM2N_LEASE_WAIT", cast=float, default="10")
+# Reconciliation of Firing incidents with alerts active in Alertmanager, run by `python -m app.reconciler`.
+AM2N_ALERTMANAGER_URL = config("AM2N_ALERTMANAGER_URL", default="")
+AM2N_ALERTMANAGER_RECEIVER = config("AM2N_ALERTMANAGER_RECEIVER", default="")
+AM2N_RECONCILE_BATCH_SIZE = config("AM2N_RECONCILE_BATCH_SIZE", cast=int, default="100")
+AM2N_RECONCILE_MAX_PAGES = config("AM2N_RECONCILE_MAX_PAGES", cast=int, default="50000")
+# Preload of open incidents by the worker, kept fresh by pulling pages edited since the previous pull.
+AM2N_OPEN_INCIDENTS_PRELOAD_ENABLED = config("AM2N_OPEN_INCIDENTS_PRELOAD_ENABLED", cast=bool, default="false")
+# The initial scan reads up to max size pages, 100 per query, at its own rate, not from the token's shared bucket.
+AM2N_OPEN_INCIDENTS_MAX_SIZE = config("AM2N_OPEN_INCIDENTS_MAX_SIZE", cast=int, default="5000")
+AM2N_OPEN_INCIDENTS_RATE_LIMIT = config("AM2N_OPEN_INCIDENTS_RATE_LIMIT", cast=float, default="1")
+AM2N_OPEN_INCIDENTS_REFRESH_INTERVAL = config("AM2N_OPEN_INCIDENTS_REFRESH_INTERVAL", cast=float, default="60")
@@ -0,0 +1,233 @@
+import typing as t
+
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class Store(ABC):
+    """Key-value store with per-key TTL, used for state shared between invocations (e.g. fingerprint index)."""
+
+    @abstractmethod
+    def get(self, key: str) -> str | None:
+        """Return value or None if the key is missing or expired."""
+        raise NotImplementedError()  # pragma: nocover
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: float | None = None) -> None:  # noqa: A003
+        """Set value, it expires after `ttl` seconds if set."""
+        raise NotImplementedError()  # pragma: nocover
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Delete key if it exists."""
+        raise NotImplementedError()  # pragma: nocover
+
+    @abstractmethod
+    def add(self, key: str, value: str, ttl: float | None = None) -> bool:
+        """Set value only if the key is missing or expired, returns whether it was set."""
+        raise NotImplementedError()  # pragma: nocover
+
+    @abstractmethod
+    def delete_if_equal(self, key: str, value: str) -> bool:
+        """Delete key only if it has the value, e.g. a lease held by the caller, returns whether it was deleted."""
+        raise NotImplementedError()  # pragma: nocover
+
+
+class MemoryStore(Store):
+    """In-process LRU store, least recently used keys are evicted when `max_size` is reached."""
+
+    def __init__(self, max_size: int = 10000, ttl: float | None = None) -> None:
+        """Init store, `ttl` is used for keys set without own TTL."""
+        self.max_size = max(max_size, 1)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data: OrderedDict[str, tuple[str, float | None]] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return number of stored keys, including expired ones not evicted yet."""
+        return len(self._data)
+
+    def get(self, key: str) -> str | None:
+        """Return value or None if the key is missing or expired."""
+        with self._lock:
+            if (item := self._data.get(key)) is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float | None = None) -> None:  # noqa: A003
+        """Set value, it expires after `ttl` seconds (or store's default TTL) if set."""
+        with self._lock:
+            self._put(key, value, ttl)
+
+    def _put(self, key: str, value: str, ttl: float | None) -> None:
+        ttl = ttl if ttl is not None else self.ttl
+        self._data[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        """Delete key if it exists."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def add(self, key: str, value: str, ttl: float | None = None) -> bool:
+        """Set value only if the key is missing or expired, returns whether it was set."""
+        with self._lock:
+            if (item := self._data.get(key)) is not None and (item[1] is None or item[1] > time.monotonic()):
+                return False
+            self._put(key, value, ttl)
+        return True
+
+    def delete_if_equal(self, key: str, value: str) -> bool:
+        """Delete key only if it has the value, returns whether it was deleted."""
+        with self._lock:
+            if (item := self._data.get(key)) is None or item[0] != value:
+                return False
+            del self._data[key]
+        return item[1] is None or item[1] > time.monotonic()
+
+
+class SQLiteStore(Store):
+    """Store in a SQLite file, shared by processes on the same host or a mounted volume."""
+
+    def __init__(self, path: str, table: str = "am2n_store") -> None:
+        """Init store and create the table if it doesn't exist."""
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)",
+        )
+
+    def get(self, key: str) -> str | None:
+        """Return value or None if the key is missing or expired."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value FROM {self.table} WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",  # nosec
+                (key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: float | None = None) -> None:  # noqa: A003
+        """Set value, it expires after `ttl` seconds if set."""
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",  # nosec
+                (key, value, expires_at),
+            )
+
+    def delete(self, key: str) -> None:
+        """Delete key if it exists."""
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))  # nosec
+
+    def add(self, key: str, value: str, ttl: float | None = None) -> bool:
+        """Set value only if the key is missing or expired, returns whether it was set."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                f"INSERT INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?) "  # nosec
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+                "WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (key, value, now + ttl if ttl is not None else None, now),
+            )
+        return cursor.rowcount == 1
+
+    def delete_if_equal(self, key: str, value: str) -> bool:
+        """Delete key only if it has the value, returns whether it was deleted."""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key = ? AND value = ? "  # nosec
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (key, value, time.time()),
+            )
+        return cursor.rowcount == 1
+
+    def close(self) -> None:
+        """Close database connection."""
+        self._conn.close()
+
+
+class RedisClient(t.Protocol):
+    """Subset of `redis.Redis` API used by `RedisStore`."""
+
+    def get(self, name: str) -> t.Any:  # noqa: D102
+        ...  # pragma: nocover
+
+    def set(self, name: str, value: str, ex: int | None = None, nx: bool = False) -> t.Any:  # noqa: D102, A003
+        ...  # pragma: nocover
+
+    def delete(self, *names: str) -> t.Any:  # noqa: D102
+        ...  # pragma: nocover
+
+    def eval(self, script: str, numkeys: int, *keys_and_args: str) -> t.Any:  # noqa: D102, A003
+        ...  # pragma: nocover
+
+
+# Deletes KEYS[1] only if its value is ARGV[1], atomically on the server.
+REDIS_DELETE_IF_EQUAL = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class RedisStore(Store):
+    """Store in Redis (or any server with Redis-compatible API, e.g. Memorystore or Valkey)."""
+
+    def __init__(self, client: RedisClient, prefix: str = "am2n:") -> None:
+        """Init store with a Redis client."""
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisStore":
+        """Create store for a `redis://` URL, requires `redis` package installed."""
+        import redis  # type: ignore  # Optional dependency, only needed when Redis backend is configured.
+
+        return cls(redis.Redis.from_url(url, decode_responses=True))
+
+    def get(self, key: str) -> str | None:
+        """Return value or None if the key is missing or expired."""
+        value = self.client.get(self.prefix + key)
+        if isinstance(value, bytes):
+            return value.decode("utf-8")
+        return value
+
+    def set(self, key: str, value: str, ttl: float | None = None) -> None:  # noqa: A003
+        """Set value, it expires after `ttl` seconds if set."""
+        self.client.set(self.prefix + key, value, ex=max(int(ttl), 1) if ttl is not None else None)
+
+    def delete(self, key: str) -> None:
+        """Delete key if it exists."""
+        self.client.delete(self.prefix + key)
+
+    def add(self, key: str, value: str, ttl: float | None = None) -> bool:
+        """Set value only if the key is missing or expired, returns whether it was set."""
+        ex = max(int(ttl), 1) if ttl is not None else None
+        return bool(self.client.set(self.prefix + key, value, ex=ex, nx=True))
+
+    def delete_if_equal(self, key: str, value: str) -> bool:
+        """Delete key only if it has the value, returns whether it was deleted."""
+        return bool(self.client.eval(REDIS_DELETE_IF_EQUAL, 1, self.prefix + key, value))
+
+
+def create_store(backend: str, url: str = "") -> Store | None:
+    """Create shared store by backend name: `sqlite` (url is a file path) or `redis`, None for `memory`."""
+    if backend == "sqlite":
+        return SQLiteStore(url)
+    if backend == "redis":
+        return RedisStore.from_url(url)
+    return None
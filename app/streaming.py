@@ -0,0 +1,165 @@
+"""
+Incremental parsing of large Alertmanager events, alerts are read from the stream one at a time.
+
+Alertmanager writes `alerts` before most group fields, so group fields that follow the array are known only
+after all alerts were read. Events built from the stream use `STREAM_GROUP_DEFAULTS` for fields not read yet.
+"""
+
+import typing as t
+
+import codecs
+import json
+import re
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+CHUNK_SIZE = 64 * 1024
+
+STREAM_GROUP_DEFAULTS: dict[str, t.Any] = {
+    "receiver": "",
+    "status": "",
+    "groupLabels": {},
+    "commonLabels": {},
+    "commonAnnotations": {},
+    "externalURL": "",
+    "version": "4",
+    "groupKey": "",
+    "truncatedAlerts": 0,
+}
+
+
+class StreamingParseError(ValueError):
+    """Stream is not a JSON object."""
+
+
+class Readable(t.Protocol):
+    """Binary stream, e.g. `flask.request.stream` or `io.BytesIO`."""
+
+    def read(self, size: int = -1, /) -> bytes:  # noqa: D102
+        ...  # pragma: nocover
+
+
+class StreamingEventParser:
+    """
+    Parser of an Alertmanager event reading the stream in chunks of `chunk_size` bytes.
+
+    `alerts()` yields alerts as they are parsed, `group` has the other fields read so far.
+    Memory use depends on the size of one alert, not on the size of the event.
+    """
+
+    def __init__(self, stream: Readable, chunk_size: int = CHUNK_SIZE) -> None:
+        """Init parser."""
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.group: dict[str, t.Any] = {}
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """Read next chunk into the buffer, returns False at the end of the stream."""
+        if self._eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        self._eof = not chunk
+        self._buffer = self._buffer[self._pos :] + self._decoder.decode(chunk, final=self._eof)
+        self._pos = 0
+        return True
+
+    def _skip_whitespace(self) -> None:
+        while True:
+            self._pos = WHITESPACE.match(self._buffer, self._pos).end()  # type: ignore[union-attr]
+            if self._pos < len(self._buffer) or not self._fill():
+                return
+
+    def _next_char(self) -> str:
+        self._skip_whitespace()
+        if self._pos >= len(self._buffer):
+            raise StreamingParseError("Unexpected end of JSON")
+        char = self._buffer[self._pos]
+        self._pos += 1
+        return char
+
+    def _expect(self, expected: str) -> None:
+        if (char := self._next_char()) != expected:
+            raise StreamingParseError(f"Expected {expected!r}, got {char!r}")
+
+    def _peek(self, expected: str) -> bool:
+        """Consume the next character if it's the expected one."""
+        self._skip_whitespace()
+        if self._buffer[self._pos : self._pos + 1] == expected:
+            self._pos += 1
+            return True
+        return False
+
+    def _value(self) -> t.Any:
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as e:
+                if not self._fill():
+                    raise StreamingParseError(str(e)) from e
+                continue
+            # A number at the end of the buffer may continue in the next chunk.
+            if end < len(self._buffer) or not self._fill():
+                self._pos = end
+                return value
+
+    def _separator(self, closing: str) -> bool:
+        """Consume ',' or the closing character, returns True if it's the closing one."""
+        if (char := self._next_char()) == closing:
+            return True
+        if char != ",":
+            raise StreamingParseError(f"Expected ',' or {closing!r}, got {char!r}")
+        return False
+
+    def _key(self) -> str:
+        key = self._value()
+        if not isinstance(key, str):
+            raise StreamingParseError("Object keys must be strings")
+        self._expect(":")
+        return key
+
+    def _array(self) -> t.Iterator[t.Any]:
+        if self._peek("]"):
+            return
+        while True:
+            yield self._value()
+            if self._separator("]"):
+                return
+
+    def _members(self) -> t.Iterator[t.Any]:
+        while True:
+            if (key := self._key()) == "alerts" and self._peek("["):
+                yield from self._array()
+            else:
+                self.group[key] = self._value()
+            if self._separator("}"):
+                return
+
+    def alerts(self) -> t.Iterator[t.Any]:
+        """Yield alerts of the event, fields other than `alerts` are collected to `group`."""
+        self._expect("{")
+        if not self._peek("}"):
+            yield from self._members()
+        self._skip_whitespace()
+        if self._pos < len(self._buffer):
+            raise StreamingParseError("Extra data after JSON object")
+
+
+def stream_events(parser: StreamingEventParser, max_bytes: int) -> t.Iterator[dict[str, t.Any]]:
+    """Yield events with alerts of the stream, alerts of every event take at most `max_bytes` serialized."""
+    alerts: list[t.Any] = []
+    size = 0
+    yielded = False
+    for alert in parser.alerts():
+        alert_size = len(json.dumps(alert).encode("utf-8")) + 2
+        if alerts and size + alert_size > max_bytes:
+            yield {**STREAM_GROUP_DEFAULTS, **parser.group, "alerts": alerts}
+            alerts, size, yielded = [], 0, True
+        alerts.append(alert)
+        size += alert_size
+    if alerts or not yielded:
+        yield {**STREAM_GROUP_DEFAULTS, **parser.group, "alerts": alerts}
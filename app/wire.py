@@ -0,0 +1,88 @@
+"""
+Wire format of Alertmanager events published by the receiver and consumed by the worker.
+
+Every message has the `am2n_wire` attribute with format and version, messages without it are plain JSON,
+so the worker keeps reading messages published before the format was changed.
+"""
+
+import typing as t
+
+import json
+import logging
+
+try:
+    import orjson
+
+    HAS_ORJSON = True
+except ImportError:  # pragma: nocover
+    HAS_ORJSON = False
+
+logger = logging.getLogger("wire")
+
+WIRE_ATTRIBUTE = "am2n_wire"
+JSON_V1 = "json/1"
+COMPACT_V1 = "compact/1"
+WIRE_FORMATS = {"json": JSON_V1, "compact": COMPACT_V1}
+
+# Fields of `AlertmanagerEvent` and `Alert` used by `NotionService`, the compact format drops all other fields.
+# Group and common labels and annotations are restored as empty dicts on decode.
+COMPACT_EVENT_FIELDS = ("receiver", "status", "externalURL", "version", "groupKey", "truncatedAlerts")
+COMPACT_ALERT_FIELDS = ("status", "startsAt", "endsAt", "generatorURL", "fingerprint")
+COMPACT_LABEL_FIELDS = ("alertname", "instance", "severity")
+COMPACT_ANNOTATION_FIELDS = ("description", "summary")
+COMPACT_DROPPED_EVENT_FIELDS = ("groupLabels", "commonLabels", "commonAnnotations")
+
+
+def dumps(value: t.Any) -> bytes:
+    """Serialize to compact JSON, with `orjson` if it's installed."""
+    if HAS_ORJSON:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes | str) -> t.Any:
+    """Parse JSON, with `orjson` if it's installed."""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _pick(value: t.Any, fields: tuple[str, ...]) -> t.Any:
+    if not isinstance(value, dict):
+        return value
+    return {field: value[field] for field in fields if field in value}
+
+
+def compact_event(payload: t.Any) -> t.Any:
+    """Keep only fields used by the worker, payloads that are not Alertmanager events are kept as is."""
+    if not isinstance(payload, dict) or not isinstance(payload.get("alerts"), list):
+        return payload
+    event = _pick(payload, COMPACT_EVENT_FIELDS)
+    event["alerts"] = []
+    for alert in payload["alerts"]:
+        compact_alert = _pick(alert, COMPACT_ALERT_FIELDS)
+        if isinstance(alert, dict):
+            for field, fields in (("labels", COMPACT_LABEL_FIELDS), ("annotations", COMPACT_ANNOTATION_FIELDS)):
+                if field in alert:
+                    compact_alert[field] = _pick(alert[field], fields)
+        event["alerts"].append(compact_alert)
+    return event
+
+
+def encode(payload: t.Any, wire_format: str = "json") -> tuple[bytes, dict[str, str]]:
+    """Serialize event, returns message data and attributes."""
+    if wire_format == "compact":
+        return dumps(compact_event(payload)), {WIRE_ATTRIBUTE: COMPACT_V1}
+    return json.dumps(payload).encode("utf-8"), {WIRE_ATTRIBUTE: JSON_V1}
+
+
+def decode(data: bytes | str, attributes: t.Mapping[str, str] | None = None) -> t.Any:
+    """Parse message data according to its `am2n_wire` attribute, unknown formats are parsed as JSON."""
+    wire = (attributes or {}).get(WIRE_ATTRIBUTE, JSON_V1)
+    if wire not in (JSON_V1, COMPACT_V1):
+        logger.warning("Unknown wire format %s, parsing message as JSON", wire)
+    event = loads(data)
+    if wire == COMPACT_V1 and isinstance(event, dict) and isinstance(event.get("alerts"), list):
+        for field in COMPACT_DROPPED_EVENT_FIELDS:
+            event.setdefault(field, {})
+    return event
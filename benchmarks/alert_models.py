@@ -0,0 +1,96 @@
+"""
+Throughput of parsing Alertmanager events and building incident properties, in alerts per second.
+
+Compares the previous path (full `AlertmanagerEvent` validation, `model_dump_json` per page and alert repr in logs)
+with the fast path (`EventAlerts`, cached `Alert.event_details` and log lines without the alert repr).
+Run: SETTINGS_MODULE=app.settings GCP_LOGGING=false python -m benchmarks.alert_models [--alerts N]
+"""
+
+import typing as t
+
+import argparse
+import io
+import logging
+import time
+
+from app.schemas import AlertmanagerEvent, EventAlerts
+from app.services.notion import incident_properties, status_properties
+
+logger = logging.getLogger("benchmark")
+
+
+def _event(alerts: int) -> dict[str, t.Any]:
+    return {
+        "receiver": "default/notion-incidents/notion-webhook-receiver",
+        "status": "firing",
+        "alerts": [
+            {
+                "status": "firing",
+                "labels": {"alertname": "HighMemoryUtilization", "pod": f"worker-{i}", "severity": "WARNING"},
+                "annotations": {
+                    "description": f"Pod worker-{i} is using more than 80% of its memory limit.",
+                    "summary": f"Pod memory usage is high (93.7%) for pod worker-{i}",
+                },
+                "startsAt": "2025-06-10T23:15:15.277Z",
+                "endsAt": "0001-01-01T00:00:00Z",
+                "generatorURL": "http://prometheus:9090/graph",
+                "fingerprint": f"{i:016x}",
+            }
+            for i in range(alerts)
+        ],
+        "groupLabels": {"alertname": "HighMemoryUtilization"},
+        "commonLabels": {"alertname": "HighMemoryUtilization", "severity": "WARNING"},
+        "commonAnnotations": {},
+        "externalURL": "http://alertmanager:9093",
+        "version": "4",
+        "groupKey": "{}:{alertname=HighMemoryUtilization}",
+        "truncatedAlerts": 0,
+    }
+
+
+def previous_path(event: dict[str, t.Any]) -> None:
+    """Previous implementation: full validation, alert repr in logs, serialized again for every page."""
+    for alert in AlertmanagerEvent.model_validate(event).alerts:
+        logger.info("Processing alert: %s", alert)
+        properties = {"AMEventDetails": {"rich_text": [{"text": {"content": alert.model_dump_json()}}]}}
+        logger.info("Created new Notion page for fingerprint: %s and properties: %s", alert.fingerprint, properties)
+        status_properties(alert)
+
+
+def fast_path(event: dict[str, t.Any]) -> None:
+    """Current implementation."""
+    for alert in EventAlerts.model_validate(event).alerts:
+        logger.info("Processing alert %s with status %s", alert.fingerprint, alert.status)
+        incident_properties(alert, None, [])
+        logger.info("Created new Notion page %s for fingerprint %s", "page-id", alert.fingerprint)
+        status_properties(alert)
+
+
+def _throughput(path: t.Callable[[dict[str, t.Any]], None], event: dict[str, t.Any], repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        path(event)
+    return len(event["alerts"]) * repeat / (time.perf_counter() - started)
+
+
+def main_() -> None:
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--alerts", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    # Log records are formatted like in Cloud Logging, but written to memory.
+    logger.addHandler(logging.StreamHandler(io.StringIO()))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    for alerts in args.alerts:
+        event = _event(alerts)
+        for path in (previous_path, fast_path):
+            print(  # noqa: T201
+                f"alerts={alerts:<5} {path.__name__:<14} {_throughput(path, event, args.repeat):12.0f} alerts/sec",
+            )
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,55 @@
+"""Local stand-in of Pub/Sub for benchmarks: messages published by the receiver are kept in memory."""
+
+import typing as t
+
+import base64
+import itertools
+import threading
+from concurrent.futures import Future
+
+
+class FakePublisher:
+    """`PublisherClient` stand-in, published messages are returned by `pull` in the format of push events."""
+
+    def __init__(self) -> None:
+        """Init publisher without messages."""
+        self.messages: list[dict[str, t.Any]] = []
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def __call__(self, **options: t.Any) -> "FakePublisher":
+        """Return itself, so the instance can replace `pubsub_v1.PublisherClient`, client options are ignored."""
+        return self
+
+    @staticmethod
+    def topic_path(project: str, topic: str) -> str:
+        """Return topic path."""
+        return f"projects/{project}/topics/{topic}"
+
+    def publish(self, topic: str, data: bytes, ordering_key: str = "", **attributes: str) -> Future[str]:
+        """Keep the message, returns a future with its ID."""
+        future: Future[str] = Future()
+        with self._lock:
+            message_id = str(next(self._ids))
+            self.messages.append(
+                {
+                    "data": base64.b64encode(data).decode(),
+                    "attributes": attributes,
+                    "messageId": message_id,
+                    "orderingKey": ordering_key,
+                },
+            )
+        future.set_result(message_id)
+        return future
+
+    def resume_publish(self, topic: str, ordering_key: str) -> None:
+        """Publishing never fails, nothing to resume."""
+
+    def stop(self) -> None:
+        """Nothing to flush."""
+
+    def pull(self) -> list[dict[str, t.Any]]:
+        """Return and forget published messages, they are events `main.handle_event` gets from push subscription."""
+        with self._lock:
+            messages, self.messages = self.messages, []
+        return messages
@@ -0,0 +1,100 @@
+"""
+Per-request latency of the webhook receiver with and without process-level reuse of Flask app and publisher.
+
+Run: SETTINGS_MODULE=app.settings GCP_LOGGING=false python -m benchmarks.http_request [--requests N]
+"""
+
+import typing as t
+
+import argparse
+import logging
+import statistics
+import time
+from concurrent.futures import Future
+from unittest.mock import patch
+
+import main
+from flask import Flask, Request, Response
+from google.api_core.client_options import ClientOptions
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import pubsub_v1  # type: ignore
+from python_settings import settings
+from werkzeug.test import EnvironBuilder
+
+from app import blueprints
+from app.http_handlers import call_alertmanager_to_notion
+
+PublisherClient = pubsub_v1.PublisherClient
+PAYLOAD = {"alerts": [{"status": "firing", "fingerprint": "f" * 16}]}
+
+
+def _offline_publisher() -> pubsub_v1.PublisherClient:
+    """Real publisher client (gRPC channel, auth) whose `publish` doesn't leave the process."""
+    client = PublisherClient(
+        credentials=AnonymousCredentials(),
+        client_options=ClientOptions(api_endpoint="localhost:1"),
+    )
+
+    def publish(topic: str, data: bytes, **kwargs: t.Any) -> Future[str]:
+        future: Future[str] = Future()
+        future.set_result("message-id")
+        return future
+
+    client.publish = publish
+    return client
+
+
+def _request() -> Request:
+    builder = EnvironBuilder(
+        method="POST",
+        path="/alertmanager",
+        json=PAYLOAD,
+        headers={settings.AM2N_HTTP_HEADER_NAME: settings.AM2N_HTTP_HEADER_VALUE},
+    )
+    return Request(builder.get_environ())
+
+
+def handle_http_request_per_request_setup(request: Request) -> Response:
+    """Previous implementation: new Flask app and new publisher client for every request."""
+    http_app = Flask("main")
+    for blueprint in blueprints:
+        http_app.register_blueprint(blueprint)
+
+    with http_app.request_context(request.environ):
+        response = http_app.full_dispatch_request()
+    call_alertmanager_to_notion.publisher.close()
+    return response
+
+
+def _measure(handler: t.Callable[[Request], Response], requests: int) -> list[float]:
+    timings = []
+    for _ in range(requests):
+        request = _request()
+        started = time.perf_counter()
+        response = handler(request)
+        timings.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 202, response.data  # nosec
+    return timings
+
+
+def _report(name: str, timings: list[float]) -> None:
+    quantiles = statistics.quantiles(timings, n=100)
+    print(  # noqa: T201
+        f"{name:<28} mean={statistics.mean(timings):8.3f}ms p50={quantiles[49]:8.3f}ms p99={quantiles[98]:8.3f}ms",
+    )
+
+
+def main_() -> None:
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with patch.object(call_alertmanager_to_notion.pubsub_v1, "PublisherClient", _offline_publisher):
+        _report("per-request app+publisher", _measure(handle_http_request_per_request_setup, args.requests))
+        _report("reused app+publisher", _measure(main.handle_http_request, args.requests))
+
+
+if __name__ == "__main__":
+    main_()
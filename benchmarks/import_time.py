@@ -0,0 +1,59 @@
+"""
+Cold start import time of every Cloud Function entry point, measured with `python -X importtime` in a new process.
+
+Run: SETTINGS_MODULE=app.settings GCP_LOGGING=false python -m benchmarks.import_time [--top N]
+"""
+
+import argparse
+import os
+import subprocess  # nosec
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+
+# Statements importing what the first invocation of every function imports.
+ENTRY_POINTS = {
+    "main": "import main",
+    "handle_http_request": "import app.entrypoints.receiver",
+    "handle_event": "import app.entrypoints.worker",
+}
+
+
+def import_times(statement: str) -> dict[str, int]:
+    """Run the statement in a new interpreter, returns cumulative import time in microseconds of every module."""
+    env = {"SETTINGS_MODULE": "app.settings", **os.environ, "GCP_LOGGING": "false"}
+    result = subprocess.run(  # nosec
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=BASE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, module = line.removeprefix("import time:").split("|")
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def main_() -> None:
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level imports to show")
+    args = parser.parse_args()
+
+    baseline = import_times("pass")
+    for name, statement in ENTRY_POINTS.items():
+        times = {module: us for module, us in import_times(statement).items() if module not in baseline}
+        top_level = {module: us for module, us in times.items() if "." not in module}
+        print(f"{name:<20} total={sum(top_level.values()) / 1000:8.1f}ms modules={len(times)}")  # noqa: T201
+        for module, us in sorted(top_level.items(), key=lambda item: -item[1])[: args.top]:
+            print(f"    {module:<40} {us / 1000:8.1f}ms")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,192 @@
+"""
+TLS handshakes and latency per Pub/Sub event with a new Notion client per event and with a reused one.
+
+Runs against a local TLS stand-in of Notion API with a self-signed certificate (requires `openssl` binary).
+Run: SETTINGS_MODULE=app.settings GCP_LOGGING=false python -m benchmarks.notion_connections [--events N]
+"""
+
+import typing as t
+
+import argparse
+import functools
+import json
+import logging
+import ssl
+import statistics
+import subprocess  # nosec
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest.mock import patch
+
+from notion_client import Client
+
+from app.event_handlers import notion as notion_handler
+from app.services import notion as notion_service
+
+
+class FakeNotionHandler(BaseHTTPRequestHandler):
+    """Answers database queries with no results and page creations with a new page."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:  # noqa: N802
+        """Handle Notion API call."""
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.endswith("/query"):
+            body = {"object": "list", "results": [], "has_more": False, "next_cursor": None}
+        else:
+            body = {"object": "page", "id": str(uuid.uuid4())}
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args: t.Any) -> None:
+        """Don't log requests."""
+
+
+class TLSServer(ThreadingHTTPServer):
+    """HTTPS server counting accepted connections, every connection is a full TLS handshake."""
+
+    daemon_threads = True
+
+    def __init__(self, context: ssl.SSLContext) -> None:
+        """Init server on a random local port."""
+        super().__init__(("127.0.0.1", 0), FakeNotionHandler)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        self.handshakes = 0
+
+    def get_request(self) -> tuple[t.Any, t.Any]:
+        """Accept connection."""
+        request = super().get_request()
+        self.handshakes += 1
+        return request
+
+
+def _certificate(directory: Path) -> tuple[Path, Path]:
+    cert, key = directory / "cert.pem", directory / "key.pem"
+    subprocess.run(  # nosec
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "rsa:2048",
+            "-nodes",
+            "-days",
+            "1",
+            "-subj",
+            "/CN=127.0.0.1",
+            "-addext",
+            "subjectAltName=IP:127.0.0.1",
+            "-keyout",
+            str(key),
+            "-out",
+            str(cert),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+def _event(alerts: int) -> dict[str, t.Any]:
+    return {
+        "receiver": "r",
+        "status": "firing",
+        "alerts": [
+            {
+                "status": "firing",
+                "startsAt": "2025-06-08T07:00:00Z",
+                "endsAt": "0001-01-01T00:00:00Z",
+                "fingerprint": uuid.uuid4().hex[:16],
+            }
+            for _ in range(alerts)
+        ],
+        "groupLabels": {},
+        "commonLabels": {},
+        "commonAnnotations": {},
+        "externalURL": "",
+        "version": "4",
+        "groupKey": "",
+        "truncatedAlerts": 0,
+    }
+
+
+def _new_service_per_event() -> notion_service.NotionService:
+    """Previous implementation: new service, Notion client and connection pool for every event."""
+    return notion_service.NotionService(
+        token="token",
+        incidents_db_id="db",
+        shifts_db_id="",
+        shifts_enabled=False,
+        http_client=notion_handler.create_notion_http_client("token"),
+    )
+
+
+def _reused_service() -> notion_service.NotionService:
+    return notion_handler.get_notion_service(
+        token="token",
+        incidents_db_id="db",
+        shifts_db_id="",
+        shifts_enabled=False,
+        notion_version="2022-06-28",
+        max_concurrency=1,
+    )
+
+
+def _measure(server: TLSServer, get_service: t.Callable[[], notion_service.NotionService], args: t.Any) -> None:
+    server.handshakes = 0
+    timings = []
+    for _ in range(args.events):
+        started = time.perf_counter()
+        service = get_service()
+        service.handle_alert(_event(args.alerts))
+        timings.append((time.perf_counter() - started) * 1000)
+        if get_service is _new_service_per_event:
+            service.client.close()
+    print(  # noqa: T201
+        f"{get_service.__name__:<24} handshakes/event={server.handshakes / args.events:6.2f} "
+        f"mean={statistics.mean(timings):8.3f}ms p50={statistics.median(timings):8.3f}ms",
+    )
+
+
+def main_() -> None:
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=50)
+    parser.add_argument("--alerts", type=int, default=3, help="alerts per event")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = _certificate(Path(directory))
+        server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        server_context.load_cert_chain(cert, key)
+        client_context = ssl.create_default_context(cafile=str(cert))
+        server = TLSServer(server_context)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"https://127.0.0.1:{server.server_port}"
+        with (
+            patch.object(notion_service, "Client", functools.partial(Client, base_url=base_url)),
+            patch.object(
+                notion_handler,
+                "create_notion_transport",
+                functools.partial(notion_handler.create_notion_transport, verify=client_context),
+            ),
+            patch.object(notion_handler.settings, "AM2N_NOTION_RATE_LIMIT", 10000),
+            patch.object(notion_handler.settings, "AM2N_NOTION_RATE_LIMIT_BURST", 10000),
+        ):
+            _measure(server, _new_service_per_event, args)
+            _measure(server, _reused_service, args)
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main_()
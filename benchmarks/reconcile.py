@@ -0,0 +1,84 @@
+"""
+Time and peak memory of reconciling a large incidents database with Alertmanager.
+
+The fake Notion API holds `--database-sizes` Firing incidents, `--active` of them still have an active alert in the
+fake Alertmanager API and the rest are resolved by `app.reconciler`. Peak memory is measured with `tracemalloc`, it
+grows with references of stale incidents (up to `AM2N_RECONCILE_MAX_PAGES`), not with whole pages.
+Run: SETTINGS_MODULE=app.settings GCP_LOGGING=false python -m benchmarks.reconcile [--database-sizes 50000]
+"""
+
+import typing as t
+
+import argparse
+import functools
+import logging
+import time
+import tracemalloc
+from collections import Counter
+from datetime import timedelta
+from unittest.mock import patch
+
+from notion_client import Client
+from python_settings import settings
+
+from app import lifecycle, reconciler
+from app.services import notion as notion_service
+from tests.fixtures.fake_alertmanager import FakeAlertmanagerServer
+from tests.fixtures.fake_notion import FakeNotionServer
+
+
+class Result(t.NamedTuple):
+    """Outcome of a reconciliation run."""
+
+    seconds: float
+    peak_bytes: int
+    fixed: int
+    calls: Counter[str]
+
+
+def run_reconcile(notion: FakeNotionServer, alertmanager: FakeAlertmanagerServer) -> Result:
+    """Reconcile the fake Notion database with the fake Alertmanager from a cold instance."""
+    lifecycle.close_all()
+    with patch.object(notion_service, "Client", functools.partial(Client, base_url=notion.base_url)):
+        tracemalloc.start()
+        started = time.perf_counter()
+        report = reconciler.run(reconciler.fetch_alerts(alertmanager.base_url))
+        seconds = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        lifecycle.close_all()
+    return Result(seconds, peak, len(report.results) if report else 0, Counter(notion.calls))
+
+
+def main_() -> None:
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--active", type=int, default=100, help="incidents whose alert is still active")
+    parser.add_argument("--rate-limit", type=float, default=1000, help="AM2N_NOTION_RATE_LIMIT, Notion allows 3")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    with (
+        patch.object(settings, "AM2N_NOTION_RATE_LIMIT", args.rate_limit),
+        patch.object(settings, "AM2N_NOTION_RATE_LIMIT_BURST", args.rate_limit),
+    ):
+        for size in args.database_sizes:
+            notion = FakeNotionServer().start()
+            fingerprints = [f"firing-{i:08x}" for i in range(size)]
+            for fingerprint in fingerprints:
+                notion.add_page(fingerprint, "Firing")
+            notion.backdate(timedelta(hours=1))
+            alertmanager = FakeAlertmanagerServer(fingerprints[: args.active]).start()
+            result = run_reconcile(notion, alertmanager)
+            print(  # noqa: T201
+                f"incidents={size:<7} fixed={result.fixed:<7} seconds={result.seconds:7.2f} "
+                f"peak memory={result.peak_bytes / 2**20:7.2f}MiB "
+                f"queries={result.calls['databases.query']:<5} updates={result.calls['pages.update']}",
+            )
+            alertmanager.stop()
+            notion.stop()
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,206 @@
+"""
+End-to-end latency and throughput of the receiver and the worker in alert storms.
+
+Every notification is posted to `main.handle_http_request`, then messages it published are passed to
+`main.handle_event` like Pub/Sub push does. Notion API and Pub/Sub are local stand-ins, see `tests.fixtures.fake_notion`
+and `benchmarks.fake_pubsub`. Reports p50/p99 latency of the receiver, the worker and the whole notification,
+alerts per second and Notion calls per alert for storms of 1, 100 and 5000 alerts per group and for repeat
+notifications of the same groups. Other settings (e.g. `AM2N_NOTION_ASYNC`) are read from the environment.
+Run: SETTINGS_MODULE=app.settings GCP_LOGGING=false python -m benchmarks.storm [--latency 0.2] [--throttle-rate 0.05]
+"""
+
+import typing as t
+
+import argparse
+import functools
+import logging
+import math
+import time
+from collections import Counter
+from unittest.mock import patch
+
+import main
+from benchmarks.fake_pubsub import FakePublisher
+from flask import Request
+from notion_client import AsyncClient, Client
+from python_settings import settings
+from werkzeug.test import EnvironBuilder
+
+from app import lifecycle, metrics
+from app.http_handlers import call_alertmanager_to_notion
+from app.services import notion as notion_service
+from app.services import notion_async
+from tests.fixtures.fake_notion import FakeNotionServer
+
+
+class Scenario(t.NamedTuple):
+    """Notifications of `groups` groups with `alerts` alerts each, every group is notified `repeats` times."""
+
+    name: str
+    groups: int
+    alerts: int
+    repeats: int = 1
+    resolve: bool = False
+
+
+class Result(t.NamedTuple):
+    """Timings in milliseconds and Notion calls of a scenario."""
+
+    alerts: int
+    seconds: float
+    receiver: list[float]
+    worker: list[float]
+    notification: list[float]
+    calls: Counter[str]
+
+
+def percentile(timings: list[float], q: float) -> float:
+    """Nearest-rank percentile, 0 for no timings."""
+    if not timings:
+        return 0
+    ordered = sorted(timings)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+def notification(group: int, alerts: int, status: str) -> dict[str, t.Any]:
+    """Alertmanager notification of a group, alert fingerprints are unique for the group and alert number."""
+    return {
+        "receiver": "default/notion-incidents/notion-webhook-receiver",
+        "status": status,
+        "alerts": [
+            {
+                "status": status,
+                "labels": {"alertname": "HighMemoryUtilization", "pod": f"worker-{group}-{i}", "severity": "WARNING"},
+                "annotations": {
+                    "description": f"Pod worker-{group}-{i} is using more than 80% of its memory limit.",
+                    "summary": f"Pod memory usage is high (93.7%) for pod worker-{group}-{i}",
+                },
+                "startsAt": "2025-06-10T23:15:15.277Z",
+                "endsAt": "2025-06-11T00:15:15.277Z" if status == "resolved" else "0001-01-01T00:00:00Z",
+                "generatorURL": "http://prometheus:9090/graph",
+                "fingerprint": f"{group:06x}{i:010x}",
+            }
+            for i in range(alerts)
+        ],
+        "groupLabels": {"alertname": "HighMemoryUtilization", "group": str(group)},
+        "commonLabels": {"alertname": "HighMemoryUtilization", "severity": "WARNING"},
+        "commonAnnotations": {},
+        "externalURL": "http://alertmanager:9093",
+        "version": "4",
+        "groupKey": f"{{}}:{{alertname=HighMemoryUtilization,group={group}}}",
+        "truncatedAlerts": 0,
+    }
+
+
+def notifications(scenario: Scenario) -> t.Iterator[dict[str, t.Any]]:
+    """Notifications of the scenario in the order Alertmanager sends them."""
+    for _ in range(scenario.repeats):
+        for group in range(scenario.groups):
+            yield notification(group, scenario.alerts, "firing")
+    if scenario.resolve:
+        for group in range(scenario.groups):
+            yield notification(group, scenario.alerts, "resolved")
+
+
+def _request(payload: dict[str, t.Any]) -> Request:
+    builder = EnvironBuilder(
+        method="POST",
+        path="/alertmanager",
+        json=payload,
+        headers={settings.AM2N_HTTP_HEADER_NAME: settings.AM2N_HTTP_HEADER_VALUE},
+    )
+    return Request(builder.get_environ())
+
+
+def deliver(publisher: FakePublisher) -> list[float]:
+    """Handle published messages by the worker, returns timings of events."""
+    timings = []
+    for event in publisher.pull():
+        started = time.perf_counter()
+        main.handle_event(event, None)  # type: ignore[arg-type]
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def run_scenario(scenario: Scenario, notion: FakeNotionServer) -> Result:
+    """Run the scenario from a cold instance against the fake Notion API."""
+    lifecycle.close_all()
+    metrics.reset()
+    publisher = FakePublisher()
+    alerts, receiver, worker, notification_timings = 0, [], [], []
+    with (
+        patch.object(call_alertmanager_to_notion.pubsub_v1, "PublisherClient", publisher),
+        patch.object(notion_service, "Client", functools.partial(Client, base_url=notion.base_url)),
+        patch.object(notion_async, "AsyncClient", functools.partial(AsyncClient, base_url=notion.base_url)),
+    ):
+        started = time.perf_counter()
+        for payload in notifications(scenario):
+            request = _request(payload)
+            request_started = time.perf_counter()
+            response = main.handle_http_request(request)
+            receiver_ms = (time.perf_counter() - request_started) * 1000
+            assert response.status_code in (200, 202), response.data  # nosec
+            event_timings = deliver(publisher)
+            alerts += len(payload["alerts"])
+            receiver.append(receiver_ms)
+            worker.extend(event_timings)
+            notification_timings.append(receiver_ms + sum(event_timings))
+        seconds = time.perf_counter() - started
+        lifecycle.close_all()
+    return Result(alerts, seconds, receiver, worker, notification_timings, Counter(notion.calls))
+
+
+def report(name: str, result: Result) -> None:
+    """Print results of the scenario."""
+    calls = sum(result.calls.values())
+    print(  # noqa: T201
+        f"{name:<20} alerts={result.alerts:<6} alerts/sec={result.alerts / result.seconds:9.1f} "
+        f"notion calls/alert={calls / result.alerts:5.2f} throttled={result.calls['throttled']:<4} "
+        f"receiver p50/p99={percentile(result.receiver, 50):8.2f}/{percentile(result.receiver, 99):8.2f}ms "
+        f"worker p50/p99={percentile(result.worker, 50):8.2f}/{percentile(result.worker, 99):8.2f}ms "
+        f"notification p50/p99={percentile(result.notification, 50):8.2f}/{percentile(result.notification, 99):8.2f}ms",
+    )
+
+
+def scenarios(args: argparse.Namespace) -> list[Scenario]:
+    """Storms of `--storm-alerts` alerts in groups of every `--group-sizes` size and repeat notifications."""
+    storms = [
+        Scenario(f"storm {size} alerts/group", groups=max(args.storm_alerts // size, 1), alerts=size)
+        for size in args.group_sizes
+    ]
+    repeat = Scenario("repeat notifications", groups=10, alerts=100, repeats=args.repeats, resolve=True)
+    return [*storms, repeat]
+
+
+def main_() -> None:
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--group-sizes", type=int, nargs="+", default=[1, 100, 5000])
+    parser.add_argument("--storm-alerts", type=int, default=1000, help="alerts of a storm split into groups")
+    parser.add_argument("--repeats", type=int, default=5, help="firing notifications of a group before resolved")
+    parser.add_argument("--database-size", type=int, default=10000, help="incidents in the Notion database")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds Notion takes to answer a call")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="share of Notion calls answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After of 429 responses")
+    parser.add_argument("--rate-limit", type=float, default=1000, help="AM2N_NOTION_RATE_LIMIT, Notion allows 3")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    with (
+        patch.object(settings, "AM2N_NOTION_RATE_LIMIT", args.rate_limit),
+        patch.object(settings, "AM2N_NOTION_RATE_LIMIT_BURST", args.rate_limit),
+    ):
+        for scenario in scenarios(args):
+            notion = FakeNotionServer(
+                shifts_db_id=settings.AM2N_SHIFTS_DB_ID or "",
+                database_size=args.database_size,
+                latency=args.latency,
+                throttle_rate=args.throttle_rate,
+                retry_after=args.retry_after,
+            ).start()
+            report(scenario.name, run_scenario(scenario, notion))
+            notion.stop()
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,98 @@
+"""
+Serialization cost and message size of wire formats for large Alertmanager groups, receiver and worker side.
+
+Run: SETTINGS_MODULE=app.settings GCP_LOGGING=false python -m benchmarks.wire_format [--alerts N]
+"""
+
+import typing as t
+
+import argparse
+import base64
+import json
+import statistics
+import time
+
+from app import wire
+
+
+def _event(alerts: int) -> dict[str, t.Any]:
+    labels = {
+        "alertname": "HighMemoryUtilization",
+        "namespace": "default",
+        "prometheus": "prometheus/prometheus-grafana-kube-pr-prometheus",
+        "severity": "WARNING",
+        "container": "worker",
+        "job": "kubelet",
+    }
+    return {
+        "receiver": "default/notion-incidents/notion-webhook-receiver",
+        "status": "firing",
+        "alerts": [
+            {
+                "status": "firing",
+                "labels": labels | {"pod": f"celery-worker-{i}", "instance": f"10.0.0.{i % 255}:9100"},
+                "annotations": {
+                    "description": f"Pod celery-worker-{i} is using more than 80% of its memory limit.",
+                    "summary": f"Pod memory usage is high (93.7%) for pod celery-worker-{i}",
+                    "runbook_url": "https://runbooks.example.com/HighMemoryUtilization",
+                },
+                "startsAt": "2025-06-10T23:15:15.277Z",
+                "endsAt": "0001-01-01T00:00:00Z",
+                "generatorURL": "http://prometheus-grafana-kube-pr-prometheus.prometheus:9090/graph?g0.expr=...",
+                "fingerprint": f"{i:016x}",
+            }
+            for i in range(alerts)
+        ],
+        "groupLabels": {"alertname": "HighMemoryUtilization"},
+        "commonLabels": labels,
+        "commonAnnotations": {},
+        "externalURL": "http://alertmanager.prometheus:9093",
+        "version": "4",
+        "groupKey": '{}:{alertname="HighMemoryUtilization"}',
+        "truncatedAlerts": 0,
+    }
+
+
+def _measure(func: t.Callable[[], t.Any], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main_() -> None:
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--alerts", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    print(f"orjson installed: {wire.HAS_ORJSON}")  # noqa: T201
+
+    for alerts in args.alerts:
+        payload = _event(alerts)
+        body = json.dumps(payload).encode()
+        cases = {
+            # Previous implementation: request body parsed, serialized again and parsed by the worker.
+            "json reserialized": lambda payload=payload: json.dumps(payload).encode(),
+            "json passthrough": lambda body=body: body,
+            "compact": lambda payload=payload: wire.encode(payload, "compact")[0],
+        }
+        for name, encode in cases.items():
+            data = encode()
+            attributes = {wire.WIRE_ATTRIBUTE: wire.COMPACT_V1 if name == "compact" else wire.JSON_V1}
+            encoded = base64.b64encode(data)
+            receiver_ms = _measure(encode, args.repeat)
+            worker_ms = _measure(
+                lambda encoded=encoded, attributes=attributes: wire.decode(base64.b64decode(encoded), attributes),
+                args.repeat,
+            )
+            print(  # noqa: T201
+                f"alerts={alerts:<5} {name:<18} size={len(data) / 1024:9.1f}KiB "
+                f"receiver={receiver_ms:8.3f}ms worker={worker_ms:8.3f}ms",
+            )
+
+
+if __name__ == "__main__":
+    main_()
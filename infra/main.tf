@@ -173,6 +173,32 @@ resource "google_pubsub_topic" "events_topic" {
   ]
 }
 
+# Delivers messages with the same ordering key (the alert fingerprint) in publish order, so a resolved alert
+# is never written before its firing one. Failed messages are redelivered before the next ones of their key.
+resource "google_pubsub_subscription" "events_ordered_subscription" {
+  count                   = var.am2n_publish_fanout ? 1 : 0
+  name                    = "${var.events_pubsub_topic}-ordered"
+  topic                   = google_pubsub_topic.events_topic.id
+  enable_message_ordering = true
+  ack_deadline_seconds    = 600
+
+  push_config {
+    push_endpoint = google_cloudfunctions2_function.alertmanager_to_notion_handler.service_config[0].uri
+    oidc_token {
+      service_account_email = google_service_account.alertmanager_to_notion_function_sa.email
+    }
+  }
+
+  retry_policy {
+    minimum_backoff = "10s"
+    maximum_backoff = "600s"
+  }
+
+  depends_on = [
+    google_project_service.pubsub_api,
+  ]
+}
+
 resource "null_resource" "generate_requirements" {
   provisioner "local-exec" {
     command = "docker compose run --quiet-pull --no-deps --rm -v $(pwd):/app app make generate_requirements"
@@ -263,10 +289,17 @@ resource "google_cloudfunctions2_function" "alertmanager_to_notion_handler" {
     }
   }
 
-  event_trigger {
-    trigger_region = var.region
-    event_type     = "google.cloud.pubsub.topic.v1.messagePublished"
-    pubsub_topic   = google_pubsub_topic.events_topic.id
+  # Subscriptions of Eventarc triggers can't enable message ordering, fanned out alerts are pushed by
+  # the ordered events_ordered_subscription instead.
+  dynamic "event_trigger" {
+    for_each = var.am2n_publish_fanout ? [] : [1]
+    content {
+      trigger_region = var.region
+      event_type     = "google.cloud.pubsub.topic.v1.messagePublished"
+      pubsub_topic   = google_pubsub_topic.events_topic.id
+      # Events whose alerts failed with retryable Notion errors are redelivered, done alerts are skipped by the journal.
+      retry_policy   = "RETRY_POLICY_RETRY"
+    }
   }
 
   depends_on = [
@@ -313,9 +346,10 @@ resource "google_cloudfunctions2_function" "alertmanager_to_notion_webhook" {
     service_account_email = google_service_account.alertmanager_to_notion_function_sa.email
     ingress_settings      = "ALLOW_ALL"
     environment_variables = {
-      GCP_PROJECT_ID   = var.project_id
-      SETTINGS_MODULE  = "app.settings"
-      LOG_LEVEL        = var.log_level
+      GCP_PROJECT_ID      = var.project_id
+      SETTINGS_MODULE     = "app.settings"
+      LOG_LEVEL           = var.log_level
+      AM2N_PUBLISH_FANOUT = var.am2n_publish_fanout
     }
     # Adding secrets as environment variables
     secret_environment_variables {
@@ -394,6 +428,7 @@ data "archive_file" "am2n_sources_archive" {
     ".git",
     "infra",
     "tests",
+    "benchmarks",
     "config",
     ".idea",
     ".*_cache",
@@ -42,6 +42,11 @@ variable "events_pubsub_topic" {
   default = "events-topic"
 }
 
+variable "am2n_publish_fanout" {
+  type    = bool
+  default = false
+}
+
 variable "log_level" {
   type    = string
   default = "INFO"
@@ -1,47 +1,26 @@
-import typing as t
-
-import logging
+"""
+Cloud Functions entry points.
 
-import google.cloud.logging
-from flask import Flask, Request, Response
-from python_settings import settings
+Both functions are deployed from the same source, so every entry point imports its own dependencies on the first
+invocation: the HTTP receiver never loads Notion client and the worker never loads Flask or Pub/Sub publisher.
+"""
 
-from app import blueprints, event_handlers, exceptions
+import typing as t
 
 if t.TYPE_CHECKING:
-    from google.cloud.functions_v1.context import Context
-
-if settings.GCP_LOGGING:
-    client = google.cloud.logging.Client()
-    client.setup_logging(log_level=settings.LOG_LEVEL)
-else:
-    logging.basicConfig(level=settings.LOG_LEVEL)
-
-logger = logging.getLogger("main")
+    from flask import Request, Response  # pragma: nocover
+    from google.cloud.functions_v1.context import Context  # pragma: nocover
 
 
 def handle_event(event: dict[str, t.Any], context: "Context") -> None:
     """Handle event from pubsub."""
-    logger.info("Handle event started")
-
-    for handler in event_handlers:
-        try:
-            logger.info(f"Handle event by {handler.__name__}")
-            handler(event, context)()
-            logger.info(f"Finished handle event by {handler.__name__}")
-        except exceptions.StopHandlingEvent:
-            logger.info("Got stop handling event from handler %s", handler.__name__)
-            break
+    from app.entrypoints import worker
 
-    logger.info("Handle event finished")
+    worker.handle_event(event, context)
 
 
-def handle_http_request(request: Request) -> Response:
+def handle_http_request(request: "Request") -> "Response":
     """Handle HTTP-requests."""
-    http_app = Flask(__name__)
-    for blueprint in blueprints:
-        http_app.register_blueprint(blueprint)
+    from app.entrypoints import receiver
 
-    with http_app.request_context(request.environ):
-        logger.debug("Before request, req.environ=%s", request.environ)
-        return http_app.full_dispatch_request()
+    return receiver.handle_http_request(request)
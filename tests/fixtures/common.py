@@ -1,6 +1,15 @@
 import pytest
 from python_settings import settings
 
+from app import lifecycle, metrics
+from app.schemas import Alert
+from tests.fixtures.fake_notion import FakeNotionServer
+
+
+def make_alert(fingerprint: str, status: str = "firing") -> Alert:
+    """Build minimal alert."""
+    return Alert(status=status, startsAt="2025-06-08T07:00:00Z", endsAt="0001-01-01T00:00:00Z", fingerprint=fingerprint)
+
 
 @pytest.fixture(scope="session", autouse=True)
 def mock_settings():
@@ -9,6 +18,15 @@ def mock_settings():
     settings.GCP_LOGGING = False
 
 
+@pytest.fixture(autouse=True)
+def reset_lifecycle():
+    """Drop process-level resources and metrics so every test starts from a cold instance."""
+    lifecycle.reset_all()
+    metrics.reset()
+    yield
+    lifecycle.reset_all()
+
+
 @pytest.fixture
 def alert_payload():
     """Fixture for a sample Alertmanager event payload."""
@@ -52,3 +70,11 @@ def alert_payload():
         "groupKey": '{}/{namespace="default",severity=~"CRITICAL|WARNING"}:{pod="celery-worker-9b56786b8-7njwj"}',
         "truncatedAlerts": 0,
     }
+
+
+@pytest.fixture
+def fake_notion():
+    """Fixture for the local fake Notion API, 429 responses ask to retry right away."""
+    server = FakeNotionServer(retry_after=0).start()
+    yield server
+    server.stop()
@@ -0,0 +1,69 @@
+"""Local stand-in of Alertmanager API for tests and benchmarks: `GET /api/v2/alerts` returns alerts kept in memory."""
+
+import typing as t
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def api_alert(fingerprint: str, state: str = "active") -> dict[str, t.Any]:
+    """Alert in the format of Alertmanager API v2."""
+    return {
+        "fingerprint": fingerprint,
+        "status": {"state": state, "silencedBy": [], "inhibitedBy": []},
+        "labels": {"alertname": "Benchmark", "instance": fingerprint},
+        "annotations": {"summary": f"Alert {fingerprint}"},
+        "startsAt": "2025-06-08T07:00:00Z",
+        "endsAt": "2099-01-01T00:00:00Z",
+        "updatedAt": "2025-06-08T07:00:00Z",
+        "generatorURL": "http://prometheus/graph",
+        "receivers": [{"name": "notion"}],
+    }
+
+
+class FakeAlertmanagerHandler(BaseHTTPRequestHandler):
+    """Answers `GET /api/v2/alerts` with alerts of `FakeAlertmanagerServer`."""
+
+    server: "FakeAlertmanagerServer"
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Return active alerts."""
+        if self.path.split("?")[0] != "/api/v2/alerts":
+            self.send_error(404)
+            return
+        data = json.dumps(self.server.alerts).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args: t.Any) -> None:
+        """Don't log requests."""
+
+
+class FakeAlertmanagerServer(ThreadingHTTPServer):
+    """Alertmanager API with active alerts of the given fingerprints."""
+
+    daemon_threads = True
+
+    def __init__(self, fingerprints: t.Iterable[str] = ()) -> None:
+        """Init server on a random local port."""
+        super().__init__(("127.0.0.1", 0), FakeAlertmanagerHandler)
+        self.alerts = [api_alert(fingerprint) for fingerprint in fingerprints]
+
+    @property
+    def base_url(self) -> str:
+        """URL to pass as `AM2N_ALERTMANAGER_URL`."""
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def start(self) -> "FakeAlertmanagerServer":
+        """Serve requests in a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving and close the socket."""
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,246 @@
+"""
+Local stand-in of Notion API for tests and benchmarks, databases are kept in memory.
+
+Serves the calls made by Notion services: `databases.query` with `AMFingerprint`, `AMStatus` and `last_edited_time`
+filters, `last_edited_time` sorts and cursor pagination, `pages.create` and `pages.update`. Every response is delayed
+by `latency` seconds and a `throttle_rate` share of calls is answered with 429 and `Retry-After`, like Notion does when
+the rate limit is exceeded. Status codes queued in `statuses` answer the next calls.
+"""
+
+import typing as t
+
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytz
+
+from app.services.notion import get_page_fingerprint
+
+SHIFT_PAGE = {
+    "object": "page",
+    "id": "shift-page",
+    "properties": {"On-Duty": {"people": [{"object": "user", "id": "on-duty-user"}]}},
+}
+
+
+def page_status(page: dict[str, t.Any]) -> str | None:
+    """Return `AMStatus` of a page."""
+    return (page["properties"].get("AMStatus", {}).get("select") or {}).get("name")
+
+
+def matches(page: dict[str, t.Any], condition: dict[str, t.Any]) -> bool:
+    """Whether the page matches a `databases.query` filter, conditions on other properties match any page."""
+    if "or" in condition:
+        return any(matches(page, part) for part in condition["or"])
+    if "and" in condition:
+        return all(matches(page, part) for part in condition["and"])
+    if condition.get("property") == "AMFingerprint":
+        return get_page_fingerprint(page) == condition["rich_text"]["equals"]
+    if condition.get("property") == "AMStatus":
+        select = condition["select"]
+        return (
+            page_status(page) == select["equals"]
+            if "equals" in select
+            else page_status(page) != select["does_not_equal"]
+        )
+    if condition.get("timestamp") == "last_edited_time":
+        edited = datetime.fromisoformat(page["last_edited_time"])
+        return edited >= datetime.fromisoformat(condition["last_edited_time"]["on_or_after"])
+    return True
+
+
+def filter_fingerprints(condition: dict[str, t.Any]) -> list[str] | None:
+    """Fingerprints of a filter made of `AMFingerprint` conditions only, None for other filters."""
+    conditions = condition.get("or", [condition])
+    if not all(part.get("property") == "AMFingerprint" for part in conditions):
+        return None
+    return [part["rich_text"]["equals"] for part in conditions]
+
+
+def error(status: int, code: str, message: str) -> tuple[int, dict[str, t.Any]]:
+    """Notion API error response."""
+    return status, {"object": "error", "status": status, "code": code, "message": message}
+
+
+def queued_error(status: int) -> tuple[int, dict[str, t.Any]]:
+    """Notion API error response of a queued status code."""
+    if status == 429:
+        return error(status, "rate_limited", "You have been rate limited.")
+    return error(status, "internal_server_error", "Unexpected error occurred.")
+
+
+class FakeNotionHandler(BaseHTTPRequestHandler):
+    """Passes Notion API calls to `FakeNotionServer`."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, with Nagle's algorithm every call would wait for a delayed ACK.
+    disable_nagle_algorithm = True
+    server: "FakeNotionServer"
+
+    def do_POST(self) -> None:  # noqa: N802
+        """Handle `databases.query` and `pages.create`."""
+        self.server.respond(self)
+
+    def do_PATCH(self) -> None:  # noqa: N802
+        """Handle `pages.update`."""
+        self.server.respond(self)
+
+    def log_message(self, *args: t.Any) -> None:
+        """Don't log requests."""
+
+
+class FakeNotionServer(ThreadingHTTPServer):
+    """
+        Notion API with an incidents database of `database_size` resolved incidents and a shifts database.
+
+        Calls are counted by endpoint in `calls`, calls answered with 429 are counted as `throttled` and calls answered
+    with a queued status code as `failed`.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        shifts_db_id: str = "",
+        database_size: int = 0,
+        latency: float = 0,
+        throttle_rate: float = 0,
+        retry_after: float = 1,
+        seed: int = 0,
+    ) -> None:
+        """Init server on a random local port."""
+        super().__init__(("127.0.0.1", 0), FakeNotionHandler)
+        self.shifts_db_id = shifts_db_id
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.pages: dict[str, dict[str, t.Any]] = {}
+        self.pages_by_fingerprint: dict[str, dict[str, t.Any]] = {}
+        self.calls: Counter[str] = Counter()
+        self.statuses: list[int] = []
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)  # nosec
+        for i in range(database_size):
+            self.add_page(f"existing-{i:08x}", "Resolved")
+
+    @property
+    def base_url(self) -> str:
+        """URL to pass as `base_url` to Notion clients."""
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def start(self) -> "FakeNotionServer":
+        """Serve requests in a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving and close the socket."""
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request: t.Any, client_address: t.Any) -> None:
+        """Don't print connections closed by clients, e.g. after a 429 response."""
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def add_page(self, fingerprint: str, status: str) -> dict[str, t.Any]:
+        """Add incident page to the database."""
+        page: dict[str, t.Any] = {
+            "object": "page",
+            "id": f"page-{next(self._ids):08x}",
+            "archived": False,
+            "created_time": datetime.now(tz=pytz.utc).isoformat(),
+            "last_edited_time": datetime.now(tz=pytz.utc).isoformat(),
+            "properties": {
+                "AMFingerprint": {"rich_text": [{"plain_text": fingerprint, "text": {"content": fingerprint}}]},
+                "AMStatus": {"select": {"name": status}},
+            },
+        }
+        self.pages[page["id"]] = page
+        self.pages_by_fingerprint.setdefault(fingerprint, page)
+        return page
+
+    def backdate(self, age: timedelta) -> None:
+        """Move creation and last edit of all pages `age` into the past, e.g. before a snapshot of alerts."""
+        when = (datetime.now(tz=pytz.utc) - age).isoformat()
+        for page in self.pages.values():
+            page["created_time"] = page["last_edited_time"] = when
+
+    def query(self, database_id: str, body: dict[str, t.Any]) -> tuple[int, dict[str, t.Any]]:
+        """Answer `databases.query`, `start_cursor` is the offset of the next result."""
+        if database_id == self.shifts_db_id:
+            return 200, {"object": "list", "results": [SHIFT_PAGE], "has_more": False, "next_cursor": None}
+        condition = body.get("filter") or {}
+        if (fingerprints := filter_fingerprints(condition)) is not None:
+            found = (self.pages_by_fingerprint.get(fingerprint) for fingerprint in fingerprints)
+            results = [page for page in found if page]
+        else:
+            results = [page for page in self.pages.values() if matches(page, condition)]
+        for sort in reversed(body.get("sorts") or []):
+            results.sort(key=lambda page: page[sort["timestamp"]], reverse=sort["direction"] == "descending")
+        start = int(body.get("start_cursor") or 0)
+        end = start + int(body.get("page_size") or 100)
+        return 200, {
+            "object": "list",
+            "results": results[start:end],
+            "has_more": end < len(results),
+            "next_cursor": str(end) if end < len(results) else None,
+        }
+
+    def create(self, body: dict[str, t.Any]) -> tuple[int, dict[str, t.Any]]:
+        """Answer `pages.create`."""
+        properties = body["properties"]
+        fingerprint = "".join(part["text"]["content"] for part in properties["AMFingerprint"]["rich_text"])
+        return 200, self.add_page(fingerprint, properties["AMStatus"]["select"]["name"])
+
+    def update(self, page_id: str, body: dict[str, t.Any]) -> tuple[int, dict[str, t.Any]]:
+        """Answer `pages.update`."""
+        if not (page := self.pages.get(page_id)) or page["archived"]:
+            return error(404, "object_not_found", f"Could not find page with ID: {page_id}.")
+        page["properties"] |= body.get("properties", {})
+        page["last_edited_time"] = datetime.now(tz=pytz.utc).isoformat()
+        return 200, page
+
+    def route(self, method: str, path: str, body: dict[str, t.Any]) -> tuple[str, tuple[int, dict[str, t.Any]]]:
+        """Return endpoint name and response of the call."""
+        parts = path.strip("/").split("/")
+        if method == "POST" and parts[1:2] == ["databases"] and parts[3:] == ["query"]:
+            return "databases.query", self.query(parts[2], body)
+        if method == "POST" and parts[1:] == ["pages"]:
+            return "pages.create", self.create(body)
+        if method == "PATCH" and parts[1:2] == ["pages"] and len(parts) == 3:
+            return "pages.update", self.update(parts[2], body)
+        return "unknown", error(400, "invalid_request_url", f"Invalid request URL: {method} {path}")
+
+    def respond(self, handler: FakeNotionHandler) -> None:
+        """Answer the call after `latency` seconds, a `throttle_rate` share of calls gets 429."""
+        body = json.loads(handler.rfile.read(int(handler.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(self.latency)
+        headers = {"Content-Type": "application/json"}
+        with self._lock:
+            if self.statuses:
+                self.calls["failed"] += 1
+                status, response = queued_error(self.statuses.pop(0))
+            elif self._random.random() < self.throttle_rate:
+                self.calls["throttled"] += 1
+                status, response = error(429, "rate_limited", "You have been rate limited.")
+            else:
+                endpoint, (status, response) = self.route(handler.command, handler.path, body)
+                self.calls[endpoint] += 1
+        if status == 429:
+            headers["Retry-After"] = str(self.retry_after)
+        data = json.dumps(response).encode()
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
@@ -1,13 +1,44 @@
 import base64
 import json
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
+import httpx
+import pytest
 from google.cloud.functions_v1.context import Context
+from python_settings import settings
 
-from app.event_handlers.notion import NotionHandler
+from app import lifecycle, metrics, wire
+from app.event_handlers.notion import (
+    AsyncNotionHandler,
+    NotionHandler,
+    create_async_notion_http_client,
+    create_notion_http_client,
+    create_notion_transport,
+)
+from app.exceptions import AlertsFailed
+from app.services.notion import AlertResult, EventReport
+from app.services.rate_limit import RateLimitedTransport
 
 
-@patch("app.services.notion.NotionService.handle_alert")
+def patch_service(name: str, report: EventReport | None = None):
+    """Patch Notion service class of the handlers, its events are handled with the report."""
+    report = report or EventReport()
+    return patch(
+        f"app.event_handlers.notion.{name}",
+        **{"return_value.handle_alert.return_value": report, "return_value.handle_alert_stream.return_value": report},
+    )
+
+
+FAILED_REPORT = EventReport(
+    results=[
+        AlertResult(fingerprint="a", status="firing", action="updated"),
+        AlertResult(fingerprint="b", status="firing", error="APIResponseError()", retryable=True),
+        AlertResult(fingerprint="c", status="firing", error="APIResponseError()"),
+    ],
+)
+
+
+@patch("app.services.notion.NotionService.handle_alert", return_value=EventReport())
 def test_notion_handler_calls_service(mock_handle_alert, alert_payload):
     """Test that NotionHandler calls NotionService with the correct payload."""
     json_payload = json.dumps(alert_payload).encode("utf-8")
@@ -20,3 +51,140 @@ def test_notion_handler_calls_service(mock_handle_alert, alert_payload):
     handler = NotionHandler(event, Context())
     handler()
     mock_handle_alert.assert_called_once_with(alert_payload)
+
+
+@patch("app.services.notion.NotionService.handle_alert", return_value=EventReport())
+def test_notion_handler_decodes_compact_format(mock_handle_alert, alert_payload):
+    """Test that NotionHandler reads the wire format from message attributes."""
+    data, attributes = wire.encode(alert_payload, "compact")
+    event = {"data": base64.b64encode(data).decode("utf-8"), "attributes": attributes}
+    NotionHandler(event, Context())()
+    event_data = mock_handle_alert.call_args.args[0]
+    assert event_data["alerts"][0]["fingerprint"] == alert_payload["alerts"][0]["fingerprint"]
+    assert event_data["commonAnnotations"] == {}
+
+
+@patch_service("NotionService")
+def test_notion_handler_streams_large_event(mock_service, alert_payload, monkeypatch):
+    """Test that alerts of a large event are parsed one at a time instead of loading the event."""
+    monkeypatch.setattr(settings, "AM2N_STREAMING_ENABLED", True)
+    monkeypatch.setattr(settings, "AM2N_STREAMING_MIN_BYTES", 0)
+    event = {"data": base64.b64encode(json.dumps(alert_payload).encode("utf-8")).decode("utf-8")}
+    NotionHandler(event, Context())()
+    mock_service.return_value.handle_alert.assert_not_called()
+    alerts = mock_service.return_value.handle_alert_stream.call_args.args[0]
+    assert list(alerts) == alert_payload["alerts"]
+
+
+@patch_service("NotionService", FAILED_REPORT)
+def test_notion_handler_fails_event_with_retryable_failures(mock_service, alert_payload, monkeypatch):
+    """Test that the event fails if an alert may succeed on retry, so Pub/Sub redelivers it, streamed or not."""
+    event = {"data": base64.b64encode(json.dumps(alert_payload).encode("utf-8")).decode("utf-8")}
+    with pytest.raises(AlertsFailed, match="1 of 3 alerts failed"):
+        NotionHandler(event, Context())()
+    monkeypatch.setattr(settings, "AM2N_STREAMING_ENABLED", True)
+    monkeypatch.setattr(settings, "AM2N_STREAMING_MIN_BYTES", 0)
+    with pytest.raises(AlertsFailed):
+        NotionHandler(event, Context())()
+
+
+@patch_service("NotionService", EventReport(results=FAILED_REPORT.results[::2]))
+def test_notion_handler_drops_terminal_failures(mock_service, alert_payload, monkeypatch):
+    """Test that alerts and events that can't succeed on retry are logged and acked, streamed or not."""
+    event = {"data": base64.b64encode(json.dumps(alert_payload).encode("utf-8")).decode("utf-8")}
+    metrics.reset()
+    with patch("app.event_handlers.notion.logger") as mock_logger:
+        NotionHandler(event, Context())()
+        monkeypatch.setattr(settings, "AM2N_STREAMING_ENABLED", True)
+        monkeypatch.setattr(settings, "AM2N_STREAMING_MIN_BYTES", 0)
+        NotionHandler(event, Context())()
+        monkeypatch.setattr(settings, "AM2N_STREAMING_ENABLED", False)
+        mock_service.return_value.handle_alert.return_value = None
+        NotionHandler(event, Context())()
+    assert metrics.get("notion_alerts_dropped") == 2
+    assert metrics.get("notion_events_dropped") == 1
+    assert mock_logger.warning.call_count == 3
+
+
+@patch_service("NotionService")
+def test_notion_handler_passes_max_concurrency(mock_service, alert_payload, monkeypatch):
+    """Test that NotionHandler configures service concurrency from settings."""
+    monkeypatch.setattr(settings, "AM2N_NOTION_MAX_CONCURRENCY", 3)
+    event = {"data": base64.b64encode(json.dumps(alert_payload).encode("utf-8")).decode("utf-8")}
+    NotionHandler(event, Context())()
+    assert mock_service.call_args.kwargs["max_concurrency"] == 3
+
+
+@patch_service("NotionService")
+def test_notion_handler_reuses_service(mock_service, alert_payload):
+    """Test that events handled by the instance reuse the service and its connections."""
+    event = {"data": base64.b64encode(json.dumps(alert_payload).encode("utf-8")).decode("utf-8")}
+    NotionHandler(event, Context())()
+    NotionHandler(event, Context())()
+    assert mock_service.call_count == 1
+    assert mock_service.return_value.handle_alert.call_count == 2
+
+
+@patch_service("NotionService")
+def test_notion_handler_shares_caches_between_services(mock_service, alert_payload, monkeypatch):
+    """Test that services for different tokens share caches but not HTTP clients."""
+    event = {"data": base64.b64encode(json.dumps(alert_payload).encode("utf-8")).decode("utf-8")}
+    NotionHandler(event, Context())()
+    monkeypatch.setattr(settings, "AM2N_NOTION_TOKEN", "other-token")
+    NotionHandler(event, Context())()
+    first, second = (call.kwargs for call in mock_service.call_args_list)
+    for name in ("index", "shift_cache", "status_tracker"):
+        assert first[name] is second[name] is not None
+    assert first["http_client"] is not second["http_client"]
+    lifecycle.close_all()
+    mock_service.return_value.client.close.assert_called()
+
+
+@patch_service("NotionService")
+def test_notion_handler_uses_rate_limited_client(mock_service, alert_payload):
+    """Test that Notion API calls go through the rate limited transport."""
+    event = {"data": base64.b64encode(json.dumps(alert_payload).encode("utf-8")).decode("utf-8")}
+    NotionHandler(event, Context())()
+    assert isinstance(mock_service.call_args.kwargs["http_client"]._transport, RateLimitedTransport)
+
+
+def test_clients_of_a_token_share_rate_limiter():
+    """Test that sync and async clients of a token take tokens from one bucket, other tokens get their own."""
+    lifecycle.close_all()
+    sync_client = create_notion_http_client("token")
+    async_client = create_async_notion_http_client("token")
+    other_client = create_notion_http_client("other")
+    limiter = sync_client._transport.limiter
+    assert async_client._transport.limiter is limiter
+    assert other_client._transport.limiter is not limiter
+    sync_client.close()
+    other_client.close()
+    lifecycle.close_all()
+
+
+def test_create_notion_transport_http2_only_if_available():
+    """Test that HTTP/2 is enabled only when `h2` package is installed."""
+    with patch("app.event_handlers.notion.importlib.util.find_spec", return_value=None):
+        with patch("app.event_handlers.notion.httpx.HTTPTransport") as mock_transport:
+            create_notion_transport()
+    assert mock_transport.call_args.kwargs["http2"] is False
+    assert mock_transport.call_args.kwargs["limits"].max_connections == settings.AM2N_NOTION_POOL_MAX_CONNECTIONS
+
+
+@patch_service("AsyncNotionService")
+def test_async_notion_handler(mock_service, alert_payload):
+    """Test that AsyncNotionHandler awaits AsyncNotionService with the payload."""
+    mock_service.return_value.handle_alert = AsyncMock(return_value=EventReport())
+    event = {"data": base64.b64encode(json.dumps(alert_payload).encode("utf-8")).decode("utf-8")}
+    lifecycle.run_async(AsyncNotionHandler(event, Context())())
+    mock_service.return_value.handle_alert.assert_awaited_once_with(alert_payload)
+    assert isinstance(mock_service.call_args.kwargs["http_client"], httpx.AsyncClient)
+
+
+@patch_service("AsyncNotionService")
+def test_async_notion_handler_fails_event_with_failed_alerts(mock_service, alert_payload):
+    """Test that AsyncNotionHandler fails the event if any alert failed."""
+    mock_service.return_value.handle_alert = AsyncMock(return_value=FAILED_REPORT)
+    event = {"data": base64.b64encode(json.dumps(alert_payload).encode("utf-8")).decode("utf-8")}
+    with pytest.raises(AlertsFailed):
+        lifecycle.run_async(AsyncNotionHandler(event, Context())())
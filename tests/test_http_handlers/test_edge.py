@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from app.http_handlers import edge
+from app.schemas import AlertmanagerEvent
+
+
+def test_validate_accepts_alertmanager_event(alert_payload):
+    """Test that a valid payload passes validation."""
+    edge.validate(alert_payload)
+
+
+@pytest.mark.parametrize("payload", [{"alerts": []}, ["not", "a", "dict"], {"alerts": [{"status": "firing"}]}])
+def test_validate_rejects_malformed_payload(payload):
+    """Test that payloads not matching the schema are rejected."""
+    with pytest.raises(edge.InvalidPayload):
+        edge.validate(payload)
+
+
+def test_trim_drops_unused_fields_and_truncates_annotations(alert_payload):
+    """Test that the trimmed payload is smaller and still valid."""
+    alert_payload["alerts"][0]["annotations"]["description"] = "x" * 50
+    trimmed = edge.trim(alert_payload, max_annotation_length=10)
+    assert trimmed["commonAnnotations"] == trimmed["commonLabels"] == trimmed["groupLabels"] == {}
+    assert trimmed["alerts"][0]["annotations"]["description"] == "x" * 9 + "…"
+    assert "pod" not in trimmed["alerts"][0]["labels"]
+    assert len(json.dumps(trimmed)) < len(json.dumps(alert_payload))
+    AlertmanagerEvent.model_validate(trimmed)
+
+
+def test_split_by_size(alert_payload):
+    """Test that oversized groups are split into messages under the budget keeping all alerts in order."""
+    alert = alert_payload["alerts"][0]
+    alert_payload["alerts"] = [alert | {"fingerprint": str(i)} for i in range(20)]
+    budget = len(json.dumps(alert_payload)) // 3
+    parts = edge.split_by_size(alert_payload, budget)
+    assert len(parts) > 1
+    assert all(len(json.dumps(part)) <= budget for part in parts)
+    assert [alert for part in parts for alert in part["alerts"]] == alert_payload["alerts"]
+    for part in parts:
+        assert part["groupKey"] == alert_payload["groupKey"]
+
+
+def test_split_by_size_keeps_small_events(alert_payload):
+    """Test that events under the budget and single alerts are not split."""
+    assert edge.split_by_size(alert_payload, 10**6)[0] is alert_payload
+    assert edge.split_by_size(alert_payload, 1)[0] is alert_payload
@@ -1,10 +1,14 @@
-from unittest.mock import patch
+import json
+from concurrent import futures
+from unittest.mock import MagicMock, patch
 
 import pytest
 from flask import Flask
 from python_settings import settings
 
-from app import blueprints
+from app import blueprints, lifecycle, metrics, wire
+from app.http_handlers.call_alertmanager_to_notion import publish_event, split_event
+from app.schemas import AlertmanagerEvent
 
 
 @pytest.fixture(scope="session")
@@ -65,3 +69,322 @@ def test_call_alertmanager_success(mock_publisher_client, auth_client):
     response = auth_client.post("/alertmanager", json={"alerts": []})
     assert response.status_code == 202, response.data
     assert response.json == {"message_id": "message_id1"}
+
+
+@patch("app.http_handlers.call_alertmanager_to_notion.pubsub_v1.PublisherClient")
+def test_call_alertmanager_reuses_publisher(mock_publisher_client, auth_client):
+    """Test that publisher client is created once and reused by next requests."""
+    mock_publisher_client.return_value.publish.return_value.result.return_value = "message_id1"
+    for _ in range(3):
+        response = auth_client.post("/alertmanager", json={"alerts": []})
+        assert response.status_code == 202, response.data
+    mock_publisher_client.assert_called_once()
+    assert mock_publisher_client.return_value.publish.call_count == 3
+    assert metrics.get("pubsub_publish_succeeded") == 3
+
+
+@patch("app.http_handlers.call_alertmanager_to_notion.pubsub_v1.PublisherClient")
+def test_publisher_uses_batch_settings_and_flushes_on_shutdown(mock_publisher_client, auth_client, monkeypatch):
+    """Test that publisher is created with batch settings from config and stopped on shutdown."""
+    monkeypatch.setattr(settings, "AM2N_PUBLISH_BATCH_MAX_MESSAGES", 10)
+    mock_publisher_client.return_value.publish.return_value.result.return_value = "message_id1"
+    auth_client.post("/alertmanager", json={"alerts": []})
+    batch_settings = mock_publisher_client.call_args.kwargs["batch_settings"]
+    assert batch_settings.max_messages == 10
+    assert batch_settings.max_bytes == settings.AM2N_PUBLISH_BATCH_MAX_BYTES
+    assert batch_settings.max_latency == settings.AM2N_PUBLISH_BATCH_MAX_LATENCY
+    lifecycle.close_all()
+    mock_publisher_client.return_value.stop.assert_called_once_with()
+
+
+@patch("app.http_handlers.call_alertmanager_to_notion.pubsub_v1.PublisherClient")
+def test_call_alertmanager_async_mode(mock_publisher_client, auth_client, monkeypatch):
+    """Test that async mode returns once the message is handed off to the batcher."""
+    monkeypatch.setattr(settings, "AM2N_PUBLISH_MODE", "async")
+    future = futures.Future()
+    mock_publisher_client.return_value.publish.return_value = future
+    response = auth_client.post("/alertmanager", json={"alerts": []})
+    assert response.status_code == 202, response.data
+    assert response.json == {"status": "accepted"}
+    assert metrics.get("pubsub_publish_succeeded") == 0
+    future.set_result("message_id1")
+    assert metrics.get("pubsub_publish_succeeded") == 1
+
+
+@patch("app.http_handlers.call_alertmanager_to_notion.pubsub_v1.PublisherClient")
+def test_call_alertmanager_async_mode_publish_error(mock_publisher_client, auth_client, monkeypatch):
+    """Test that errors of async publishing are counted by done-callback."""
+    monkeypatch.setattr(settings, "AM2N_PUBLISH_MODE", "async")
+    future = futures.Future()
+    mock_publisher_client.return_value.publish.return_value = future
+    response = auth_client.post("/alertmanager", json={"alerts": []})
+    assert response.status_code == 202, response.data
+    future.set_exception(Exception("Exception1"))
+    assert metrics.get("pubsub_publish_failed") == 1
+    assert metrics.get("pubsub_publish_succeeded") == 0
+
+
+def test_split_event_disabled(alert_payload):
+    """Test that the whole group is published as one message when fan-out is disabled."""
+    assert split_event(alert_payload) == [(alert_payload, "")]
+
+
+def test_split_event_fanout(alert_payload, monkeypatch):
+    """Test that fan-out creates a valid compact event per alert ordered by fingerprint."""
+    monkeypatch.setattr(settings, "AM2N_PUBLISH_FANOUT", True)
+    second_alert = {**alert_payload["alerts"][0], "status": "firing", "fingerprint": "second"}
+    alert_payload["alerts"].append(second_alert)
+    events = split_event(alert_payload)
+    assert [ordering_key for _, ordering_key in events] == ["26270adf29eda488", "second"]
+    for (event, _), alert in zip(events, alert_payload["alerts"], strict=True):
+        assert event["alerts"] == [alert]
+        assert event["status"] == alert["status"]
+        assert event["groupKey"] == alert_payload["groupKey"]
+        assert event["commonLabels"] == alert_payload["commonLabels"]
+        assert event["externalURL"] == alert_payload["externalURL"]
+        assert event["commonAnnotations"] == {}
+        AlertmanagerEvent.model_validate(event)
+
+
+@pytest.mark.parametrize("payload", [{"alerts": []}, {"alerts": "invalid"}, ["not", "a", "dict"]])
+def test_split_event_fanout_without_alerts(payload, monkeypatch):
+    """Test that payloads without alerts are published as is."""
+    monkeypatch.setattr(settings, "AM2N_PUBLISH_FANOUT", True)
+    assert split_event(payload) == [(payload, "")]
+
+
+@patch("app.http_handlers.call_alertmanager_to_notion.pubsub_v1.PublisherClient")
+def test_call_alertmanager_fanout(mock_publisher_client, auth_client, alert_payload, monkeypatch):
+    """Test that fan-out publishes one message per alert with fingerprint as ordering key."""
+    monkeypatch.setattr(settings, "AM2N_PUBLISH_FANOUT", True)
+    alert_payload["alerts"].append({**alert_payload["alerts"][0], "fingerprint": "second"})
+    mock_publish = mock_publisher_client.return_value.publish
+    mock_publish.return_value.result.side_effect = ["message_id1", "message_id2"]
+    response = auth_client.post("/alertmanager", json=alert_payload)
+    assert response.status_code == 202, response.data
+    assert response.json == {"message_ids": ["message_id1", "message_id2"]}
+    assert [call.kwargs["ordering_key"] for call in mock_publish.call_args_list] == ["26270adf29eda488", "second"]
+    assert mock_publisher_client.call_args.kwargs["publisher_options"].enable_message_ordering is True
+    assert metrics.get("pubsub_publish_succeeded") == 2
+
+
+def test_publish_event_resumes_ordering_key_on_error():
+    """Test that a failed publish resumes its ordering key, so next messages aren't rejected."""
+    client = MagicMock()
+    future = futures.Future()
+    client.publish.return_value = future
+    assert publish_event(client, "topic", b"data", "key") is future
+    future.set_exception(Exception("Exception1"))
+    client.resume_publish.assert_called_once_with("topic", "key")
+
+
+def test_publish_event_resume_error_is_logged():
+    """Test that a failed resume doesn't raise from the done-callback."""
+    client = MagicMock()
+    client.resume_publish.side_effect = RuntimeError("stopped")
+    future = futures.Future()
+    client.publish.return_value = future
+    publish_event(client, "topic", b"data", "key")
+    future.set_exception(Exception("Exception1"))
+    client.resume_publish.assert_called_once_with("topic", "key")
+
+
+def test_publish_event_success_doesnt_resume():
+    """Test that a successful publish doesn't touch the ordering key."""
+    client = MagicMock()
+    future = futures.Future()
+    client.publish.return_value = future
+    publish_event(client, "topic", b"data", "key")
+    future.set_result("message_id1")
+    client.resume_publish.assert_not_called()
+
+
+def published_future(message_id="message_id1"):
+    """Publish future completed by Pub/Sub."""
+    future = futures.Future()
+    future.set_result(message_id)
+    return future
+
+
+@patch("app.http_handlers.call_alertmanager_to_notion.pubsub_v1.PublisherClient")
+def test_call_alertmanager_drops_duplicates(mock_publisher_client, auth_client, alert_payload, monkeypatch):
+    """Test that a repeat notification of unchanged alerts is acknowledged but not published."""
+    monkeypatch.setattr(settings, "AM2N_DEDUP_ENABLED", True)
+    mock_publisher_client.return_value.publish.side_effect = lambda *args, **kwargs: published_future()
+    assert auth_client.post("/alertmanager", json=alert_payload).status_code == 202
+    response = auth_client.post("/alertmanager", json=alert_payload)
+    assert response.status_code == 200, response.data
+    assert response.json == {"status": "duplicate"}
+    assert mock_publisher_client.return_value.publish.call_count == 1
+    assert metrics.get("receiver_duplicates_dropped") == 1
+
+    alert_payload["alerts"][0]["endsAt"] = "2025-06-12T00:00:00Z"
+    assert auth_client.post("/alertmanager", json=alert_payload).status_code == 202
+    assert mock_publisher_client.return_value.publish.call_count == 2
+
+
+@patch("app.http_handlers.call_alertmanager_to_notion.pubsub_v1.PublisherClient")
+def test_call_alertmanager_republishes_after_failed_publish(
+    mock_publisher_client,
+    auth_client,
+    alert_payload,
+    monkeypatch,
+):
+    """Test that a notification isn't remembered until it's published, so Alertmanager retries get through."""
+    monkeypatch.setattr(settings, "AM2N_DEDUP_ENABLED", True)
+    failed = futures.Future()
+    failed.set_exception(Exception("Exception1"))
+    mock_publisher_client.return_value.publish.side_effect = [failed, published_future()]
+    assert auth_client.post("/alertmanager", json=alert_payload).status_code == 500
+    assert auth_client.post("/alertmanager", json=alert_payload).status_code == 202
+    assert metrics.get("receiver_duplicates_dropped") == 0
+
+
+@patch("app.http_handlers.call_alertmanager_to_notion.pubsub_v1.PublisherClient")
+def test_call_alertmanager_dedup_fanout(mock_publisher_client, auth_client, alert_payload, monkeypatch):
+    """Test that fan-out drops only duplicate alerts of a group."""
+    monkeypatch.setattr(settings, "AM2N_PUBLISH_FANOUT", True)
+    monkeypatch.setattr(settings, "AM2N_DEDUP_ENABLED", True)
+    mock_publish = mock_publisher_client.return_value.publish
+    mock_publish.side_effect = lambda *args, **kwargs: published_future()
+    auth_client.post("/alertmanager", json=alert_payload)
+    alert_payload["alerts"].append({**alert_payload["alerts"][0], "fingerprint": "second"})
+    response = auth_client.post("/alertmanager", json=alert_payload)
+    assert response.status_code == 202, response.data
+    assert [call.kwargs["ordering_key"] for call in mock_publish.call_args_list] == ["26270adf29eda488", "second"]
+
+
+@patch("app.http_handlers.call_alertmanager_to_notion.pubsub_v1.PublisherClient")
+def test_call_alertmanager_dedup_disabled(mock_publisher_client, auth_client, alert_payload):
+    """Test that every notification is published when dedup is disabled, the default."""
+    assert not settings.AM2N_DEDUP_ENABLED
+    mock_publisher_client.return_value.publish.side_effect = lambda *args, **kwargs: published_future()
+    for _ in range(2):
+        assert auth_client.post("/alertmanager", json=alert_payload).status_code == 202
+    assert mock_publisher_client.return_value.publish.call_count == 2
+
+
+@patch("app.http_handlers.call_alertmanager_to_notion.pubsub_v1.PublisherClient")
+def test_call_alertmanager_passes_request_body_through(mock_publisher_client, auth_client, alert_payload):
+    """Test that the request body is published as is in JSON format, without serializing the payload again."""
+    mock_publish = mock_publisher_client.return_value.publish
+    mock_publish.return_value.result.return_value = "message_id1"
+    body = json.dumps(alert_payload, indent=2)
+    response = auth_client.post("/alertmanager", data=body, content_type="application/json")
+    assert response.status_code == 202, response.data
+    assert mock_publish.call_args.kwargs["data"] == body.encode()
+    assert mock_publish.call_args.kwargs["am2n_wire"] == "json/1"
+
+
+@patch("app.http_handlers.call_alertmanager_to_notion.pubsub_v1.PublisherClient")
+def test_call_alertmanager_compact_format(mock_publisher_client, auth_client, alert_payload, monkeypatch):
+    """Test that compact format is published with its version attribute."""
+    monkeypatch.setattr(settings, "AM2N_WIRE_FORMAT", "compact")
+    mock_publish = mock_publisher_client.return_value.publish
+    mock_publish.return_value.result.return_value = "message_id1"
+    assert auth_client.post("/alertmanager", json=alert_payload).status_code == 202
+    assert mock_publish.call_args.kwargs["am2n_wire"] == "compact/1"
+    event = wire.decode(mock_publish.call_args.kwargs["data"], {"am2n_wire": "compact/1"})
+    assert event["alerts"][0]["fingerprint"] == "26270adf29eda488"
+
+
+def test_call_alertmanager_rejects_invalid_event(auth_client, monkeypatch):
+    """Test that malformed payloads get 400 right away when edge validation is enabled."""
+    monkeypatch.setattr(settings, "AM2N_EDGE_VALIDATION_ENABLED", True)
+    response = auth_client.post("/alertmanager", json={"alerts": [{"status": "firing"}]})
+    assert response.status_code == 400, response.data
+    assert response.json == {"error": "Invalid Alertmanager event"}
+    assert metrics.get("receiver_invalid_payloads") == 1
+
+
+@patch("app.http_handlers.call_alertmanager_to_notion.pubsub_v1.PublisherClient")
+def test_call_alertmanager_splits_oversized_group(mock_publisher_client, auth_client, alert_payload, monkeypatch):
+    """Test that a group over the byte budget is trimmed and published as several messages."""
+    monkeypatch.setattr(settings, "AM2N_EDGE_VALIDATION_ENABLED", True)
+    monkeypatch.setattr(settings, "AM2N_EDGE_MAX_MESSAGE_BYTES", 1000)
+    alert = alert_payload["alerts"][0]
+    alert_payload["alerts"] = [alert | {"fingerprint": str(i)} for i in range(5)]
+    mock_publish = mock_publisher_client.return_value.publish
+    mock_publish.return_value.result.side_effect = [f"message_id{i}" for i in range(5)]
+    response = auth_client.post("/alertmanager", json=alert_payload)
+    assert response.status_code == 202, response.data
+    assert len(response.json["message_ids"]) == mock_publish.call_count > 1
+    events = [wire.decode(call.kwargs["data"]) for call in mock_publish.call_args_list]
+    assert all(len(call.kwargs["data"]) <= 1000 for call in mock_publish.call_args_list)
+    assert [alert["fingerprint"] for event in events for alert in event["alerts"]] == [str(i) for i in range(5)]
+    assert all(event["commonAnnotations"] == {} for event in events)
+
+
+@patch("app.http_handlers.call_alertmanager_to_notion.pubsub_v1.PublisherClient")
+def test_call_alertmanager_streams_large_payload(mock_publisher_client, auth_client, alert_payload, monkeypatch):
+    """Test that a large payload is parsed from the stream and published in events under the byte budget."""
+    monkeypatch.setattr(settings, "AM2N_STREAMING_ENABLED", True)
+    monkeypatch.setattr(settings, "AM2N_STREAMING_MIN_BYTES", 0)
+    monkeypatch.setattr(settings, "AM2N_EDGE_MAX_MESSAGE_BYTES", 1500)
+    alert = alert_payload["alerts"][0]
+    alert_payload["alerts"] = [alert | {"fingerprint": str(i)} for i in range(5)]
+    mock_publish = mock_publisher_client.return_value.publish
+    mock_publish.return_value.result.return_value = "message_id1"
+    with patch("flask.Request.get_json") as mock_get_json:
+        response = auth_client.post("/alertmanager", json=alert_payload)
+    assert response.status_code == 202, response.data
+    mock_get_json.assert_not_called()
+    events = [wire.decode(call.kwargs["data"]) for call in mock_publish.call_args_list]
+    assert len(events) > 1
+    assert [alert["fingerprint"] for event in events for alert in event["alerts"]] == [str(i) for i in range(5)]
+    for event in events:
+        AlertmanagerEvent.model_validate(event)
+
+
+def test_call_alertmanager_streaming_invalid_json(auth_client, monkeypatch):
+    """Test that a malformed streamed payload gets 400."""
+    monkeypatch.setattr(settings, "AM2N_STREAMING_ENABLED", True)
+    monkeypatch.setattr(settings, "AM2N_STREAMING_MIN_BYTES", 0)
+    response = auth_client.post("/alertmanager", data="notjson", content_type="application/json")
+    assert response.status_code == 400, response.data
+    assert response.json == {"error": "Invalid JSON"}
+
+
+@patch("app.http_handlers.call_alertmanager_to_notion.pubsub_v1.PublisherClient")
+def test_call_alertmanager_streaming_accepts_partially_published_payload(
+    mock_publisher_client,
+    auth_client,
+    alert_payload,
+    monkeypatch,
+):
+    """Test that a streamed payload malformed after some events were published is accepted, so it's not resent."""
+    monkeypatch.setattr(settings, "AM2N_STREAMING_ENABLED", True)
+    monkeypatch.setattr(settings, "AM2N_STREAMING_MIN_BYTES", 0)
+    monkeypatch.setattr(settings, "AM2N_EDGE_MAX_MESSAGE_BYTES", 1500)
+    alert = alert_payload["alerts"][0]
+    alert_payload["alerts"] = [alert | {"fingerprint": str(i)} for i in range(5)]
+    data = json.dumps(alert_payload)
+    malformed = data[: data.index('"groupLabels"')] + "}"
+    mock_publish = mock_publisher_client.return_value.publish
+    mock_publish.return_value.result.return_value = "message_id1"
+    with patch("app.http_handlers.call_alertmanager_to_notion.logger") as mock_logger:
+        response = auth_client.post("/alertmanager", data=malformed, content_type="application/json")
+    assert response.status_code == 202, response.data
+    assert mock_publish.call_count > 0
+    mock_logger.warning.assert_called_once()
+    assert metrics.get("receiver_partial_payloads") == 1
+
+
+@patch("app.http_handlers.call_alertmanager_to_notion.pubsub_v1.PublisherClient")
+def test_metrics_endpoint(mock_publisher_client, auth_client):
+    """Test that request stages are logged as structured fields and exported in OpenMetrics format."""
+    mock_publisher_client.return_value.publish.return_value.result.return_value = "message_id1"
+    with patch("app.http_handlers.call_alertmanager_to_notion.logger") as mock_logger:
+        auth_client.post("/alertmanager", json={"alerts": []})
+    assert mock_logger.info.call_args.args == ("Handle request finished",)
+    fields = mock_logger.info.call_args.kwargs["extra"]["json_fields"]
+    assert fields["status"] == 202
+    assert set(fields["stage_seconds"]) == {"receiver.parse", "receiver.publish", "receiver.wait"}
+    assert fields["pubsub_publish_succeeded"] == 1
+
+    response = auth_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type == metrics.OPENMETRICS_CONTENT_TYPE
+    assert "am2n_pubsub_publish_succeeded_total 1" in response.text.splitlines()
+    assert 'am2n_stage_seconds_count{stage="receiver.publish"} 1' in response.text.splitlines()
+    assert response.text.endswith("# EOF\n")
@@ -0,0 +1,17 @@
+import pytest
+from benchmarks.import_time import ENTRY_POINTS, import_times
+
+# Heavy packages every entry point must not import, a regression here is a slower cold start.
+FORBIDDEN_IMPORTS = {
+    "main": {"flask", "google.cloud.logging", "google.cloud.pubsub_v1", "notion_client", "pydantic", "pytz"},
+    "handle_http_request": {"google.cloud.logging", "notion_client", "pydantic"},
+    "handle_event": {"flask", "google.cloud.logging", "google.cloud.pubsub_v1"},
+}
+
+
+@pytest.mark.parametrize("entry_point", sorted(ENTRY_POINTS))
+def test_entry_point_imports_only_own_dependencies(entry_point):
+    """Test that an entry point doesn't import dependencies of the other function at cold start."""
+    imported = set(import_times(ENTRY_POINTS[entry_point]))
+    assert imported, "no -X importtime output"
+    assert not FORBIDDEN_IMPORTS[entry_point] & imported
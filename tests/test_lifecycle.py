@@ -0,0 +1,122 @@
+import asyncio
+import os
+import signal
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from app import lifecycle
+
+
+def test_lazy_creates_value_once():
+    """Test that the factory is called only on first get."""
+    factory = MagicMock(side_effect=lambda: object())
+    resource = lifecycle.Lazy(factory)
+    assert not resource.created
+    first = resource.get()
+    assert resource.get() is first
+    assert resource.created
+    factory.assert_called_once_with()
+
+
+def test_lazy_creates_none_value_once():
+    """Test that a factory returning None, e.g. of a disabled feature, is called once and its value is closed."""
+    factory, close = MagicMock(return_value=None), MagicMock()
+    resource = lifecycle.Lazy(factory, close=close)
+    assert resource.get() is None
+    assert resource.get() is None
+    assert resource.created
+    factory.assert_called_once_with()
+    resource.close()
+    close.assert_called_once_with(None)
+    assert not resource.created
+
+
+def test_lazy_creates_value_once_from_many_threads():
+    """Test that concurrent first calls share the same value."""
+    factory = MagicMock(side_effect=lambda: object())
+    resource = lifecycle.Lazy(factory)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(resource.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(value) for value in results}) == 1
+    factory.assert_called_once_with()
+
+
+def test_lazy_reset_and_close():
+    """Test that reset drops the value and close calls the close callback."""
+    close = MagicMock()
+    resource = lifecycle.Lazy(lambda: object(), close=close)
+    first = resource.get()
+    resource.reset()
+    second = resource.get()
+    assert second is not first
+    close.assert_not_called()
+    resource.close()
+    close.assert_called_once_with(second)
+    assert not resource.created
+    resource.close()
+    close.assert_called_once()
+
+
+def test_lazy_close_error_is_logged():
+    """Test that an error in close callback doesn't break shutdown."""
+    resource = lifecycle.Lazy(lambda: object(), close=MagicMock(side_effect=RuntimeError("boom")))
+    resource.get()
+    resource.close()
+    assert not resource.created
+
+
+def test_reset_all_and_close_all():
+    """Test that module level helpers handle all resources."""
+    close = MagicMock()
+    first = lifecycle.Lazy(lambda: object(), close=close)
+    second = lifecycle.Lazy(lambda: object())
+    first.get()
+    second.get()
+    lifecycle.reset_all()
+    assert not first.created
+    assert not second.created
+    value = first.get()
+    lifecycle.close_all()
+    close.assert_called_once_with(value)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="fork is not supported")
+def test_lazy_value_is_dropped_in_forked_child():
+    """Test that a forked child doesn't reuse parent's value."""
+    resource = lifecycle.Lazy(lambda: os.getpid())
+    assert resource.get() == os.getpid()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # pragma: nocover
+        os.close(read_fd)
+        os.write(write_fd, str(int(resource.get() == os.getpid())).encode())
+        os._exit(0)
+    os.close(write_fd)
+    os.waitpid(pid, 0)
+    assert os.read(read_fd, 1) == b"1"
+    os.close(read_fd)
+
+
+def test_sigterm_raises_system_exit():
+    """Test that SIGTERM is converted to SystemExit, so shutdown callbacks are executed."""
+    with pytest.raises(SystemExit) as exc_info:
+        lifecycle._exit_on_sigterm(signal.SIGTERM, None)
+    assert exc_info.value.code == 128 + signal.SIGTERM
+
+
+def test_event_loop_runs_coroutines():
+    """Test that coroutines from sync code run in one persistent loop."""
+
+    async def current_loop():
+        return asyncio.get_running_loop()
+
+    assert lifecycle.run_async(current_loop()) is lifecycle.run_async(current_loop())
+    loop_thread = lifecycle.event_loop.get()
+    lifecycle.event_loop.close()
+    assert not loop_thread.thread.is_alive()
@@ -0,0 +1,53 @@
+from unittest.mock import patch
+
+import main
+from flask import Flask
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+
+def test_handle_http_request_reuses_app():
+    """Test that Flask app is created once per instance."""
+    request = Request(EnvironBuilder(method="POST", path="/alertmanager").get_environ())
+    with patch("app.entrypoints.receiver.Flask", wraps=Flask) as mock_flask:
+        first = main.handle_http_request(request)
+        second = main.handle_http_request(request)
+    assert first.status_code == second.status_code == 401
+    mock_flask.assert_called_once_with("main")
+
+
+def test_handle_event_runs_async_handlers():
+    """Test that async handlers are awaited in the instance's event loop."""
+    calls = []
+
+    class Handler:
+        def __init__(self, event, context):
+            self.event = event
+
+        async def __call__(self):
+            calls.append(self.event)
+
+    with patch("app.entrypoints.worker.event_handlers", (Handler,)):
+        main.handle_event({"data": ""}, None)
+    assert calls == [{"data": ""}]
+
+
+def test_handle_event_logs_stage_timings():
+    """Test that time spent by each handler is logged as structured fields of the event."""
+
+    class Handler:
+        def __init__(self, event, context):
+            pass
+
+        def __call__(self):
+            pass
+
+    with (
+        patch("app.entrypoints.worker.event_handlers", (Handler,)),
+        patch("app.entrypoints.worker.logger") as mock_logger,
+    ):
+        main.handle_event({"data": ""}, None)
+    assert mock_logger.info.call_args.args == ("Handle event finished",)
+    fields = mock_logger.info.call_args.kwargs["extra"]["json_fields"]
+    assert set(fields["stage_seconds"]) == {"handler.Handler"}
+    assert fields["duration_seconds"] >= fields["stage_seconds"]["handler.Handler"]
@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app import metrics
+
+
+def test_counters():
+    """Test increasing, reading and resetting counters."""
+    metrics.incr("first")
+    metrics.incr("first", 2)
+    metrics.incr("second", 0.5)
+    assert metrics.get("first") == 3
+    assert metrics.get("missing") == 0
+    assert metrics.snapshot() == {"first": 3, "second": 0.5}
+    metrics.reset()
+    assert metrics.snapshot() == {}
+
+
+def test_labels_and_histograms():
+    """Test that series with different labels are kept apart and histograms keep count and sum."""
+    metrics.incr("requests", endpoint="pages.create", status=200)
+    metrics.incr("requests", endpoint="pages.create", status=429)
+    metrics.observe("latency", 0.2, endpoint="pages.create")
+    metrics.observe("latency", 0.3, endpoint="pages.create")
+    assert metrics.get("requests", status="200", endpoint="pages.create") == 1
+    assert metrics.snapshot() == {
+        'requests{endpoint="pages.create",status="200"}': 1,
+        'requests{endpoint="pages.create",status="429"}': 1,
+    }
+    assert metrics.histogram("latency", endpoint="pages.create") == (2, 0.5)
+    assert metrics.histogram("latency") == (0, 0)
+
+
+def test_openmetrics():
+    """Test export of counters, gauges and histograms in OpenMetrics text format."""
+    metrics.incr("retries", 2)
+    metrics.gauge("index_entries", 5)
+    metrics.gauge("index_entries", 3)
+    metrics.observe("stage_seconds", 0.02, stage="lookup")
+    lines = metrics.openmetrics().splitlines()
+    assert lines[:2] == ["# TYPE am2n_retries counter", "am2n_retries_total 2"]
+    assert lines[2:4] == ["# TYPE am2n_index_entries gauge", "am2n_index_entries 3"]
+    assert lines[4] == "# TYPE am2n_stage_seconds histogram"
+    assert 'am2n_stage_seconds_bucket{stage="lookup",le="0.01"} 0' in lines
+    assert 'am2n_stage_seconds_bucket{stage="lookup",le="0.025"} 1' in lines
+    assert 'am2n_stage_seconds_bucket{stage="lookup",le="+Inf"} 1' in lines
+    assert 'am2n_stage_seconds_count{stage="lookup"} 1' in lines
+    assert lines[-1] == "# EOF"
+
+
+def test_trace_collects_stages_and_counters():
+    """Test that stages and counters of the block are added to the trace, also from other threads."""
+    with metrics.trace() as trace:
+        with metrics.stage("lookup"):
+            metrics.incr("cache_hits")
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(metrics.traced(lambda _: metrics.incr("cache_hits")), range(2)))
+            executor.submit(metrics.incr, "untraced").result()
+    metrics.incr("cache_hits")
+
+    fields = trace.fields()
+    assert set(fields["stage_seconds"]) == {"lookup"}
+    assert fields["cache_hits"] == 3
+    assert "untraced" not in fields
+    assert metrics.get("cache_hits") == 4
+    assert metrics.histogram("stage_seconds", stage="lookup")[0] == 1
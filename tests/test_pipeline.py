@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app import exceptions, metrics
+from app.event_handlers import AsyncNotionHandler, NotionHandler, load_handler
+from app.pipeline import HandlerSpec, Pipeline, sort_handlers
+
+
+def make_handler(name, calls, action=None, **attributes):
+    """Handler class recording its calls, `action` is called when the handler runs."""
+
+    def __call__(self):
+        calls.append(name)
+        if action:
+            action()
+
+    def __init__(self, event, context):
+        self.event = event
+
+    return type(name, (), {"__init__": __init__, "__call__": __call__, **attributes})
+
+
+def stop():
+    """Stop handling the event."""
+    raise exceptions.StopHandlingEvent()
+
+
+def fail():
+    """Fail the handler."""
+    raise RuntimeError("handler failed")
+
+
+def test_ordered_handlers_run_after_dependencies_and_stop():
+    """Test that handlers follow their dependencies and `StopHandlingEvent` stops the ones after it."""
+    calls = []
+    handlers = [
+        make_handler("Second", calls, depends_on=("First",)),
+        make_handler("First", calls),
+        make_handler("Stopper", calls, stop),
+        make_handler("Last", calls),
+    ]
+    outcomes = Pipeline(handlers).run({}, None)
+    assert calls == ["First", "Second", "Stopper"]
+    assert outcomes == {"First": "succeeded", "Second": "succeeded", "Stopper": "stopped", "Last": "skipped"}
+    assert metrics.get("event_handlers", handler="Stopper", outcome="stopped") == 1
+
+
+def test_independent_handlers_are_isolated():
+    """Test that independent handlers run concurrently and their failures don't fail the event."""
+    calls = []
+    started = threading.Barrier(2, timeout=5)
+    handlers = [
+        make_handler("Notion", calls, started.wait),
+        make_handler("Audit", calls, started.wait, independent=True),
+        make_handler("Broken", calls, fail, independent=True),
+        make_handler("AfterBroken", calls, independent=True, depends_on=("Broken",)),
+        make_handler("AfterNotion", calls, independent=True, depends_on=("Notion",)),
+    ]
+    outcomes = Pipeline(handlers).run({}, None)
+    assert outcomes == {
+        "Notion": "succeeded",
+        "Audit": "succeeded",
+        "Broken": "failed",
+        "AfterBroken": "skipped",
+        "AfterNotion": "succeeded",
+    }
+    assert "AfterBroken" not in calls
+    assert metrics.histogram("stage_seconds", stage="handler.Audit")[0] == 1
+
+
+def test_independent_handlers_time_out():
+    """Test that a slow independent handler is reported as timed out without delaying the event."""
+    calls = []
+    release = threading.Event()
+    handlers = [
+        make_handler("Slow", calls, lambda: release.wait(5), independent=True, timeout=0.05),
+        make_handler("AfterSlow", calls, independent=True, depends_on=("Slow",)),
+        make_handler("Notion", calls),
+    ]
+    started = time.monotonic()
+    outcomes = Pipeline(handlers, default_timeout=10).run({}, None)
+    release.set()
+    assert time.monotonic() - started < 1
+    assert outcomes == {"Slow": "timed_out", "AfterSlow": "skipped", "Notion": "succeeded"}
+
+
+def test_async_independent_handler_is_cancelled_on_timeout():
+    """Test that an async independent handler is cancelled after the default timeout."""
+    cancelled = threading.Event()
+
+    class Sleeper:
+        independent = True
+
+        def __init__(self, event, context):
+            pass
+
+        async def __call__(self):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+    assert Pipeline([Sleeper], default_timeout=0.05).run({}, None) == {"Sleeper": "timed_out"}
+    assert cancelled.wait(1)
+
+
+def test_ordered_handler_error_is_raised_after_independent_handlers():
+    """Test that an error of an ordered handler fails the event once independent handlers are done."""
+    calls = []
+    handlers = [
+        make_handler("Audit", calls, lambda: time.sleep(0.05), independent=True),
+        make_handler("Notion", calls, fail),
+        make_handler("AfterNotion", calls, independent=True, depends_on=("Notion",)),
+    ]
+    with pytest.raises(RuntimeError):
+        Pipeline(handlers).run({}, None)
+    assert sorted(calls) == ["Audit", "Notion"]
+    assert metrics.get("event_handlers", handler="Audit", outcome="succeeded") == 1
+    assert metrics.get("event_handlers", handler="AfterNotion", outcome="skipped") == 1
+
+
+def test_sort_handlers_rejects_unknown_and_circular_dependencies():
+    """Test that misconfigured dependencies are reported."""
+    with pytest.raises(ValueError, match="unknown handler Missing"):
+        sort_handlers([HandlerSpec(handler=object, name="A", depends_on=("Missing",))])
+    with pytest.raises(ValueError, match="circular"):
+        sort_handlers(
+            [
+                HandlerSpec(handler=object, name="A", depends_on=("B",)),
+                HandlerSpec(handler=object, name="B", depends_on=("A",)),
+            ],
+        )
+
+
+def test_load_handler():
+    """Test loading handlers by name and by import path."""
+    assert load_handler("notion") is NotionHandler
+    assert load_handler("app.event_handlers.notion:AsyncNotionHandler").__name__ == "AsyncNotionHandler"
+    with pytest.raises(ValueError, match="Unknown event handler"):
+        load_handler("audit")
+
+
+@pytest.mark.parametrize("notion_handler", [NotionHandler, AsyncNotionHandler])
+def test_dependencies_use_stable_handler_name(notion_handler):
+    """Test that a handler depending on the Notion handler works with its sync and async variants."""
+    audit = make_handler("Audit", [], independent=True, depends_on=("notion",))
+    specs = Pipeline([audit, notion_handler]).specs
+    assert [(spec.name, spec.handler) for spec in specs] == [("notion", notion_handler), ("Audit", audit)]
+    assert HandlerSpec.of(audit).name == "Audit"
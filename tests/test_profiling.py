@@ -0,0 +1,49 @@
+import time
+from unittest.mock import patch
+
+from python_settings import settings
+
+from app import profiling
+
+
+def busy(seconds):
+    """Keep the thread busy in a function the profiler can find."""
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_sampling_profiler_collects_stacks():
+    """Test that stacks of other threads are sampled in collapsed format."""
+    profiler = profiling.SamplingProfiler(interval=0.001)
+    profiler.start()
+    busy(0.05)
+    profiler.stop()
+    assert profiler.samples > 0
+    assert any(stack.endswith("tests.test_profiling:busy") for stack in profiler.stacks)
+    assert not any("am2n-profiler" in stack or stack.endswith("profiling:sample") for stack in profiler.stacks)
+
+
+def test_profiled_logs_top_stacks():
+    """Test that a sampled block is profiled and its top stacks are logged."""
+    with (
+        patch.object(settings, "AM2N_PROFILER_ENABLED", True),
+        patch.object(settings, "AM2N_PROFILER_SAMPLE_RATE", 1),
+        patch.object(settings, "AM2N_PROFILER_INTERVAL", 0.001),
+        patch.object(settings, "AM2N_PROFILER_TOP_STACKS", 1),
+        patch.object(profiling, "logger") as mock_logger,
+    ):
+        with profiling.profiled("test"):
+            busy(0.05)
+
+    profile = mock_logger.info.call_args.kwargs["extra"]["json_fields"]["profile"]
+    assert profile["name"] == "test"
+    assert profile["samples"] > 0
+    assert len(profile["stacks"]) == 1
+
+
+def test_profiled_is_off_by_default():
+    """Test that nothing is profiled unless the profiler is enabled."""
+    with patch.object(profiling, "logger") as mock_logger, profiling.profiled("test"):
+        busy(0.01)
+    mock_logger.info.assert_not_called()
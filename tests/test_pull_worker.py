@@ -0,0 +1,132 @@
+import json
+import threading
+from unittest.mock import MagicMock
+
+from app import metrics, pull_worker
+from app.pull_worker import MicroBatcher, coalesce, process_batch
+from app.services.notion import AlertResult, EventReport
+
+
+def make_message(payload, publish_time=0):
+    """Create a Pub/Sub message stand-in."""
+    message = MagicMock()
+    message.data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    message.attributes = {}
+    message.publish_time = publish_time
+    return message
+
+
+def with_alert(alert_payload, fingerprint, status):
+    """Return the event with one alert of the fingerprint and status."""
+    alert = alert_payload["alerts"][0] | {"fingerprint": fingerprint, "status": status}
+    return alert_payload | {"alerts": [alert]}
+
+
+def test_coalesce_keeps_latest_alert_per_fingerprint(alert_payload):
+    """Test that the latest published alert of a fingerprint wins and invalid messages are acked."""
+    repeated = make_message(with_alert(alert_payload, "a", "firing"), publish_time=2)
+    firing = make_message(with_alert(alert_payload, "a", "firing"), publish_time=1)
+    other = make_message(with_alert(alert_payload, "b", "firing"), publish_time=3)
+    invalid = make_message(b"not json", publish_time=0)
+
+    alerts, owners = coalesce([repeated, firing, other, invalid])
+
+    assert [(alert.fingerprint, alert.status) for alert in alerts] == [("a", "firing"), ("b", "firing")]
+    assert owners == {"a": [firing, repeated], "b": [other]}
+    invalid.ack.assert_called_once()
+    repeated.ack.assert_not_called()
+
+
+def test_coalesce_keeps_status_changes_in_order(alert_payload):
+    """Test that a firing alert resolved in the same batch is kept, so its page isn't created resolved."""
+    firing = make_message(with_alert(alert_payload, "a", "firing"), publish_time=1)
+    resolved = make_message(with_alert(alert_payload, "a", "resolved"), publish_time=2)
+    resolved_again = make_message(with_alert(alert_payload, "a", "resolved"), publish_time=3)
+
+    alerts, owners = coalesce([resolved_again, resolved, firing])
+
+    assert [alert.status for alert in alerts] == ["firing", "resolved"]
+    assert owners == {"a": [firing, resolved, resolved_again]}
+
+
+def test_process_batch_acks_processed_and_nacks_failed(alert_payload):
+    """Test that one bulk call handles the batch and messages of failed alerts are redelivered."""
+    first = make_message(with_alert(alert_payload, "a", "firing"), publish_time=1)
+    second = make_message(with_alert(alert_payload, "a", "firing"), publish_time=2)
+    failed = make_message(with_alert(alert_payload, "b", "firing"), publish_time=3)
+    service = MagicMock()
+    service.handle_alerts.return_value = EventReport(
+        results=[
+            AlertResult(fingerprint="a", status="firing", action="updated"),
+            AlertResult(fingerprint="b", status="firing", error="boom"),
+        ],
+    )
+
+    process_batch(service, [first, second, failed])
+
+    service.handle_alerts.assert_called_once()
+    assert len(service.handle_alerts.call_args.args[0]) == 2
+    first.ack.assert_called_once()
+    second.ack.assert_called_once()
+    failed.nack.assert_called_once()
+    failed.ack.assert_not_called()
+    assert metrics.get("pull_worker_alerts_coalesced") == 1
+
+
+def test_micro_batcher_flushes_full_batch():
+    """Test that a full batch is processed right away."""
+    batches = []
+    batcher = MicroBatcher(batches.append, max_messages=2, max_wait=60)
+    batcher.add("first")
+    assert batches == []
+    batcher.add("second")
+    assert batches == [["first", "second"]]
+    batcher.close()
+
+
+def test_micro_batcher_flushes_after_max_wait():
+    """Test that a partial batch is processed once its oldest message waited for `max_wait`."""
+    processed = threading.Event()
+    batches = []
+    batcher = MicroBatcher(lambda batch: (batches.append(batch), processed.set()), max_messages=100, max_wait=0.05)
+    batcher.add("first")
+    assert processed.wait(2)
+    assert batches == [["first"]]
+    batcher.close()
+
+
+def test_micro_batcher_nacks_batch_on_error():
+    """Test that messages are nacked if processing the batch fails."""
+    message = MagicMock()
+    batcher = MicroBatcher(MagicMock(side_effect=RuntimeError), max_messages=1, max_wait=60)
+    batcher.add(message)
+    message.nack.assert_called_once()
+    batcher.close()
+
+
+def test_micro_batcher_nacks_messages_after_close():
+    """Test that messages delivered while the worker stops are redelivered instead of dropped."""
+    batches = []
+    batcher = MicroBatcher(batches.append, max_messages=100, max_wait=60)
+    batcher.add("first")
+    batcher.close()
+    assert batches == [["first"]]
+    message = MagicMock()
+    batcher.add(message)
+    message.nack.assert_called_once()
+    assert batches == [["first"]]
+
+
+def test_run_flushes_batcher_before_cancelling_pull(monkeypatch):
+    """Test that buffered messages are acked while the streaming pull is still open."""
+    calls = []
+    monkeypatch.setattr(pull_worker, "get_notion_service", MagicMock())
+    monkeypatch.setattr(pull_worker.MicroBatcher, "close", lambda self: calls.append("close"))
+    subscriber = MagicMock()
+    subscriber.__enter__.return_value = subscriber
+    streaming_pull = subscriber.subscribe.return_value
+    streaming_pull.result.side_effect = [KeyboardInterrupt, None]
+    streaming_pull.cancel.side_effect = lambda: calls.append("cancel")
+    monkeypatch.setattr(pull_worker.pubsub_v1, "SubscriberClient", MagicMock(return_value=subscriber))
+    pull_worker.run()
+    assert calls == ["close", "cancel"]
@@ -0,0 +1,168 @@
+import functools
+import json
+from datetime import datetime, timedelta
+from unittest.mock import ANY, patch
+
+import pytest
+import pytz
+from notion_client import Client
+from python_settings import settings
+
+from app import lifecycle, metrics, reconciler
+from app.reconciler import Reconciler, active_alerts, load_snapshot
+from app.services import notion as notion_service
+from app.services.notion import NotionService
+from tests.fixtures.fake_alertmanager import FakeAlertmanagerServer, api_alert
+from tests.fixtures.fake_notion import FakeNotionServer, page_status
+
+
+@pytest.fixture
+def service(fake_notion):
+    """Create NotionService calling the fake Notion API."""
+    with patch.object(notion_service, "Client", functools.partial(Client, base_url=fake_notion.base_url)):
+        yield NotionService(
+            token="token",
+            incidents_db_id="dbid",
+            shifts_db_id="",
+            shifts_enabled=False,
+            max_concurrency=4,
+        )
+
+
+def statuses(server: FakeNotionServer) -> dict[str, str | None]:
+    """Status of every fingerprint's page."""
+    return {fingerprint: page_status(page) for fingerprint, page in server.pages_by_fingerprint.items()}
+
+
+def test_active_alerts():
+    """Test that suppressed alerts and alerts of other receivers are active but not written as firing."""
+    other = {**api_alert("c"), "receivers": [{"name": "pager"}]}
+    active = active_alerts([api_alert("a"), api_alert("b", state="suppressed"), other], "notion")
+    assert sorted(active.alerts) == ["a", "b", "c"]
+    assert active.alerts["b"].status == "firing"
+    assert active.notified == {"a"}
+    assert not active_alerts([api_alert("a")]).notified
+
+    alerts = [{**api_alert("a"), "status": "firing"}, {**api_alert("b"), "status": "resolved"}]
+    assert active_alerts({"receiver": "notion", "alerts": alerts}, "notion") == ({"a": ANY}, {"a"}, ANY)
+    assert active_alerts({"receiver": "pager", "alerts": alerts}, "notion").notified == set()
+
+
+def test_reconcile_keeps_suppressed_alerts_open(fake_notion, service):
+    """Test that a silenced alert keeps its incident open but a missing incident isn't created for it."""
+    fake_notion.add_page("silenced", "Firing")
+    fake_notion.backdate(timedelta(hours=1))
+    active = active_alerts([api_alert("silenced", "suppressed"), api_alert("inhibited", "suppressed")], "notion")
+
+    report = Reconciler(service).run(active)
+
+    assert report is not None and not report.results
+    assert statuses(fake_notion) == {"silenced": "Firing"}
+    assert fake_notion.calls["pages.create"] == fake_notion.calls["pages.update"] == 0
+
+
+def test_reconcile_resolves_stale_and_fires_missing_incidents(fake_notion, service):
+    """Test that incidents diverging from Alertmanager are fixed, others are not touched."""
+    for i in range(250):
+        fake_notion.add_page(f"stale-{i}", "Firing")
+    fake_notion.add_page("active", "Firing")
+    fake_notion.add_page("refired", "Resolved")
+    fake_notion.add_page("", "Firing")
+    fake_notion.backdate(timedelta(hours=1))
+    active = active_alerts([api_alert("active"), api_alert("refired"), api_alert("new")], "notion")
+    metrics.reset()
+
+    report = Reconciler(service, batch_size=100).run(active)
+
+    assert report is not None and not report.failed
+    assert sorted({result.action for result in report.results}) == ["created", "resolved", "updated"]
+    result = statuses(fake_notion)
+    assert {result[f"stale-{i}"] for i in range(250)} == {"Resolved"}
+    assert result["active"] == result["refired"] == result["new"] == result[""] == "Firing"
+    # Firing incidents are read once in pages of 100, only diverging incidents are written.
+    assert fake_notion.calls["pages.update"] == 251
+    assert fake_notion.calls["pages.create"] == 1
+    assert metrics.get("reconcile_scanned") == 252
+    assert metrics.get("reconcile_fixed", action="resolved") == 250
+
+    stale = fake_notion.pages_by_fingerprint["stale-0"]["properties"]["Incident Timeframe"]["date"]
+    assert stale["end"] is not None
+
+
+def test_reconcile_dry_run_and_page_limit(fake_notion, service):
+    """Test that a dry run writes nothing and stale incidents kept in memory are capped."""
+    for i in range(30):
+        fake_notion.add_page(f"stale-{i}", "Firing")
+    fake_notion.backdate(timedelta(hours=1))
+
+    assert Reconciler(service).run(active_alerts([]), dry_run=True) is None
+    assert fake_notion.calls["pages.update"] == 0
+
+    stale, seen = Reconciler(service, max_pages=10).scan({}, datetime.now(tz=pytz.utc))
+    assert len(stale) == 10 and not seen
+    assert fake_notion.calls["databases.query"] == 2
+
+
+def test_reconcile_skips_incidents_changed_after_snapshot(fake_notion, service):
+    """Test that incidents created or edited after the snapshot was taken, less the margin, are left alone."""
+    fake_notion.add_page("old", "Firing")
+    fake_notion.add_page("edited", "Firing")
+    fake_notion.backdate(timedelta(hours=1))
+    fake_notion.pages_by_fingerprint["edited"]["last_edited_time"] = datetime.now(tz=pytz.utc).isoformat()
+    fake_notion.add_page("created", "Firing")["last_edited_time"] = "2025-01-01T00:00:00+00:00"
+    # A snapshot from 30 seconds ago doesn't know about incidents created or edited since.
+    taken_at = datetime.now(tz=pytz.utc) - timedelta(seconds=30)
+    metrics.reset()
+
+    report = Reconciler(service).run(active_alerts([api_alert("created")], "notion", taken_at))
+
+    assert report is not None and [result.fingerprint for result in report.results] == ["old"]
+    assert statuses(fake_notion) == {"old": "Resolved", "edited": "Firing", "created": "Firing"}
+    assert metrics.get("reconcile_skipped_recent") == 2
+    assert fake_notion.calls["pages.create"] == 0
+
+
+def test_reconcile_reports_failed_updates(fake_notion, service):
+    """Test that an incident that fails to update doesn't stop the others."""
+    fake_notion.add_page("deleted", "Firing")["archived"] = True
+    fake_notion.add_page("stale", "Firing")
+    fake_notion.backdate(timedelta(hours=1))
+
+    report = Reconciler(service).run(active_alerts([]))
+
+    assert report is not None
+    assert [result.fingerprint for result in report.failed] == ["deleted"]
+    assert statuses(fake_notion)["stale"] == "Resolved"
+
+
+def test_run_with_alertmanager_snapshot(fake_notion, tmp_path):
+    """Test that the entry point reads active alerts from Alertmanager API or a file."""
+    fake_notion.add_page("stale", "Firing")
+    fake_notion.add_page("active", "Firing")
+    fake_notion.backdate(timedelta(hours=1))
+    alertmanager = FakeAlertmanagerServer(["active"]).start()
+    path = tmp_path / "alerts.json"
+    path.write_text(json.dumps([api_alert("active")]))
+    lifecycle.close_all()
+    try:
+        with (
+            patch.object(notion_service, "Client", functools.partial(Client, base_url=fake_notion.base_url)),
+            patch.object(settings, "AM2N_INCIDENTS_DB_ID", "dbid"),
+            patch.object(settings, "AM2N_ALERTMANAGER_RECEIVER", "notion"),
+        ):
+            assert list(active_alerts(load_snapshot(str(path), None)[0]).alerts) == ["active"]
+            snapshot, taken_at = load_snapshot(None, alertmanager.base_url)
+            report = reconciler.run(snapshot, taken_at=taken_at)
+    finally:
+        lifecycle.close_all()
+        alertmanager.stop()
+
+    assert report is not None
+    assert [(result.fingerprint, result.action) for result in report.results] == [("stale", "resolved")]
+    assert statuses(fake_notion) == {"stale": "Resolved", "active": "Firing"}
+
+
+def test_load_snapshot_requires_source():
+    """Test that the snapshot source must be set."""
+    with pytest.raises(ValueError):
+        load_snapshot(None, "")
@@ -0,0 +1,23 @@
+from unittest.mock import patch
+
+import pytest
+from pydantic import ValidationError
+
+from app.schemas import Alert, AlertmanagerEvent, EventAlerts
+
+
+def test_event_alerts_validates_only_alerts(alert_payload):
+    """Test that the fast path gives the same alerts and ignores other fields of the event."""
+    assert EventAlerts.model_validate(alert_payload).alerts == AlertmanagerEvent.model_validate(alert_payload).alerts
+    assert EventAlerts.model_validate({"alerts": alert_payload["alerts"], "groupKey": None}).alerts
+    with pytest.raises(ValidationError):
+        EventAlerts.model_validate({"alerts": [{"status": "firing"}]})
+
+
+def test_event_details_is_serialized_once(alert_payload):
+    """Test that `AMEventDetails` JSON is computed once per alert."""
+    alert = Alert.model_validate(alert_payload["alerts"][0])
+    expected = alert.model_dump_json()
+    with patch.object(Alert, "model_dump_json", return_value=expected) as mock_dump:
+        assert alert.event_details == alert.event_details == expected
+    mock_dump.assert_called_once_with()
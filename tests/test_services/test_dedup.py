@@ -0,0 +1,35 @@
+import pytest
+
+from app.services.dedup import NotificationDeduplicator, notification_keys
+from app.services.fingerprint_index import FingerprintIndex
+from app.stores import MemoryStore
+
+
+def test_notification_keys_depend_on_group_and_alert_state(alert_payload):
+    """Test that keys change with group key, status and timeframe of alerts."""
+    keys = notification_keys(alert_payload)
+    assert len(keys) == 1
+    assert notification_keys(alert_payload | {"groupKey": "other"}) != keys
+    alert = alert_payload["alerts"][0]
+    assert notification_keys(alert_payload | {"alerts": [alert | {"status": "firing"}]}) != keys
+    assert notification_keys(alert_payload | {"alerts": [alert | {"endsAt": "2025-06-12T00:00:00Z"}]}) != keys
+    assert notification_keys(alert_payload | {"alerts": [alert | {"labels": {}}]}) == keys
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [{"alerts": []}, {"alerts": "invalid"}, ["not", "a", "dict"], {"alerts": [{"status": "firing"}]}],
+)
+def test_notification_keys_without_fingerprints(payload):
+    """Test that payloads without fingerprinted alerts are never deduplicated."""
+    assert notification_keys(payload) == []
+
+
+def test_deduplicator_uses_shared_store(alert_payload):
+    """Test that notifications published by one instance are duplicates on another one."""
+    shared = MemoryStore()
+    first = NotificationDeduplicator(FingerprintIndex("topic", kind="notification", shared=shared))
+    second = NotificationDeduplicator(FingerprintIndex("topic", kind="notification", shared=shared))
+    assert not first.is_duplicate(alert_payload)
+    first.remember(alert_payload)
+    assert second.is_duplicate(alert_payload)
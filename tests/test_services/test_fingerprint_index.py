@@ -0,0 +1,41 @@
+from unittest.mock import MagicMock
+
+from app import metrics
+from app.services.fingerprint_index import FingerprintIndex
+from app.stores import MemoryStore
+
+
+def test_index_hits_and_misses():
+    """Test lookups and hit/miss counters."""
+    index = FingerprintIndex(namespace="db")
+    assert index.get("abc") is None
+    index.set("abc", "page-1")
+    assert index.get("abc") == "page-1"
+    index.invalidate("abc")
+    assert index.get("abc") is None
+    assert metrics.get("fingerprint_index_hits") == 1
+    assert metrics.get("fingerprint_index_misses") == 2
+    assert metrics.get("fingerprint_index_invalidations") == 1
+
+
+def test_index_reads_through_shared_store():
+    """Test that values written by another instance are found in the shared store."""
+    shared = MemoryStore()
+    FingerprintIndex(namespace="db", shared=shared).set("abc", "page-1")
+    index = FingerprintIndex(namespace="db", shared=shared)
+    assert index.get("abc") == "page-1"
+    assert index.local.get("page:db:abc") == "page-1"
+    assert FingerprintIndex(namespace="other-db", shared=shared).get("abc") is None
+    index.invalidate("abc")
+    assert shared.get("page:db:abc") is None
+
+
+def test_index_shared_store_errors_are_ignored():
+    """Test that a broken shared store doesn't break lookups."""
+    shared = MagicMock()
+    shared.get.side_effect = shared.set.side_effect = shared.delete.side_effect = ConnectionError("down")
+    index = FingerprintIndex(namespace="db", shared=shared)
+    index.set("abc", "page-1")
+    assert index.get("abc") == "page-1"
+    assert index.get("def") is None
+    index.invalidate("abc")
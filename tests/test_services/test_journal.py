@@ -0,0 +1,168 @@
+import os
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from python_settings import settings
+
+from app import metrics, replay
+from app.event_handlers.notion import create_journal
+from app.services.journal import DONE, FAILED, PENDING, Journal, idempotency_key
+from app.services.notion import NotionService
+from tests.fixtures.common import make_alert
+
+
+@pytest.fixture
+def journaled_service(monkeypatch, tmp_path):
+    """Fixture for NotionService with a journal."""
+    monkeypatch.setattr("app.services.notion.Client", MagicMock())
+    return NotionService(
+        token="token",
+        incidents_db_id="dbid",
+        shifts_db_id="",
+        shifts_enabled=False,
+        journal=Journal(str(tmp_path)),
+    )
+
+
+def test_idempotency_key():
+    """Test that the key depends on the alert's fingerprint, status and timeframe."""
+    assert idempotency_key(make_alert("a")) == idempotency_key(make_alert("a"))
+    assert idempotency_key(make_alert("a")) != idempotency_key(make_alert("a", "resolved"))
+    assert idempotency_key(make_alert("a")) != idempotency_key(make_alert("b"))
+
+
+def test_journal_is_shared_by_instances(tmp_path):
+    """Test that operations journaled by one instance are seen by another one."""
+    first, second = Journal(str(tmp_path)), Journal(str(tmp_path))
+    todo, done = first.begin([make_alert("a"), make_alert("b")])
+    assert [alert.fingerprint for alert in todo] == ["a", "b"] and not done
+    first.finish(make_alert("a"), "page-a")
+    first.finish(make_alert("b"), error="boom")
+
+    todo, done = second.begin([make_alert("a"), make_alert("b")])
+    assert [alert.fingerprint for alert in todo] == ["b"]
+    assert [alert.fingerprint for alert in done] == ["a"]
+    assert second.state(make_alert("b")) == PENDING
+    assert first.counts() == {DONE: 1, PENDING: 1}
+    first.close()
+    second.close()
+
+
+def test_journal_skips_partial_and_expired_records(tmp_path):
+    """Test that a record being appended is read later and expired records and segments are dropped."""
+    other = tmp_path / "other.jsonl"
+    other.write_bytes(b'{"key":"k1","fingerprint":"a","state":"done","at":%f}\n{"key":"k2"' % time.time())
+    expired = tmp_path / "expired.jsonl"
+    expired.write_text('{"key":"k3","fingerprint":"c","state":"pending","at":0}\n')
+    os.utime(expired, (0, 0))
+
+    journal = Journal(str(tmp_path), retention=60)
+    journal.refresh()
+    assert journal.counts() == {DONE: 1}
+    assert not expired.exists()
+    with other.open("ab") as file:
+        file.write(b',"fingerprint":"b","state":"failed","at":%f,"alert":{}}\nnot json\n' % time.time())
+    assert journal.counts() == {DONE: 1, FAILED: 1}
+
+
+def test_refresh_reads_only_grown_segments(tmp_path):
+    """Test that a segment is read again only when it grew since the previous read."""
+    other = tmp_path / "other.jsonl"
+    other.write_bytes(b'{"key":"k1","fingerprint":"a","state":"done","at":%f}\n' % time.time())
+    journal = Journal(str(tmp_path))
+    with patch.object(journal, "_read_segment", wraps=journal._read_segment) as mock_read:
+        journal.refresh()
+        journal.refresh()
+        assert mock_read.call_count == 1
+        with other.open("ab") as file:
+            file.write(b'{"key":"k2","fingerprint":"b","state":"done","at":%f}\n' % time.time())
+        journal.refresh()
+        assert mock_read.call_count == 2
+    assert journal.counts() == {DONE: 2}
+
+    other.unlink()
+    journal.refresh()
+    assert not journal._offsets
+
+
+def test_done_alerts_are_skipped_until_skip_ttl(tmp_path):
+    """Test that a repeat notification after `skip_ttl` is written again, e.g. to recreate a deleted page."""
+    journal = Journal(str(tmp_path), skip_ttl=60)
+    journal.begin([make_alert("a")])
+    journal.finish(make_alert("a"), "page-a")
+    assert journal.begin([make_alert("a")]) == ([], [make_alert("a")])
+    with patch("app.services.journal.time.time", return_value=time.time() + 61):
+        assert journal.begin([make_alert("a")]) == ([make_alert("a")], [])
+    assert journal.state(make_alert("a")) == PENDING
+
+
+def test_own_segment_is_rotated(tmp_path):
+    """Test that a process starts a new segment once its segment is full and doesn't read the old one again."""
+    journal = Journal(str(tmp_path), max_segment_bytes=1)
+    journal.begin([make_alert("a")])
+    first = journal.segment
+    journal.finish(make_alert("a"), "page-a")
+    assert journal.segment != first and first.exists()
+    with patch.object(journal, "_read_segment", wraps=journal._read_segment) as mock_read:
+        journal.refresh()
+    mock_read.assert_not_called()
+    assert journal.counts() == {DONE: 1}
+    assert metrics.get("journal_rotations") == 1
+    journal.close()
+
+
+def test_create_journal_requires_path(monkeypatch, tmp_path):
+    """Test that the journal isn't created in a default local directory."""
+    monkeypatch.setattr(settings, "AM2N_JOURNAL_ENABLED", True)
+    monkeypatch.setattr(settings, "AM2N_JOURNAL_PATH", "")
+    with pytest.raises(ValueError, match="AM2N_JOURNAL_PATH"):
+        create_journal()
+    monkeypatch.setattr(settings, "AM2N_JOURNAL_PATH", str(tmp_path))
+    assert create_journal().path == tmp_path
+
+
+def test_unfinished_leaves_out_operations_done_later(tmp_path):
+    """Test that replay doesn't write an older status over a newer one."""
+    journal = Journal(str(tmp_path))
+    journal.begin([make_alert("a"), make_alert("b")])
+    journal.finish(make_alert("b"), error="boom")
+    journal.begin([make_alert("a", "resolved")])
+    journal.finish(make_alert("a", "resolved"), "page-a")
+    assert [(alert.fingerprint, alert.status) for alert in journal.unfinished()] == [("b", "firing")]
+
+
+def test_redelivered_event_skips_done_alerts(journaled_service):
+    """Test that alerts written before a failure are skipped when the event is delivered again."""
+    alerts = [make_alert("a"), make_alert("b")]
+    journaled_service.client.databases.query.return_value = {"results": []}
+    journaled_service.client.pages.create.side_effect = [{"id": "page-a"}, Exception("Notion is down")]
+    report = journaled_service.handle_alerts(alerts)
+    assert [result.fingerprint for result in report.failed] == ["b"]
+
+    journaled_service.client.pages.create.side_effect = [{"id": "page-b"}]
+    report = journaled_service.handle_alerts(alerts)
+    assert [(result.fingerprint, result.action) for result in report.results] == [("a", "skipped"), ("b", "created")]
+    assert journaled_service.client.pages.create.call_count == 3
+    assert metrics.get("journal_skipped") == 1
+
+
+def test_replay_retries_unfinished_operations(journaled_service, monkeypatch):
+    """Test that the replay CLI retries pending and failed operations."""
+    journaled_service.journal.begin([make_alert("a"), make_alert("b")])
+    journaled_service.journal.finish(make_alert("a"), "page-a")
+    journaled_service.client.databases.query.return_value = {"results": []}
+    journaled_service.client.pages.create.return_value = {"id": "page-b"}
+    monkeypatch.setattr(replay.journal, "get", lambda: journaled_service.journal)
+    with patch.object(replay, "get_notion_service", return_value=journaled_service):
+        assert replay.run(dry_run=True) is None
+        report = replay.run()
+    assert [(result.fingerprint, result.action) for result in report.results] == [("b", "created")]
+    assert journaled_service.journal.unfinished() == []
+    assert replay.run() is None
+
+
+def test_replay_requires_journal():
+    """Test that nothing is replayed if the journal is disabled."""
+    assert not settings.AM2N_JOURNAL_ENABLED
+    assert replay.run() is None
@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+from app import metrics
+from app.services.leases import Claim, FingerprintLeases
+from app.services.notion import NotionService
+from app.services.notion_async import AsyncNotionService
+from app.stores import MemoryStore, SQLiteStore
+from tests.fixtures.common import make_alert
+
+
+def make_service(leases, monkeypatch):
+    """Create NotionService with leases that never finds pages in Notion, like workers racing for a new alert."""
+    monkeypatch.setattr("app.services.notion.Client", MagicMock())
+    service = NotionService(token="token", incidents_db_id="db", shifts_db_id="", shifts_enabled=False, leases=leases)
+    service.client.databases.query.return_value = {"results": []}
+    return service
+
+
+def test_claim_and_release():
+    """Test that the lease is won once and its page is published on release."""
+    leases = FingerprintLeases(MemoryStore(), namespace="db", wait=0)
+    claim = leases.claim("a")
+    assert claim.token and not claim.busy
+    assert leases.claim("a").busy
+    leases.release("a", claim, "page-a")
+    assert leases.claim("a") == Claim(page_id="page-a")
+    leases.forget("a")
+    assert leases.claim("a").token
+    assert metrics.get("fingerprint_leases_won") == 2
+    assert metrics.get("fingerprint_leases_lost") == 1
+    assert metrics.get("fingerprint_leases_timeouts") == 1
+
+
+def test_failed_winner_releases_lease():
+    """Test that the lease is released without a page when creation fails, so the next worker claims it."""
+    leases = FingerprintLeases(MemoryStore(), namespace="db", wait=0)
+    claim = leases.claim("a")
+    leases.release("a", claim, None)
+    leases.release("a", Claim(page_id="page-a"), "page-a")
+    assert leases.claim("a").token
+
+
+def test_expired_lease_is_not_released_by_old_owner():
+    """Test that a worker whose lease expired doesn't release the lease claimed by another worker."""
+    leases = FingerprintLeases(MemoryStore(), namespace="db", ttl=0.01, wait=0)
+    old = leases.claim("a")
+    time.sleep(0.02)
+    new = leases.claim("a")
+    assert new.token and new.token != old.token
+    with patch("app.services.leases.logger") as mock_logger:
+        leases.release("a", old, None)
+    mock_logger.warning.assert_called_once()
+    assert leases.claim("a").busy
+    assert metrics.get("fingerprint_leases_expired") == 1
+    leases.release("a", new, "page-a")
+    assert leases.claim("a") == Claim(page_id="page-a")
+
+
+def test_concurrent_workers_create_one_page(monkeypatch, tmp_path):
+    """Test that only one of concurrent workers creates the page and the others update it."""
+    path = str(tmp_path / "leases.sqlite3")
+    services = [
+        make_service(FingerprintLeases(SQLiteStore(path), namespace="db", poll_interval=0.01), monkeypatch)
+        for _ in range(3)
+    ]
+    started = threading.Barrier(3, timeout=5)
+    created = []
+
+    def create(**kwargs):
+        created.append(kwargs)
+        time.sleep(0.05)
+        return {"id": "page-a"}
+
+    def handle(service):
+        service.client.pages.create.side_effect = create
+        started.wait()
+        return service.handle_alerts([make_alert("a")]).results[0]
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(executor.map(handle, services))
+    assert len(created) == 1
+    assert sorted(result.action for result in results) == ["created", "updated", "updated"]
+    assert sum(service.client.pages.update.call_count for service in services) == 2
+
+
+def test_lease_timeout_falls_back_to_lookup(monkeypatch):
+    """Test that a worker waiting too long for the lease looks the page up before creating it."""
+    leases = FingerprintLeases(MemoryStore(), namespace="db", wait=0)
+    leases.claim("a")
+    service = make_service(leases, monkeypatch)
+    service.client.databases.query.side_effect = [{"results": []}, {"results": [{"id": "page-a"}]}]
+    result = service.handle_alerts([make_alert("a")]).results[0]
+    assert (result.action, result.error) == ("updated", None)
+    service.client.pages.create.assert_not_called()
+
+
+def test_lease_timeout_without_page_fails_alert(monkeypatch):
+    """Test that a worker waiting too long for the lease doesn't create a second page if the first isn't found."""
+    leases = FingerprintLeases(MemoryStore(), namespace="db", wait=0)
+    leases.claim("a")
+    service = make_service(leases, monkeypatch)
+    with patch("app.services.notion.logger"):
+        result = service.handle_alerts([make_alert("a")]).results[0]
+    assert "LeaseBusy" in result.error and result.retryable
+    service.client.pages.create.assert_not_called()
+
+
+def test_async_service_uses_leases(monkeypatch):
+    """Test that the async service updates the page created by the lease holder."""
+    leases = FingerprintLeases(MemoryStore(), namespace="db", wait=1, poll_interval=0.01)
+    holder = leases.claim("a")
+    monkeypatch.setattr("app.services.notion_async.AsyncClient", MagicMock())
+    service = AsyncNotionService(
+        token="token",
+        incidents_db_id="db",
+        shifts_db_id="",
+        shifts_enabled=False,
+        leases=leases,
+    )
+
+    async def handle():
+        service.client.pages.update = MagicMock(side_effect=lambda **kwargs: asyncio.sleep(0))
+        asyncio.get_running_loop().call_later(0.05, leases.release, "a", holder, "page-a")
+        return await service.create_incident_once(make_alert("a"))
+
+    assert asyncio.run(handle()) == ("page-a", "updated")
+
+
+def test_async_winner_creates_page(monkeypatch):
+    """Test that the async lease winner creates the page and publishes it."""
+    leases = FingerprintLeases(MemoryStore(), namespace="db")
+    monkeypatch.setattr("app.services.notion_async.AsyncClient", MagicMock())
+    service = AsyncNotionService(
+        token="token",
+        incidents_db_id="db",
+        shifts_db_id="",
+        shifts_enabled=False,
+        leases=leases,
+    )
+
+    async def create(alert, shift=None):
+        return "page-a"
+
+    monkeypatch.setattr(service, "create_incident_page_from_alert", create)
+    assert asyncio.run(service.create_incident_once(make_alert("a"))) == ("page-a", "created")
+    assert leases.try_claim("a") == Claim(page_id="page-a")
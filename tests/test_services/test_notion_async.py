@@ -0,0 +1,88 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import pytest
+
+from app.services.fingerprint_index import FingerprintIndex
+from app.services.notion import INCIDENT_SHIFT_ATTRIBUTE_NAME
+from app.services.notion_async import AsyncNotionService
+from app.services.shift_cache import ShiftCache
+from tests.fixtures.common import make_alert
+
+
+def page(fingerprint: str) -> dict:
+    """Notion page of the fingerprint."""
+    return {"id": f"page-{fingerprint}", "properties": {"AMFingerprint": {"rich_text": [{"plain_text": fingerprint}]}}}
+
+
+@pytest.fixture
+def async_service(monkeypatch):
+    """Fixture for AsyncNotionService with mocked Notion client and shifts enabled."""
+    client = MagicMock()
+    client.databases.query = AsyncMock()
+    client.pages.create = AsyncMock(side_effect=lambda parent, properties: {"id": "page-new"})
+    client.pages.update = AsyncMock()
+    monkeypatch.setattr("app.services.notion_async.AsyncClient", MagicMock(return_value=client))
+    return AsyncNotionService(
+        token="token",
+        incidents_db_id="incidents",
+        shifts_db_id="shifts",
+        shifts_enabled=True,
+        max_concurrency=2,
+        index=FingerprintIndex(namespace="incidents"),
+        shift_cache=ShiftCache(),
+    )
+
+
+def test_handle_alert_creates_and_updates(async_service, alert_payload):
+    """Test that async service finds, updates and creates pages like the sync one."""
+    alert_payload["alerts"].append({**alert_payload["alerts"][0], "status": "firing", "fingerprint": "new"})
+
+    async def query(database_id, **kwargs):
+        if database_id == "shifts":
+            return {"results": [{"id": "shift-1", "properties": {"On-Duty": {"people": [{"id": "person-1"}]}}}]}
+        return {"results": [page("26270adf29eda488")], "has_more": False}
+
+    async_service.client.databases.query.side_effect = query
+    report = asyncio.run(async_service.handle_alert(alert_payload))
+    assert [(result.fingerprint, result.action) for result in report.results] == [
+        ("26270adf29eda488", "updated"),
+        ("new", "created"),
+    ]
+    async_service.client.pages.update.assert_awaited_once()
+    assert async_service.client.pages.update.call_args.kwargs["page_id"] == "page-26270adf29eda488"
+    properties = async_service.client.pages.create.call_args.kwargs["properties"]
+    assert properties[INCIDENT_SHIFT_ATTRIBUTE_NAME] == {"relation": [{"id": "shift-1"}]}
+    assert async_service.index.get("new") == "page-new"
+    assert async_service.client.databases.query.await_count == 2
+
+
+def test_known_fingerprints_skip_lookup_and_shift(async_service):
+    """Test that indexed fingerprints are updated without queries."""
+    async_service.index.set("a", "page-a")
+    report = asyncio.run(async_service.handle_alerts([make_alert("a", "resolved")]))
+    assert report.results[0].action == "updated"
+    async_service.client.databases.query.assert_not_awaited()
+
+
+def test_failed_alert_is_reported(async_service):
+    """Test that a failed alert doesn't stop the other alerts."""
+    async_service.shifts_enabled = False
+    async_service.client.databases.query.return_value = {"results": [page("a"), page("b")], "has_more": False}
+    async_service.client.pages.update.side_effect = [Exception("boom"), None]
+    report = asyncio.run(async_service.handle_alerts([make_alert("a"), make_alert("b")]))
+    assert [result.fingerprint for result in report.failed] == ["a"]
+    assert report.results[1].action == "updated"
+
+
+def test_lookup_failure_reports_all_alerts(async_service):
+    """Test that a failed bulk lookup is reported for every alert."""
+    async_service.client.databases.query.side_effect = httpx.ConnectError("down")
+    report = asyncio.run(async_service.handle_alerts([make_alert("a"), make_alert("b")]))
+    assert len(report.failed) == 2
+
+
+def test_handle_alert_parse_error(async_service):
+    """Test that invalid event is logged and skipped."""
+    assert asyncio.run(async_service.handle_alert({"invalid": "data"})) is None
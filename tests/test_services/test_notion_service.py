@@ -1,16 +1,24 @@
+import threading
+import time
 from unittest.mock import MagicMock, patch
 
 import httpx
 import pytest
+from notion_client import APIErrorCode, APIResponseError
 
+from app import metrics
+from app.schemas import Alert, AlertAnnotations, AlertLabels
+from app.services.fingerprint_index import FingerprintIndex
 from app.services.notion import (
     INCIDENT_RESPONSIBLE_ATTRIBUTE_NAME,
     INCIDENT_SHIFT_ATTRIBUTE_NAME,
-    Alert,
-    AlertAnnotations,
-    AlertLabels,
+    AlertResult,
+    EventReport,
     NotionService,
+    is_retryable_error,
 )
+from app.services.shift_cache import ShiftCache
+from tests.fixtures.common import make_alert
 
 
 @pytest.fixture
@@ -127,8 +135,8 @@ def test_handle_alert_creates_and_updates(notion_service_with_shifts):
     with (
         patch.object(
             notion_service_with_shifts,
-            "find_incident_page_by_fingerprint",
-            side_effect=[None, "page-2"],
+            "find_incident_pages_by_fingerprints",
+            return_value={"def456": "page-2"},
         ) as mock_find,
         patch.object(notion_service_with_shifts, "update_incident_status") as mock_update,
         patch.object(notion_service_with_shifts, "create_incident_page_from_alert") as mock_create,
@@ -184,8 +192,8 @@ def test_handle_alert_creates_and_updates(notion_service_with_shifts):
             generatorURL="",
             fingerprint="def456",
         )
-        mock_find.assert_any_call("abc123")
-        mock_find.assert_any_call("def456")
+        mock_find.assert_called_once()
+        assert list(mock_find.call_args[0][0]) == ["abc123", "def456"]
         mock_create.assert_called_once()
         called_alert = mock_create.call_args[0][0]
         assert called_alert.fingerprint == expected_alert_1.fingerprint
@@ -258,9 +266,16 @@ def test_get_shift_with_type_enabled_no_results(notion_service_with_shifts):
     assert responsible == []
 
 
-def test_get_shift_http_error(notion_service_with_shifts):
-    """Test _get_shift returns (None, []) on httpx.HTTPError."""
-    notion_service_with_shifts.client.databases.query.side_effect = httpx.HTTPError("http error")
+@pytest.mark.parametrize(
+    "error",
+    [
+        httpx.HTTPError("http error"),
+        APIResponseError(MagicMock(status_code=502), "Bad gateway", APIErrorCode.InternalServerError),
+    ],
+)
+def test_get_shift_http_error(notion_service_with_shifts, error):
+    """Test _get_shift returns (None, []) on transport errors and Notion error responses."""
+    notion_service_with_shifts.client.databases.query.side_effect = error
     notion_service_with_shifts.shifts_enabled = True
     shift_id, responsible = notion_service_with_shifts._get_shift()
     assert shift_id is None
@@ -273,3 +288,230 @@ def test_handle_alert_parse_error(mock_logger, notion_service):
     notion_service.handle_alert({"invalid": "data"})
     mock_logger.exception.assert_called_once()
     assert "Failed to parse Alertmanager event" in mock_logger.exception.call_args[0][0]
+
+
+def test_handle_alerts_reports_failed_alert(notion_service):
+    """Test that a failed alert is reported and doesn't stop the other alerts."""
+    with (
+        patch.object(notion_service, "find_incident_pages_by_fingerprints", return_value={"a": "p-a", "b": "p-b"}),
+        patch.object(notion_service, "update_incident_status", side_effect=[Exception("boom"), None]) as mock_update,
+    ):
+        report = notion_service.handle_alerts([make_alert("a"), make_alert("b")])
+    assert mock_update.call_count == 2
+    assert [(result.fingerprint, result.action) for result in report.results] == [("a", None), ("b", "updated")]
+    assert [result.fingerprint for result in report.failed] == ["a"]
+    assert "boom" in report.failed[0].error
+
+
+def test_handle_alerts_concurrently(notion_service):
+    """Test that distinct fingerprints are processed concurrently, up to max_concurrency at a time."""
+    notion_service.max_concurrency = 3
+    lock = threading.Lock()
+    active, max_active = 0, 0
+    all_started = threading.Barrier(3, timeout=5)
+
+    def create(alert):
+        nonlocal active, max_active
+        with lock:
+            active += 1
+            max_active = max(max_active, active)
+        if alert.fingerprint in "abc":
+            all_started.wait()
+        time.sleep(0.01)
+        with lock:
+            active -= 1
+        return f"page-{alert.fingerprint}"
+
+    with (
+        patch.object(notion_service, "find_incident_pages_by_fingerprints", return_value={}),
+        patch.object(notion_service, "create_incident_page_from_alert", side_effect=create) as mock_create,
+    ):
+        report = notion_service.handle_alerts([make_alert(fingerprint) for fingerprint in "abcdefg"])
+    assert max_active == 3
+    assert mock_create.call_count == 7
+    assert [result.fingerprint for result in report.results] == list("abcdefg")
+    assert not report.failed
+
+
+def test_handle_alerts_same_fingerprint_in_order(notion_service):
+    """Test that alerts with the same fingerprint are processed sequentially in order."""
+    notion_service.max_concurrency = 4
+    calls = []
+
+    def create(alert):
+        calls.append(alert)
+        return f"page-{alert.fingerprint}"
+
+    with (
+        patch.object(notion_service, "find_incident_pages_by_fingerprints", return_value={}),
+        patch.object(notion_service, "create_incident_page_from_alert", side_effect=create),
+        patch.object(notion_service, "update_incident_status", side_effect=lambda page_id, alert: calls.append(alert)),
+    ):
+        report = notion_service.handle_alerts([make_alert("a"), make_alert("b"), make_alert("a", "resolved")])
+    assert [alert.status for alert in calls if alert.fingerprint == "a"] == ["firing", "resolved"]
+    assert [(result.fingerprint, result.action) for result in report.results] == [
+        ("a", "created"),
+        ("a", "updated"),
+        ("b", "created"),
+    ]
+
+
+def test_find_incident_pages_by_fingerprints_chunks_and_paginates(notion_service, monkeypatch):
+    """Test that fingerprints are resolved with chunked `or` filters following `start_cursor`."""
+    monkeypatch.setattr("app.services.notion.FINGERPRINT_LOOKUP_CHUNK_SIZE", 2)
+
+    def page(fingerprint):
+        properties = {"AMFingerprint": {"rich_text": [{"plain_text": fingerprint}]}}
+        return {"id": f"page-{fingerprint}", "properties": properties}
+
+    notion_service.client.databases.query.side_effect = [
+        {"results": [page("a")], "has_more": True, "next_cursor": "cursor-1"},
+        {"results": [page("b")], "has_more": False, "next_cursor": None},
+        {"results": [], "has_more": False, "next_cursor": None},
+    ]
+    pages = notion_service.find_incident_pages_by_fingerprints(["a", "b", "a", "c"])
+    assert pages == {"a": "page-a", "b": "page-b"}
+    calls = [call.kwargs for call in notion_service.client.databases.query.call_args_list]
+    assert calls[0]["filter"] == {
+        "or": [
+            {"property": "AMFingerprint", "rich_text": {"equals": "a"}},
+            {"property": "AMFingerprint", "rich_text": {"equals": "b"}},
+        ],
+    }
+    assert "start_cursor" not in calls[0]
+    assert calls[1]["start_cursor"] == "cursor-1"
+    assert calls[2]["filter"] == {"property": "AMFingerprint", "rich_text": {"equals": "c"}}
+
+
+def test_handle_alerts_lookup_failure_reports_all_alerts(notion_service):
+    """Test that a failed bulk lookup is reported for every alert."""
+    with patch.object(notion_service, "find_incident_pages_by_fingerprints", side_effect=Exception("down")):
+        report = notion_service.handle_alerts([make_alert("a"), make_alert("b")])
+    assert [result.fingerprint for result in report.failed] == ["a", "b"]
+
+
+@pytest.fixture
+def indexed_notion_service(notion_service):
+    """Fixture for NotionService with fingerprint index."""
+    notion_service.index = FingerprintIndex(namespace="dbid")
+    return notion_service
+
+
+def test_find_incident_pages_uses_index(indexed_notion_service):
+    """Test that indexed fingerprints are not queried and found pages are indexed."""
+    indexed_notion_service.index.set("a", "page-a")
+    indexed_notion_service.client.databases.query.return_value = {
+        "results": [{"id": "page-b", "properties": {"AMFingerprint": {"rich_text": [{"plain_text": "b"}]}}}],
+    }
+    assert indexed_notion_service.find_incident_pages_by_fingerprints(["a", "b"]) == {"a": "page-a", "b": "page-b"}
+    indexed_notion_service.client.databases.query.assert_called_once()
+    assert indexed_notion_service.client.databases.query.call_args.kwargs["filter"]["rich_text"] == {"equals": "b"}
+    assert indexed_notion_service.find_incident_page_by_fingerprint("b") == "page-b"
+    indexed_notion_service.client.databases.query.assert_called_once()
+
+
+def test_create_incident_page_writes_index(indexed_notion_service):
+    """Test that a created page is written to the index."""
+    indexed_notion_service.client.pages.create.return_value = {"id": "page-new"}
+    indexed_notion_service.create_incident_page_from_alert(make_alert("a"))
+    assert indexed_notion_service.index.get("a") == "page-new"
+
+
+@pytest.mark.parametrize(
+    ("error", "retryable"),
+    [
+        (APIResponseError(MagicMock(status_code=429), "Rate limited", APIErrorCode.RateLimited), True),
+        (APIResponseError(MagicMock(status_code=502), "Bad gateway", APIErrorCode.InternalServerError), True),
+        (httpx.ConnectTimeout("timeout"), True),
+        (APIResponseError(MagicMock(status_code=400), "Invalid", APIErrorCode.ValidationError), False),
+        (ValueError("bug"), False),
+    ],
+)
+def test_is_retryable_error(error, retryable):
+    """Test that rate limit, server and transport errors are retryable, other errors are not."""
+    assert is_retryable_error(error) is retryable
+
+
+def test_failed_alert_reports_whether_it_is_retryable(notion_service):
+    """Test that the report tells alerts failed with retryable errors from the others."""
+    notion_service.client.databases.query.side_effect = httpx.ReadTimeout("timeout")
+    report = notion_service.handle_alerts([make_alert("a")])
+    assert [result.fingerprint for result in report.retryable] == ["a"]
+
+    notion_service.client.databases.query.side_effect = None
+    notion_service.client.databases.query.return_value = {"results": []}
+    notion_service.client.pages.create.side_effect = APIResponseError(
+        MagicMock(status_code=400),
+        "Invalid",
+        APIErrorCode.ValidationError,
+    )
+    report = notion_service.handle_alerts([make_alert("a")])
+    assert len(report.failed) == 1 and not report.retryable
+
+
+def test_stale_index_entry_is_invalidated(indexed_notion_service):
+    """Test that an archived page is dropped from the index and the alert creates a new page."""
+    indexed_notion_service.index.set("a", "page-archived")
+    error = APIResponseError(
+        MagicMock(status_code=400),
+        "Can't edit block that is archived.",
+        APIErrorCode.ValidationError,
+    )
+    with (
+        patch.object(indexed_notion_service, "update_incident_status", side_effect=error),
+        patch.object(indexed_notion_service, "create_incident_page_from_alert", return_value="page-new"),
+    ):
+        indexed_notion_service.client.databases.query.return_value = {"results": []}
+        report = indexed_notion_service.handle_alerts([make_alert("a")])
+    assert [(result.action, result.error) for result in report.results] == [("created", None)]
+    assert indexed_notion_service.index.local.get("page:dbid:a") is None
+
+
+def test_get_shift_uses_shift_cache(notion_service_with_shifts):
+    """Test that shifts database is queried once when shift cache is set."""
+    notion_service_with_shifts.shift_cache = ShiftCache()
+    notion_service_with_shifts.client.databases.query.return_value = {
+        "results": [{"id": "shift-1", "properties": {"On-Duty": {"people": [{"id": "person-1"}]}}}],
+    }
+    assert notion_service_with_shifts._get_shift() == ("shift-1", [{"id": "person-1"}])
+    assert notion_service_with_shifts._get_shift() == ("shift-1", [{"id": "person-1"}])
+    notion_service_with_shifts.client.databases.query.assert_called_once()
+    notion_service_with_shifts.client.databases.query.side_effect = httpx.HTTPError("http error")
+    notion_service_with_shifts.shift_cache = ShiftCache()
+    assert notion_service_with_shifts._get_shift() == (None, [])
+
+
+def test_update_incident_status_skips_noop_updates(notion_service):
+    """Test that repeat notifications don't update the page with the same status."""
+    notion_service.status_tracker = FingerprintIndex(namespace="dbid", kind="status", metrics_prefix="status_tracker")
+    notion_service.client.pages.create.return_value = {"id": "page-1"}
+    with patch.object(notion_service, "_get_shift", return_value=(None, [])):
+        notion_service.create_incident_page_from_alert(make_alert("a"))
+    notion_service.update_incident_status("page-1", make_alert("a"))
+    notion_service.client.pages.update.assert_not_called()
+
+    resolved = make_alert("a", "resolved")
+    notion_service.update_incident_status("page-1", resolved)
+    notion_service.update_incident_status("page-1", resolved)
+    notion_service.client.pages.update.assert_called_once()
+    notion_service.update_incident_status("page-2", resolved)
+    assert notion_service.client.pages.update.call_count == 2
+    assert metrics.get("notion_writes_suppressed") == 2
+
+
+def test_handle_alert_stream_in_batches(notion_service, monkeypatch):
+    """Test that streamed alerts are processed in batches and invalid alerts are reported as failed."""
+    monkeypatch.setattr("app.services.notion.FINGERPRINT_LOOKUP_CHUNK_SIZE", 2)
+    alerts = [make_alert(fingerprint).model_dump() for fingerprint in "abc"]
+    alerts.insert(1, {"fingerprint": "invalid", "status": "firing"})
+    batches = []
+
+    def handle_alerts(batch):
+        batches.append([alert.fingerprint for alert in batch])
+        return EventReport(results=[AlertResult(fingerprint=alert.fingerprint, status="firing") for alert in batch])
+
+    with patch.object(notion_service, "handle_alerts", side_effect=handle_alerts):
+        report = notion_service.handle_alert_stream(iter(alerts))
+    assert batches == [["a", "b"], ["c"]]
+    assert [result.fingerprint for result in report.failed] == ["invalid"]
+    assert len(report.results) == 4
@@ -0,0 +1,220 @@
+import functools
+import time
+from datetime import datetime, timedelta
+from unittest.mock import ANY, patch
+
+import pytest
+import pytz
+from notion_client import Client
+from python_settings import settings
+
+from app import lifecycle, metrics
+from app.event_handlers import notion as notion_handlers
+from app.services import notion as notion_service
+from app.services.notion import NotionService, get_page_fingerprint, query_pages
+from app.services.open_incidents import OpenIncidents
+from tests.fixtures.common import make_alert
+
+
+@pytest.fixture
+def client(fake_notion):
+    """Notion client of the fake Notion API."""
+    client = Client(auth="token", base_url=fake_notion.base_url)
+    yield client
+    client.close()
+
+
+def open_incidents(client: Client, **kwargs) -> OpenIncidents:
+    """Create map of open incidents of the fake database."""
+    return OpenIncidents(functools.partial(query_pages, client, "dbid"), get_page_fingerprint, **kwargs)
+
+
+def test_load_keeps_newest_open_incidents(fake_notion, client):
+    """Test that only open incidents are loaded and the least recently edited ones are left out of a full map."""
+    fake_notion.add_page("resolved", "Resolved")
+    pages = [fake_notion.add_page(f"open-{i}", "Firing") for i in range(5)]
+    fake_notion.add_page("", "Firing")
+    metrics.reset()
+
+    incidents = open_incidents(client, max_size=3)
+    assert incidents.get("open-4") is None
+    assert metrics.get("open_incidents_stale_lookups") == 1
+    incidents.load()
+
+    assert incidents.size == 3
+    assert incidents.get("open-4") == (pages[4]["id"], "Firing", pages[4]["last_edited_time"])
+    assert incidents.get("open-0") is None and incidents.get("resolved") is None
+    assert metrics.get_gauge("open_incidents_entries") == 3
+    assert metrics.get_gauge("open_incidents_bytes") > 0
+    assert metrics.get_gauge("open_incidents_staleness_seconds") < 1
+
+    # A new incident evicts the least recently edited one.
+    incidents.record("new", "page-new", "Firing")
+    assert incidents.get("open-2") is None and incidents.get("open-3") is not None
+    assert metrics.get("open_incidents_evictions") == 1
+
+
+def test_refresh_pulls_edited_pages(fake_notion, client):
+    """Test that a refresh pulls edited pages only, resolved incidents are removed."""
+    fake_notion.add_page("old", "Resolved")["last_edited_time"] = "2025-01-01T00:00:00+00:00"
+    fake_notion.add_page("firing", "Firing")
+    incidents = open_incidents(client)
+    incidents.load()
+    fake_notion.pages_by_fingerprint["firing"]["properties"]["AMStatus"]["select"]["name"] = "Resolved"
+    new = fake_notion.add_page("new", "Firing")
+    metrics.reset()
+
+    incidents.refresh()
+
+    assert incidents.get("firing") is None
+    assert incidents.get("new").page_id == new["id"]
+    assert metrics.get("open_incidents_pulled") == 2
+    assert fake_notion.calls["databases.query"] == 2
+
+
+def test_refresh_ignores_pages_older_than_worker_writes(fake_notion, client):
+    """Test that pages edited before the worker wrote or resolved their incidents don't overwrite the map."""
+    firing = fake_notion.add_page("firing", "Firing")
+    resolved = fake_notion.add_page("resolved", "Firing")
+    incidents = open_incidents(client)
+    incidents.load()
+    # The pull sees pages as they were before the worker's writes.
+    before = (datetime.now(tz=pytz.utc) - timedelta(seconds=10)).isoformat()
+    firing["properties"]["AMStatus"]["select"]["name"] = "Resolved"
+    firing["last_edited_time"] = resolved["last_edited_time"] = before
+    incidents.record("firing", firing["id"], "Acknowledged")
+    incidents.record("resolved", resolved["id"], "Resolved")
+    metrics.reset()
+
+    incidents.refresh()
+
+    assert incidents.get("firing").status == "Acknowledged"
+    assert incidents.get("resolved") is None
+    assert metrics.get("open_incidents_outdated_pages") == 2
+
+    # Pages edited after the worker's writes are applied.
+    fake_notion.update(resolved["id"], {})
+    incidents.refresh()
+    assert incidents.get("resolved").status == "Firing"
+
+
+def test_load_keeps_incidents_written_during_scan(fake_notion, client):
+    """Test that a load doesn't drop incidents the worker wrote while the scan was running."""
+    old = fake_notion.add_page("old", "Firing")
+    fake_notion.add_page("resolved", "Firing")
+
+    def query(*args):
+        incidents.record("new", "page-new", "Firing")
+        incidents.record("old", old["id"], "Acknowledged")
+        incidents.record("resolved", "page-resolved", "Resolved")
+        yield from query_pages(client, "dbid", *args)
+
+    incidents = OpenIncidents(query, get_page_fingerprint)
+    incidents.load()
+
+    assert incidents.get("new") == ("page-new", "Firing", ANY)
+    assert incidents.get("old").status == "Acknowledged"
+    assert incidents.get("resolved") is None
+    assert incidents.size == 2
+
+
+def test_stale_map_is_not_used(fake_notion, client):
+    """Test that a map not refreshed for `max_staleness` seconds is bypassed."""
+    fake_notion.add_page("firing", "Firing")
+    incidents = open_incidents(client, max_staleness=0.05)
+    incidents.load()
+    assert incidents.get("firing") is not None
+    time.sleep(0.1)
+    assert incidents.get("firing") is None
+    assert metrics.get_gauge("open_incidents_staleness_seconds") > 0.05
+    assert "# TYPE am2n_open_incidents_staleness_seconds gauge" in metrics.openmetrics()
+
+
+def test_background_refresh_and_errors(fake_notion, client):
+    """Test that the refresh thread loads the map and counts failed refreshes."""
+    fake_notion.add_page("firing", "Firing")
+    incidents = open_incidents(client, refresh_interval=0.05).start()
+    deadline = time.monotonic() + 5
+    while incidents.get("firing") is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert incidents.get("firing") is not None
+
+    fake_notion.throttle_rate = 1
+    with patch("app.services.open_incidents.logger"):
+        deadline = time.monotonic() + 5
+        while not metrics.get("open_incidents_refresh_errors") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        incidents.stop()
+    assert metrics.get("open_incidents_refresh_errors") >= 1
+
+
+def test_service_answers_open_incidents_from_memory(fake_notion, client):
+    """Test that lookups and no-op updates of open incidents don't call Notion."""
+    page = fake_notion.add_page("firing", "Firing")
+    incidents = open_incidents(client)
+    incidents.load()
+    with patch.object(notion_service, "Client", functools.partial(Client, base_url=fake_notion.base_url)):
+        service = NotionService(
+            token="token",
+            incidents_db_id="dbid",
+            shifts_db_id="",
+            shifts_enabled=False,
+            open_incidents=incidents,
+        )
+    fake_notion.calls.clear()
+
+    report = service.handle_alerts([make_alert("firing")])
+    assert [result.action for result in report.results] == ["updated"]
+    assert sum(fake_notion.calls.values()) == 0
+
+    service.handle_alerts([make_alert("firing", "resolved")])
+    assert fake_notion.calls == {"pages.update": 1}
+    assert incidents.get("firing") is None
+
+    service.handle_alerts([make_alert("firing")])
+    assert fake_notion.calls == {"pages.update": 2, "databases.query": 1}
+    assert incidents.get("firing").page_id == page["id"]
+    service.client.close()
+
+
+def test_worker_preloads_open_incidents(fake_notion):
+    """Test that services of the worker share the preloaded map of their database."""
+    fake_notion.add_page("firing", "Firing")
+    lifecycle.close_all()
+    try:
+        with (
+            patch.object(settings, "AM2N_OPEN_INCIDENTS_PRELOAD_ENABLED", True),
+            patch.object(notion_handlers, "Client", functools.partial(Client, base_url=fake_notion.base_url)),
+        ):
+            params = {"token": "token", "incidents_db_id": "dbid", "shifts_db_id": "", "shifts_enabled": False}
+            service = notion_handlers.get_notion_service(**params, max_concurrency=1)
+            other = notion_handlers.get_notion_service(**params, max_concurrency=2)
+        assert service is not other and service.open_incidents is other.open_incidents
+        deadline = time.monotonic() + 5
+        while service.open_incidents.get("firing") is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert service.open_incidents.get("firing") is not None
+    finally:
+        lifecycle.close_all()
+
+
+def test_preload_has_own_rate_limit(fake_notion):
+    """Test that the preload scan doesn't take requests from the token's bucket shared with events."""
+    for i in range(3):
+        fake_notion.add_page(f"open-{i}", "Firing")
+    lifecycle.close_all()
+    try:
+        with (
+            patch.object(settings, "AM2N_OPEN_INCIDENTS_PRELOAD_ENABLED", True),
+            patch.object(settings, "AM2N_OPEN_INCIDENTS_RATE_LIMIT", 1000),
+            patch.object(notion_handlers, "Client", functools.partial(Client, base_url=fake_notion.base_url)),
+        ):
+            incidents = notion_handlers.create_open_incidents("token", "dbid")
+            deadline = time.monotonic() + 5
+            while incidents.get("open-0") is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+        assert incidents.size == 3
+        assert "token" not in notion_handlers.rate_limiters.get()
+        incidents.stop()
+    finally:
+        lifecycle.close_all()
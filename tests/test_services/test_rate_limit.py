@@ -0,0 +1,145 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from unittest.mock import patch
+
+import httpx
+import pytest
+from notion_client import Client
+
+from app import metrics
+from app.services.rate_limit import (
+    AsyncRateLimitedTransport,
+    RateLimitedTransport,
+    TokenBucket,
+    notion_endpoint,
+    parse_retry_after,
+)
+
+
+def notion_client(server, **kwargs):
+    """Notion client sending requests to the fake server through the rate limited transport."""
+    transport = RateLimitedTransport(TokenBucket(rate=1000), backoff_base=0.01, **kwargs)
+    return Client(
+        auth="token",
+        base_url=server.base_url,
+        client=httpx.Client(transport=transport),
+    )
+
+
+def test_retries_throttled_and_failed_responses(fake_notion):
+    """Test that 429 and 5xx responses are retried until success."""
+    fake_notion.statuses = [429, 503]
+    resp = notion_client(fake_notion).databases.query(database_id="db")
+    assert resp["results"] == []
+    assert sum(fake_notion.calls.values()) == 3
+    assert metrics.get("notion_retries") == 2
+
+
+def test_page_create_is_retried_only_if_not_processed(fake_notion):
+    """Test that a create answered with 500 or 504 isn't retried, as it may have created the page."""
+    fake_notion.statuses = [503, 504]
+    with pytest.raises(Exception):
+        notion_client(fake_notion).pages.create(parent={"database_id": "db"}, properties={})
+    assert sum(fake_notion.calls.values()) == 2
+
+    fake_notion.statuses = [504]
+    resp = notion_client(fake_notion).databases.query(database_id="db")
+    assert resp["results"] == []
+    assert sum(fake_notion.calls.values()) == 4
+
+
+def test_gives_up_after_max_retries(fake_notion):
+    """Test that the last failed response is returned when retries are exhausted."""
+    fake_notion.statuses = [500, 500, 500]
+    with pytest.raises(Exception):
+        notion_client(fake_notion, max_retries=1).databases.query(database_id="db")
+    assert sum(fake_notion.calls.values()) == 2
+
+
+def test_token_bucket_limits_rate():
+    """Test that tokens above burst capacity have to be waited for."""
+    bucket = TokenBucket(rate=2, capacity=2)
+    with patch("app.services.rate_limit.time.monotonic", return_value=100):
+        bucket._updated = 100
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 0.5
+        bucket.cancel()
+        bucket.pause(3)
+        assert bucket.reserve() == 3.5
+
+
+def test_deadline_stops_waiting_for_tokens():
+    """Test that a call fails right away if the rate limiter wait exceeds the deadline."""
+    bucket = TokenBucket(rate=1, capacity=1)
+    bucket.pause(60)
+    transport = RateLimitedTransport(bucket, deadline=1, transport=httpx.MockTransport(lambda r: httpx.Response(200)))
+    with pytest.raises(httpx.PoolTimeout):
+        httpx.Client(transport=transport).get("http://notion.test/")
+
+
+def test_deadline_stops_retries():
+    """Test that a retry that would exceed the deadline is not made."""
+    transport = RateLimitedTransport(
+        TokenBucket(rate=1000),
+        deadline=1,
+        transport=httpx.MockTransport(lambda r: httpx.Response(429, headers={"Retry-After": "120"})),
+    )
+    assert httpx.Client(transport=transport).get("http://notion.test/").status_code == 429
+    assert metrics.get("notion_retries") == 0
+
+
+def test_parse_retry_after():
+    """Test parsing Retry-After given in seconds and as HTTP date."""
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("2") == 2
+    assert parse_retry_after("nonsense") is None
+    in_a_minute = format_datetime(datetime.now(tz=timezone.utc) + timedelta(seconds=60), usegmt=True)
+    assert 50 < parse_retry_after(in_a_minute) <= 60
+
+
+def test_async_transport_retries():
+    """Test that async transport retries throttled responses."""
+    responses = [httpx.Response(429, headers={"Retry-After": "0"}), httpx.Response(200)]
+    transport = AsyncRateLimitedTransport(
+        TokenBucket(rate=1000),
+        backoff_base=0.01,
+        transport=httpx.MockTransport(lambda request: responses.pop(0)),
+    )
+
+    async def call():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await client.get("http://notion.test/")
+
+    assert asyncio.run(call()).status_code == 200
+    assert metrics.get("notion_retries") == 1
+
+
+def test_requests_are_counted_by_endpoint_and_status(fake_notion):
+    """Test that every attempt is counted by endpoint and status and its latency is recorded."""
+    fake_notion.statuses = [429]
+    notion_client(fake_notion).databases.query(database_id="db")
+    assert metrics.get("notion_requests", endpoint="databases.query", status=429) == 1
+    assert metrics.get("notion_requests", endpoint="databases.query", status=200) == 1
+    assert metrics.histogram("notion_request_seconds", endpoint="databases.query")[0] == 2
+
+
+def test_notion_endpoint():
+    """Test endpoint labels of Notion API requests."""
+    assert notion_endpoint(httpx.Request("POST", "https://api.notion.com/v1/pages")) == "pages.create"
+    assert notion_endpoint(httpx.Request("PATCH", "https://api.notion.com/v1/pages/abc")) == "pages.update"
+    assert notion_endpoint(httpx.Request("GET", "https://api.notion.com/v1/pages/abc")) == "pages.retrieve"
+    assert notion_endpoint(httpx.Request("GET", "https://api.notion.com/v1/users")) == "other"
+
+
+def test_transport_errors_are_counted():
+    """Test that requests failed without response are counted with `error` status."""
+
+    def fail(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    transport = RateLimitedTransport(TokenBucket(rate=1000), transport=httpx.MockTransport(fail))
+    with pytest.raises(httpx.ConnectError), httpx.Client(transport=transport) as client:
+        client.patch("http://notion.test/v1/pages/abc")
+    assert metrics.get("notion_requests", endpoint="pages.update", status="error") == 1
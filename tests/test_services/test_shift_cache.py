@@ -0,0 +1,74 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import httpx
+import pytest
+from notion_client import APIErrorCode, APIResponseError
+
+from app import metrics
+from app.services.shift_cache import ShiftCache
+
+SHIFT = ("shift-1", [{"id": "person-1"}])
+
+
+def test_shift_is_cached_per_date():
+    """Test that shift is loaded once per date and shift type."""
+    cache = ShiftCache()
+    load = MagicMock(return_value=SHIFT)
+    assert cache.get_or_load("2025-06-08", "Daily", load) == SHIFT
+    assert cache.get_or_load("2025-06-08", "Daily", load) == SHIFT
+    assert load.call_count == 1
+    cache.get_or_load("2025-06-09", "Daily", load)
+    assert load.call_count == 2
+    assert metrics.get("shift_cache_hits") == 1
+    assert metrics.get("shift_cache_misses") == 2
+
+
+def test_shift_expires_after_ttl():
+    """Test that shift is loaded again after TTL."""
+    cache = ShiftCache(ttl=10)
+    load = MagicMock(return_value=SHIFT)
+    with patch("app.services.shift_cache.time.monotonic", return_value=100):
+        cache.get_or_load("2025-06-08", "Daily", load)
+    with patch("app.services.shift_cache.time.monotonic", return_value=111):
+        cache.get_or_load("2025-06-08", "Daily", load)
+    assert load.call_count == 2
+
+
+def test_concurrent_lookups_are_deduplicated():
+    """Test that concurrent misses run a single lookup."""
+    cache = ShiftCache()
+
+    def load():
+        time.sleep(0.05)
+        return SHIFT
+
+    mock_load = MagicMock(side_effect=load)
+    threads = [threading.Thread(target=cache.get_or_load, args=("2025-06-08", "Daily", mock_load)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    mock_load.assert_called_once_with()
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        httpx.HTTPError("down"),
+        APIResponseError(MagicMock(status_code=503), "Unavailable", APIErrorCode.ServiceUnavailable),
+    ],
+)
+def test_http_error_falls_back_to_last_known_shift(error):
+    """Test that last known shift is used when lookup fails."""
+    cache = ShiftCache()
+    cache.get_or_load("2025-06-08", "Daily", lambda: SHIFT)
+    failing = MagicMock(side_effect=error)
+    assert cache.get_or_load("2025-06-09", "Daily", failing) == SHIFT
+    assert metrics.get("shift_cache_fallbacks") == 1
+    with pytest.raises(type(error)):
+        cache.get_or_load("2025-06-09", "Weekly", failing)
+    cache.clear()
+    with pytest.raises(type(error)):
+        cache.get_or_load("2025-06-09", "Daily", failing)
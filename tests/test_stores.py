@@ -0,0 +1,147 @@
+from unittest.mock import patch
+
+import pytest
+
+from app.stores import (
+    REDIS_DELETE_IF_EQUAL,
+    MemoryStore,
+    RedisStore,
+    SQLiteStore,
+    create_store,
+)
+
+
+class FakeRedis:
+    """Local stand-in for Redis client."""
+
+    def __init__(self):
+        """Init empty store."""
+        self.data = {}
+
+    def get(self, name):
+        """Return value as bytes like Redis does."""
+        return self.data.get(name)
+
+    def set(self, name, value, ex=None, nx=False):  # noqa: A003
+        """Set value, expiration is ignored."""
+        if nx and name in self.data:
+            return None
+        self.data[name] = value.encode("utf-8")
+        return True
+
+    def delete(self, *names):
+        """Delete keys."""
+        for name in names:
+            self.data.pop(name, None)
+
+    def eval(self, script, numkeys, *keys_and_args):  # noqa: A003
+        """Run compare-and-delete script of RedisStore."""
+        assert script == REDIS_DELETE_IF_EQUAL and numkeys == 1
+        name, value = keys_and_args
+        if self.data.get(name) != value.encode("utf-8"):
+            return 0
+        del self.data[name]
+        return 1
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def store(request, tmp_path):
+    """Store fixture for every backend."""
+    if request.param == "memory":
+        return MemoryStore()
+    if request.param == "sqlite":
+        return SQLiteStore(str(tmp_path / "store.sqlite3"))
+    return RedisStore(FakeRedis())
+
+
+def test_store_get_set_delete(store):
+    """Test basic operations of every store."""
+    assert store.get("key") is None
+    store.set("key", "value")
+    assert store.get("key") == "value"
+    store.set("key", "other", ttl=60)
+    assert store.get("key") == "other"
+    store.delete("key")
+    assert store.get("key") is None
+    store.delete("key")
+
+
+def test_store_add(store):
+    """Test that a key is added only if it's missing."""
+    assert store.add("key", "first", ttl=60)
+    assert not store.add("key", "second", ttl=60)
+    assert store.get("key") == "first"
+    store.delete("key")
+    assert store.add("key", "third")
+    assert store.get("key") == "third"
+
+
+def test_store_delete_if_equal(store):
+    """Test that a key is deleted only if it still has the value."""
+    assert not store.delete_if_equal("key", "first")
+    store.set("key", "second", ttl=60)
+    assert not store.delete_if_equal("key", "first")
+    assert store.get("key") == "second"
+    assert store.delete_if_equal("key", "second")
+    assert store.get("key") is None
+
+
+@pytest.mark.parametrize("store_class", [MemoryStore, SQLiteStore])
+def test_store_delete_if_equal_skips_expired_key(store_class, tmp_path):
+    """Test that an expired key is not reported as deleted."""
+    store = store_class() if store_class is MemoryStore else store_class(str(tmp_path / "store.sqlite3"))
+    with patch("app.stores.time") as mock_time:
+        mock_time.monotonic.return_value = mock_time.time.return_value = 100
+        store.set("key", "value", ttl=10)
+        mock_time.monotonic.return_value = mock_time.time.return_value = 110
+        assert not store.delete_if_equal("key", "value")
+
+
+@pytest.mark.parametrize("store_class", [MemoryStore, SQLiteStore])
+def test_store_add_replaces_expired_key(store_class, tmp_path):
+    """Test that an expired key can be added again."""
+    store = store_class() if store_class is MemoryStore else store_class(str(tmp_path / "store.sqlite3"))
+    with patch("app.stores.time") as mock_time:
+        mock_time.monotonic.return_value = mock_time.time.return_value = 100
+        assert store.add("key", "first", ttl=10)
+        mock_time.monotonic.return_value = mock_time.time.return_value = 110
+        assert store.add("key", "second")
+    assert store.get("key") == "second"
+
+
+def test_memory_store_ttl_and_lru():
+    """Test that expired and least recently used keys are evicted."""
+    store = MemoryStore(max_size=2, ttl=10)
+    with patch("app.stores.time.monotonic", return_value=100):
+        store.set("a", "1")
+        store.set("b", "2")
+        assert store.get("a") == "1"
+        store.set("c", "3")
+    assert len(store) == 2
+    with patch("app.stores.time.monotonic", return_value=105):
+        assert store.get("b") is None
+        assert store.get("a") == "1"
+    with patch("app.stores.time.monotonic", return_value=111):
+        assert store.get("c") is None
+
+
+def test_sqlite_store_ttl_is_shared(tmp_path):
+    """Test that values are visible to another connection and expire."""
+    path = str(tmp_path / "store.sqlite3")
+    first, second = SQLiteStore(path), SQLiteStore(path)
+    with patch("app.stores.time.time", return_value=100):
+        first.set("key", "value", ttl=10)
+        assert second.get("key") == "value"
+    with patch("app.stores.time.time", return_value=111):
+        assert second.get("key") is None
+    first.close()
+    second.close()
+
+
+def test_create_store(tmp_path):
+    """Test creating stores by backend name."""
+    assert create_store("memory") is None
+    assert isinstance(create_store("sqlite", str(tmp_path / "store.sqlite3")), SQLiteStore)
+    with patch.object(RedisStore, "from_url", return_value="redis-store") as mock_from_url:
+        assert create_store("redis", "redis://localhost") == "redis-store"
+    mock_from_url.assert_called_once_with("redis://localhost")
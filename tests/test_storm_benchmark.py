@@ -0,0 +1,38 @@
+from unittest.mock import patch
+
+import pytest
+from benchmarks.storm import Scenario, percentile, run_scenario
+from python_settings import settings
+
+
+@pytest.fixture
+def throttling_notion(fake_notion):
+    """Fake Notion API with 10 pages throttling some of the calls."""
+    for i in range(10):
+        fake_notion.add_page(f"existing-{i:08x}", "Resolved")
+    fake_notion.throttle_rate = 0.1
+    return fake_notion
+
+
+def test_scenario_runs_end_to_end(throttling_notion):
+    """Test that notifications go through the receiver and the worker to the fake Notion API."""
+    scenario = Scenario("test", groups=2, alerts=3, repeats=2, resolve=True)
+    with patch.object(settings, "AM2N_NOTION_RATE_LIMIT", 1000), patch.object(settings, "AM2N_DEDUP_ENABLED", True):
+        result = run_scenario(scenario, throttling_notion)
+
+    assert result.alerts == 18
+    assert len(result.receiver) == len(result.notification) == 6
+    # Repeat notifications are dropped by the receiver, firing and resolved ones reach the worker.
+    assert len(result.worker) == 4
+    assert result.calls["pages.create"] == 6
+    assert result.calls["pages.update"] == 6
+    assert len(throttling_notion.pages) == 16
+    statuses = {page["properties"]["AMStatus"]["select"]["name"] for page in throttling_notion.pages.values()}
+    assert statuses == {"Resolved"}
+
+
+def test_percentile():
+    """Test nearest-rank percentiles."""
+    assert percentile([], 99) == 0
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile(list(range(1, 101)), 99) == 99
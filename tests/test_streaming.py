@@ -0,0 +1,83 @@
+import io
+import json
+import tracemalloc
+
+import pytest
+
+from app.streaming import StreamingEventParser, StreamingParseError, stream_events
+
+
+class GeneratedStream:
+    """Stream of an Alertmanager event with many alerts generated while it's read."""
+
+    def __init__(self, alerts):
+        """Init stream of an event with the number of alerts."""
+        self.parts = self._parts(alerts)
+        self.pending = b""
+
+    @staticmethod
+    def _parts(alerts):
+        yield b'{"receiver": "r", "status": "firing", "alerts": ['
+        for i in range(alerts):
+            alert = {"status": "firing", "fingerprint": f"{i:016x}", "annotations": {"description": "x" * 200}}
+            yield (b"," if i else b"") + json.dumps(alert).encode()
+        yield b'], "groupKey": "key", "truncatedAlerts": 0}'
+
+    def read(self, size=-1):
+        """Read up to `size` bytes, generating more parts of the event as needed."""
+        while len(self.pending) < size and (part := next(self.parts, None)) is not None:
+            self.pending += part
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 65536])
+def test_parser_yields_alerts_and_group(alert_payload, chunk_size):
+    """Test that alerts and group fields are parsed regardless of how the stream is chunked."""
+    alert_payload["alerts"] *= 3
+    alert_payload["alerts"][1] = {**alert_payload["alerts"][1], "annotations": {"summary": "Использование памяти…"}}
+    parser = StreamingEventParser(io.BytesIO(json.dumps(alert_payload, ensure_ascii=False).encode()), chunk_size)
+    assert list(parser.alerts()) == alert_payload["alerts"]
+    assert parser.group == {key: value for key, value in alert_payload.items() if key != "alerts"}
+
+
+@pytest.mark.parametrize(
+    "data",
+    [b"", b'{"alerts": [1', b'["alerts"]', b'{"alerts": [1 2]}', b'{"a": 1} {"b": 2}', b"{1: 2}"],
+)
+def test_parser_rejects_invalid_json(data):
+    """Test that malformed documents raise `StreamingParseError`."""
+    with pytest.raises(StreamingParseError):
+        list(StreamingEventParser(io.BytesIO(data)).alerts())
+
+
+def test_stream_events_splits_alerts_under_budget():
+    """Test that alerts are grouped into events under the byte budget with group defaults."""
+    events = list(stream_events(StreamingEventParser(GeneratedStream(100)), max_bytes=2000))
+    assert len(events) > 1
+    assert all(len(json.dumps(event["alerts"])) <= 2000 for event in events)
+    assert sum(len(event["alerts"]) for event in events) == 100
+    assert events[0]["receiver"] == "r"
+    assert events[0]["groupKey"] == ""
+    assert events[-1]["commonLabels"] == {}
+
+
+def test_stream_events_without_alerts():
+    """Test that an event without alerts is yielded once."""
+    assert [
+        event["alerts"] for event in stream_events(StreamingEventParser(io.BytesIO(json.dumps({}).encode())), 100)
+    ] == [[]]
+
+
+def test_parser_memory_is_flat():
+    """Test that peak memory of parsing doesn't grow with the number of alerts."""
+
+    def peak(alerts):
+        tracemalloc.start()
+        for _ in StreamingEventParser(GeneratedStream(alerts)).alerts():
+            pass
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak_bytes
+
+    assert peak(20000) < peak(1000) * 2
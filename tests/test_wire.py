@@ -0,0 +1,47 @@
+import pytest
+
+from app import wire
+from app.schemas import Alert, AlertAnnotations, AlertLabels, AlertmanagerEvent
+
+
+def test_json_round_trip(alert_payload):
+    """Test that JSON format keeps the payload as is."""
+    data, attributes = wire.encode(alert_payload)
+    assert attributes == {"am2n_wire": "json/1"}
+    assert wire.decode(data, attributes) == alert_payload
+
+
+def test_compact_keeps_only_used_fields(alert_payload):
+    """Test that the compact format is smaller and decodes to the same alerts."""
+    alert_payload["alerts"][0]["labels"]["container"] = "worker"
+    data, attributes = wire.encode(alert_payload, "compact")
+    assert attributes == {"am2n_wire": "compact/1"}
+    assert len(data) < len(wire.encode(alert_payload)[0])
+    event = AlertmanagerEvent.model_validate(wire.decode(data, attributes))
+    assert event.alerts == AlertmanagerEvent.model_validate(alert_payload).alerts
+    assert event.groupKey == alert_payload["groupKey"]
+    assert event.commonLabels == {}
+
+
+@pytest.mark.parametrize("payload", [{"alerts": "invalid"}, ["not", "a", "dict"], {"receiver": "r"}])
+def test_compact_keeps_invalid_payloads(payload):
+    """Test that payloads which are not Alertmanager events are kept as is, so the worker logs them."""
+    assert wire.decode(*wire.encode(payload, "compact")) == payload
+
+
+@pytest.mark.parametrize("attributes", [None, {}, {"am2n_wire": "unknown/9"}])
+def test_decode_falls_back_to_json(alert_payload, attributes):
+    """Test that messages without known wire format are parsed as JSON."""
+    assert wire.decode(wire.encode(alert_payload)[0], attributes) == alert_payload
+
+
+def test_compact_fields_cover_models():
+    """Test that the compact format keeps every field of the models used by the worker."""
+    assert set(Alert.model_fields) == {*wire.COMPACT_ALERT_FIELDS, "labels", "annotations"}
+    assert set(AlertLabels.model_fields) == set(wire.COMPACT_LABEL_FIELDS)
+    assert set(AlertAnnotations.model_fields) == set(wire.COMPACT_ANNOTATION_FIELDS)
+    assert set(AlertmanagerEvent.model_fields) == {
+        *wire.COMPACT_EVENT_FIELDS,
+        *wire.COMPACT_DROPPED_EVENT_FIELDS,
+        "alerts",
+    }